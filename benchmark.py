@@ -0,0 +1,676 @@
+#!/usr/bin/env python
+
+"""Benchmarks for the ECE50863 Lab Project 1 controller.
+
+Usage: python benchmark.py routes [--sizes 100,200,400] [--events 20] [--degree 4] [--tree-cache 0] [--seed 1]
+
+       python benchmark.py wire [--entries 10000] [--repeat 20]
+       python benchmark.py timers [--sizes 1000,10000,50000] [--failures 100]
+       python benchmark.py coalesce [--sizes 100,400] [--rack 20] [--windows 0,0.05]
+       python benchmark.py graph [--links 100000,1000000] [--degree 8]
+       python benchmark.py backends [--sizes 100,200,400] [--degrees 4,32]
+       python benchmark.py pool [--sizes 500,1000,2000] [--workers 2,4,8]
+       python benchmark.py dataplane [--sizes 16,64,256] [--packets 20000] [--window 64]
+       python benchmark.py chunks [--dests 10000] [--repeat 50] [--chunk-sizes 1472,8972,65507]
+       python benchmark.py ingest [--sizes 1000,10000] [--rates 5000,10000,20000,40000] [--batch 256]
+       python benchmark.py ecmp [--configs Config/graph_6.txt] [--sizes 64,256] [--max-cost 1] [--flows 8]
+
+routes: replays random topology events (switch dead/alive, link dead/alive)
+        against the full and the incremental route engine and reports the
+        per-event latency of each, checking that both produce the same rows.
+        --tree-cache gives the incremental engine a TreeCache of that many
+        route entries.
+wire:   encodes and decodes large ROUTE_UPDATE and TOPOLOGY_UPDATE messages in
+        the text and binary wire formats and reports size and time per message.
+timers: simulates heartbeats and failures in virtual time and compares the
+        K second scan against the deadline scheduler: CPU per tick and how
+        long after TIMEOUT a failure is detected.
+coalesce: a rack of switches dies and registers again back to back at a
+        controller without and with a coalescing window. Reports the
+        topology events, the recomputations they took and the events
+        absorbed (Controller.coalesce_stats()), the messages sent and the
+        wall time until the last recomputation.
+graph:  writes large random Config files and compares parsing them with
+        readlines() into {u: {v: dist}} against streaming them into a
+        graph.Graph: parse time, memory held afterwards and peak memory.
+backends: full all-pairs recompute with one heapq Dijkstra per source
+        against the NumPy matrix backend, checking that both agree, and
+        which one BACKEND = "auto" would pick.
+pool:   full heapq recompute in-process against a SourcePool of forked
+        workers, checking that the results are the same: the trees
+        RouteEngine keeps (SourcePool.run()) and the route rows of
+        compute_routes(), for which the workers only send back tables.
+dataplane: compiles the routes of a random topology into one ForwardingTable
+        and loopback UDP socket per switch and pushes data packets between
+        random switches through them: lookup cost per packet without
+        sockets, then hops per second and per-hop and end-to-end latency
+        with window packets in flight.
+chunks: pushes ROUTE_UPDATEs of dests entries, text and binary, through a
+        Chunker and a Reassembler over a loopback socket pair, one message
+        at a time, and reports datagrams per message and throughput,
+        checking that every table arrives intact.
+ingest: runs a threads runtime controller in a child process, with every
+        switch of a random topology already registered, and sends it
+        TOPOLOGY_UPDATEs from all switches round robin at each rate for
+        seconds, once per datagram and once with --batch. Reports the
+        rate offered, the share the controller handled and the highest
+        rate it sustained with under 0.5% dropped.
+ecmp:   walks flows flows between every ordered pair of switches through the
+        compiled ForwardingTables, once with single next hops and once with
+        the equal-cost groups, and compares how evenly the directed links
+        are loaded. Random topologies use link costs up to max-cost; with
+        unit costs every tie is between paths of the same hop count. Ties
+        between paths of different hop counts, like 0-3 and 0-1-2-3 in
+        graph_6.txt, get no group, so the mean load stays that of single.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import selectors
+import socket
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import controller
+from chunking import Chunker, Reassembler
+from dataplane import MAGIC as DATA_MAGIC, FLOWS, PACKET, TTL, ForwardingTable, combined_stats
+from graph import Graph
+from metrics import query
+from protocol import Message, decode, encode, REGISTER_REQUEST, ROUTE_UPDATE, TOPOLOGY_UPDATE
+import routing
+from routing import RouteEngine, compute_routes, dijkstra, equal_cost_groups, source_pool, use_matrix
+from timers import DeadlineScheduler
+
+K = 2
+TIMEOUT = 3 * K
+
+
+def random_links(n, degree, seed, max_cost=100):
+    """Yield (u, v, dist) lines of a connected random topology."""
+    rng = random.Random(seed)
+    for i in range(1, n):   # Random spanning tree keeps the graph connected
+        yield i, rng.randrange(i), rng.randint(1, max_cost)
+    extra = max(0, n * degree // 2 - (n - 1))
+    for _ in range(extra):
+        u, v = rng.sample(range(n), 2)
+        yield u, v, rng.randint(1, max_cost)
+
+
+def random_topology(n, degree, seed, max_cost=100):
+    """Return a connected random topology as a Graph."""
+    return Graph(n, random_links(n, degree, seed, max_cost))
+
+
+def random_events(graph, n, count, seed):
+    """Yield (alive_switches, dead_links) states after each random event."""
+    rng = random.Random(seed)
+    links = [(u, v) for u, v, _ in graph.links()]
+    alive = set(range(n))
+    dead = set()
+    for _ in range(count):
+        op = rng.random()
+        if op < 0.25:
+            alive.discard(rng.randrange(n))
+        elif op < 0.5:
+            alive.add(rng.choice(sorted(set(range(n)) - alive) or [0]))
+        elif op < 0.75:
+            dead.add(rng.choice(links))
+        elif dead:
+            dead.discard(rng.choice(sorted(dead)))
+        yield set(alive), {lk for lk in dead if lk[0] in alive and lk[1] in alive}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_routes(args):
+    print(f"{'switches':>8} {'links':>7} {'full p50 ms':>12} {'incr p50 ms':>12} "
+          f"{'full p99 ms':>12} {'incr p99 ms':>12} {'rerun/event':>12} {'repair/event':>12} {'cache hits':>11}")
+    for n in args.sizes:
+        graph = random_topology(n, args.degree, args.seed)
+        engine = RouteEngine(graph, cache_entries=args.tree_cache)
+        engine.compute(set(range(n)), set())
+        full_ms, incr_ms, trees, repairs = [], [], [], []
+        for alive, dead in random_events(graph, n, args.events, args.seed):
+            t0 = time.perf_counter()
+            expected = compute_routes(graph, alive, dead)
+            t1 = time.perf_counter()
+            got = engine.compute(alive, dead)
+            t2 = time.perf_counter()
+            if got != expected:
+                raise SystemExit(f"incremental engine diverged from full recompute at n={n}")
+            full_ms.append((t1 - t0) * 1000)
+            incr_ms.append((t2 - t1) * 1000)
+            trees.append(len(engine.last_recomputed))
+            repairs.append(len(engine.last_repaired))
+        print(f"{n:>8} {graph.m:>7} {percentile(full_ms, 50):>12.2f} {percentile(incr_ms, 50):>12.2f} "
+              f"{percentile(full_ms, 99):>12.2f} {percentile(incr_ms, 99):>12.2f} "
+              f"{statistics.mean(trees):>12.1f} {statistics.mean(repairs):>12.1f} "
+              f"{format(engine.cache.stats()['hit_rate'], '.1%') if engine.cache else '-':>11}")
+
+
+def bench_wire(args):
+    rng = random.Random(args.seed)
+    n = args.entries
+    messages = {
+        ROUTE_UPDATE: Message(ROUTE_UPDATE, 0, 7, [(d, rng.randrange(n), rng.randint(1, 9999)) for d in range(n)]),
+        TOPOLOGY_UPDATE: Message(TOPOLOGY_UPDATE, 0, entries=[(d, rng.random() < 0.9) for d in range(n)]),
+    }
+    print(f"{'message':>16} {'format':>7} {'bytes':>9} {'encode ms':>10} {'decode ms':>10}")
+    for kind, msg in messages.items():
+        for binary in (False, True):
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                data = encode(msg, binary)
+            t1 = time.perf_counter()
+            for _ in range(args.repeat):
+                decoded = decode(data)
+            t2 = time.perf_counter()
+            if [tuple(e) for e in decoded.entries] != [tuple(e) for e in msg.entries]:
+                raise SystemExit(f"{kind} did not survive a round trip")
+            print(f"{kind:>16} {'binary' if binary else 'text':>7} {len(data):>9} "
+                  f"{(t1 - t0) * 1000 / args.repeat:>10.3f} {(t2 - t1) * 1000 / args.repeat:>10.3f}")
+
+
+def bench_timers(args):
+    print(f"{'keys':>8} {'detector':>9} {'us/tick':>10} {'detect avg s':>13} {'detect max s':>13}")
+    for n in args.sizes:
+        rng = random.Random(args.seed)
+        failed_at = {sid: rng.uniform(0, 10 * K) for sid in rng.sample(range(n), args.failures)}
+        phase = [rng.uniform(0, K) for _ in range(n)]
+
+        def last_heartbeat(sid, now):
+            """Time of the last heartbeat sid sent at or before now."""
+            t = min(now, failed_at.get(sid, now))
+            return t - (t - phase[sid]) % K if t >= phase[sid] else 0.0
+
+        # Scan: every K seconds compare now - last_heard against TIMEOUT for every key
+        detected, cpu, ticks = {}, 0.0, 0
+        now = 0.0
+        while len(detected) < len(failed_at):
+            now += K
+            t0 = time.perf_counter()
+            for sid in range(n):
+                if sid not in detected and now - last_heartbeat(sid, now) > TIMEOUT:
+                    detected[sid] = now
+            cpu += time.perf_counter() - t0
+            ticks += 1
+        late = [detected[sid] - (last_heartbeat(sid, t) + TIMEOUT) for sid, t in failed_at.items()]
+        print(f"{n:>8} {'scan':>9} {cpu / ticks * 1e6:>10.1f} {statistics.mean(late):>13.3f} {max(late):>13.3f}")
+
+        # Deadline scheduler: heartbeats refresh deadlines, wake up at the earliest one
+        timers = DeadlineScheduler()
+        for sid in range(n):
+            timers.schedule(sid, TIMEOUT)   # Registered at time 0
+        horizon = max(failed_at.values())
+        events = sorted((phase[sid] + k * K, sid) for sid in range(n) for k in range(int(horizon / K) + 1)
+                        if phase[sid] + k * K <= failed_at.get(sid, horizon))
+        cpu, ticks, i = 0.0, 0, 0
+        pending = set(failed_at)
+        while pending:
+            deadline = timers.next_deadline()
+            if i < len(events) and (deadline is None or events[i][0] <= deadline):
+                t, sid = events[i]
+                i += 1
+                timers.schedule(sid, t + TIMEOUT)
+                continue
+            t0 = time.perf_counter()
+            pending.difference_update(timers.pop_expired(deadline))
+            cpu += time.perf_counter() - t0
+            ticks += 1
+        stats = timers.stats()
+        print(f"{n:>8} {'deadline':>9} {cpu / ticks * 1e6:>10.1f} "
+              f"{stats['detection_latency_avg']:>13.3f} {stats['detection_latency_max']:>13.3f}")
+
+
+def float_list(text):
+    return [float(x) for x in text.split(",")]
+
+
+def bench_coalesce(args):
+    print(f"{'switches':>8} {'rack':>5} {'window s':>9} {'events':>7} {'recomputes':>11} {'absorbed':>9} "
+          f"{'sent':>7} {'wall ms':>8}")
+    controller.LOG_FILE = os.devnull
+    for n in args.sizes:
+        graph = random_topology(n, args.degree, args.seed)
+        rack = random.Random(args.seed).sample(range(n), min(args.rack, n))
+        for window in args.windows:
+            ctrl = controller.Controller(graph, n, lambda data, addr: None, coalesce=window)
+            for sid in range(n):
+                ctrl.handle(Message(REGISTER_REQUEST, sid), ('127.0.0.1', 10000 + sid))
+            sent = ctrl.traffic.stats()["sent_messages"]
+            t0 = time.perf_counter()
+            # The rack times out at one wakeup, as fire_deadlines() would report it...
+            for sid in rack:
+                ctrl.switch_dead(sid)
+            ctrl.topology_changed(len(rack))
+            # ...and its switches send their Register_Requests back to back once they are up
+            for sid in rack:
+                ctrl.handle(Message(REGISTER_REQUEST, sid), ('127.0.0.1', 10000 + sid))
+            while ctrl.recompute_at is not None:
+                time.sleep(max(0.0, ctrl.recompute_at - time.time()))
+                ctrl.flush_routes()
+            wall = time.perf_counter() - t0
+            stats = ctrl.coalesce_stats()
+            print(f"{n:>8} {len(rack):>5} {window:>9.3f} {stats['topology_events']:>7} {stats['recomputes']:>11} "
+                  f"{stats['events_absorbed']:>9} {ctrl.traffic.stats()['sent_messages'] - sent:>7} "
+                  f"{wall * 1000:>8.1f}")
+
+
+def read_config_dicts(config):
+    """The original readlines() parser, kept as the baseline for bench_graph."""
+    with open(config, 'r') as f:
+        lines = [l.strip() for l in f.readlines() if l.strip()]
+        switch_cnt = int(lines[0])
+        topology = {i: {} for i in range(switch_cnt)}
+        for line in lines[1:]:
+            parts = line.split()
+            if len(parts) < 3: continue
+            u, v, dist = int(parts[0]), int(parts[1]), int(parts[2])
+            topology[u][v] = dist
+            topology[v][u] = dist
+    return switch_cnt, topology
+
+
+def bench_graph(args):
+    print(f"{'links':>9} {'switches':>9} {'parser':>7} {'parse s':>8} {'held MB':>8} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for links in args.links:
+            n = max(2, 2 * links // args.degree)
+            path = os.path.join(tmp, f"graph_{links}.txt")
+            with open(path, 'w') as f:
+                f.write(f"{n}\n")
+                f.writelines(f"{u} {v} {w}\n" for u, v, w in random_links(n, args.degree, args.seed))
+            for name, parse in (("dict", read_config_dicts), ("csr", Graph.from_config)):
+                t0 = time.perf_counter()
+                parse(path)
+                elapsed = time.perf_counter() - t0
+                tracemalloc.start()
+                result = parse(path)
+                held, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                del result
+                print(f"{links:>9} {n:>9} {name:>7} {elapsed:>8.2f} {held / 2**20:>8.1f} {peak / 2**20:>8.1f}")
+
+
+def bench_backends(args):
+    if routing.np is None:
+        raise SystemExit("the matrix backend needs NumPy")
+    print(f"{'switches':>8} {'links':>7} {'heapq ms':>10} {'matrix ms':>10} {'auto picks':>11}")
+    for n in args.sizes:
+        for degree in args.degrees:
+            graph = random_topology(n, degree, args.seed)
+            graph.apply_state(set(range(n)), set())
+            sources = list(range(n))
+            t0 = time.perf_counter()
+            expected = {src: dijkstra(graph, src) for src in sources}
+            t1 = time.perf_counter()
+            got = routing.matrix_shortest_paths(graph, sources)
+            t2 = time.perf_counter()
+            if got != expected:
+                raise SystemExit(f"matrix backend diverged from Dijkstra at n={n} degree={degree}")
+            pick = "matrix" if use_matrix(graph, n) else "heapq"
+            print(f"{n:>8} {graph.m:>7} {(t1 - t0) * 1000:>10.1f} {(t2 - t1) * 1000:>10.1f} {pick:>11}")
+
+
+def bench_pool(args):
+    print(f"{'switches':>8} {'links':>7} {'workers':>8} {'trees ms':>9} {'speedup':>8} {'routes ms':>10} {'speedup':>8}")
+    backend, routing.BACKEND = routing.BACKEND, "heapq"     # The in-process baseline is one Dijkstra per source
+    for n in args.sizes:
+        graph = random_topology(n, args.degree, args.seed)
+        alive = set(range(n))
+        graph.apply_state(alive, set())
+        sources = list(range(n))
+        t0 = time.perf_counter()
+        expected = {src: dijkstra(graph, src) for src in sources}
+        t1 = time.perf_counter()
+        expected_routes = compute_routes(graph, alive, set())
+        t2 = time.perf_counter()
+        serial, serial_routes = t1 - t0, t2 - t1
+        print(f"{n:>8} {graph.m:>7} {1:>8} {serial * 1000:>9.1f} {1.0:>8.2f} {serial_routes * 1000:>10.1f} {1.0:>8.2f}")
+        for workers in args.workers:
+            pool = source_pool(graph, workers)
+            if pool is None:
+                raise SystemExit("a process pool needs the fork start method")
+            t0 = time.perf_counter()
+            got = pool.run(sources)
+            t1 = time.perf_counter()
+            got_routes = compute_routes(graph, alive, set(), pool)
+            t2 = time.perf_counter()
+            pool.close()
+            if got != expected or got_routes != expected_routes:
+                raise SystemExit(f"pool diverged from in-process Dijkstra at n={n} workers={workers}")
+            print(f"{n:>8} {graph.m:>7} {workers:>8} {(t1 - t0) * 1000:>9.1f} {serial / (t1 - t0):>8.2f} "
+                  f"{(t2 - t1) * 1000:>10.1f} {serial_routes / (t2 - t1):>8.2f}")
+    routing.BACKEND = backend
+
+
+def int_list(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+def bench_dataplane(args):
+    print(f"{'switches':>8} {'lookup ns':>10} {'packets':>8} {'delivered':>10} {'hops/s':>10} "
+          f"{'hops/pkt':>9} {'hop ms':>8} {'e2e ms':>8} {'e2e max ms':>11}")
+    for n in args.sizes:
+        graph = random_topology(n, args.degree, args.seed)
+        _, tables = compute_routes(graph, set(range(n)), set())
+        socks = []
+        for _ in range(n):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.setblocking(False)
+            socks.append(sock)
+        addrs = [sock.getsockname() for sock in socks]
+        fts = []
+        for sid in range(n):
+            ft = ForwardingTable(sid, seed=args.seed)
+            ft.compile({dest: nh for dest, nh, _ in tables[sid]}, {nid: addrs[nid] for nid in graph.neighbor_ids(sid)})
+            fts.append(ft)
+        rng = random.Random(args.seed)
+        buf = bytearray(PACKET.size)
+        packet = memoryview(buf)
+
+        # Lookup and in-place rewrite only: sendto does nothing
+        probe = ForwardingTable(0)
+        probe.compile({dest: nh for dest, nh, _ in tables[0]}, {nid: addrs[nid] for nid in graph.neighbor_ids(0)})
+        PACKET.pack_into(buf, 0, DATA_MAGIC, TTL, 0, 1, rng.randrange(1, n), 0, 0, 0.0)
+        noop = lambda data, addr: None
+        t0 = time.perf_counter()
+        for _ in range(args.packets):
+            buf[1] = TTL
+            buf[2] = 0
+            probe.forward(packet, noop)
+        lookup_ns = (time.perf_counter() - t0) / args.packets * 1e9
+
+        sel = selectors.DefaultSelector()
+        for sid, sock in enumerate(socks):
+            sel.register(sock, selectors.EVENT_READ, sid)
+        sent = 0
+        t0 = time.perf_counter()
+        while True:
+            done = sum(ft.delivered + ft.no_route + ft.expired for ft in fts)
+            while sent < args.packets and sent - done < args.window:
+                src, dest = rng.sample(range(n), 2)
+                fts[src].originate(dest, socks[src].sendto, rng.randrange(FLOWS))
+                sent += 1
+            if sent == args.packets and done >= sent:
+                break
+            events = sel.select(timeout=0.5)
+            if not events:
+                break   # Whatever is still in flight was lost
+            for key, _ in events:
+                sock, ft = socks[key.data], fts[key.data]
+                while True:
+                    try:
+                        sock.recv_into(buf)
+                    except BlockingIOError:
+                        break
+                    ft.forward(packet, sock.sendto)
+        elapsed = time.perf_counter() - t0
+        sel.close()
+        for sock in socks:
+            sock.close()
+        stats = combined_stats(fts)
+        hops = stats["originated"] + stats["forwarded"]
+        print(f"{n:>8} {lookup_ns:>10.0f} {sent:>8} {stats['delivered']:>10} {hops / elapsed:>10.0f} "
+              f"{stats['hops_avg']:>9.2f} {stats['hop_latency_avg_ms']:>8.3f} {stats['latency_avg_ms']:>8.3f} "
+              f"{stats['latency_max_ms']:>11.3f}")
+
+
+def bench_chunks(args):
+    rng = random.Random(args.seed)
+    table = [(dest, rng.randrange(args.dests), rng.randint(1, 9999)) for dest in range(args.dests)]
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    rx.bind(('127.0.0.1', 0))
+    rx.settimeout(1.0)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = rx.getsockname()
+    print(f"{'format':>6} {'chunk':>6} {'msg bytes':>10} {'datagrams':>10} {'msgs/s':>8} {'MB/s':>8} {'ms/msg':>7} {'lost':>5}")
+    for binary in (False, True):
+        data = encode(Message(ROUTE_UPDATE, 0, 0, table), binary)
+        for size in args.chunk_sizes:
+            chunker = Chunker(size)
+            reassembler = Reassembler()
+            datagrams = len(chunker.datagrams(data))
+            lost = 0
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                for datagram in chunker.datagrams(data):
+                    tx.sendto(datagram, addr)
+                whole = None
+                while whole is None:
+                    try:
+                        datagram, sender = rx.recvfrom(65535)
+                    except socket.timeout:
+                        lost += 1
+                        break
+                    whole = reassembler.add(datagram, sender)
+                if whole is not None and decode(whole).entries != table:
+                    raise SystemExit(f"table arrived corrupted with chunk size {size}")
+            elapsed = time.perf_counter() - t0 - lost * rx.gettimeout()
+            done = args.repeat - lost
+            print(f"{'binary' if binary else 'text':>6} {size:>6} {len(data):>10} {datagrams:>10} "
+                  f"{done / elapsed:>8.0f} {done * len(data) / elapsed / 2**20:>8.1f} "
+                  f"{elapsed / max(done, 1) * 1000:>7.2f} {lost:>5}")
+    rx.close()
+    tx.close()
+
+
+def serve_registered(graph, port, stats_port, batch):
+    """Child process: a threads runtime controller that every switch of graph registered with."""
+    controller.TIMEOUT = 3600       # Only the receive path is measured, no switch may time out
+    controller.LOG_FILE = os.devnull
+    ctrl = controller.Controller(graph, graph.n, None)
+    now = time.time()
+    for sid in range(graph.n):
+        ctrl.alive_switches.add(sid)
+        ctrl.neighbor_reports[sid] = {nid: True for nid in graph.neighbor_ids(sid)}
+        ctrl.last_heard[sid] = now
+    ctrl.registered = True
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', port))
+    ctrl.sendto = sock.sendto
+    controller.run_threads(ctrl, sock, stats_port, batch)
+
+
+def topology_updates_handled(stats_port):
+    received = query(stats_port)["traffic"]["received"]
+    return received.get("TOPOLOGY_UPDATE", {}).get("messages", 0)
+
+
+def send_at_rate(sock, addr, datagrams, rate, seconds):
+    """Send datagrams round robin at rate per second. Returns (sent, elapsed)."""
+    sent = 0
+    t0 = time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - t0
+        if elapsed >= seconds:
+            return sent, elapsed
+        due = int(elapsed * rate)
+        if sent >= due:
+            time.sleep(0.0005)
+        while sent < due:
+            sock.sendto(datagrams[sent % len(datagrams)], addr)
+            sent += 1
+
+
+def bench_ingest(args):
+    print(f"{'switches':>8} {'batch':>6} {'rate':>7} {'offered/s':>10} {'handled/s':>10} {'dropped':>8}")
+    ctx = multiprocessing.get_context("fork")
+    for n in args.sizes:
+        graph = random_topology(n, args.degree, args.seed)
+        datagrams = [encode(Message(TOPOLOGY_UPDATE, sid, entries=[(nid, True) for nid in graph.neighbor_ids(sid)]))
+                     for sid in range(n)]
+        for batch in (1, args.batch):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            stats_port = port + 1 if port < 65535 else port - 1
+            child = ctx.Process(target=serve_registered, args=(graph, port, stats_port, batch), daemon=True)
+            child.start()
+            for _ in range(50):
+                try:
+                    handled = topology_updates_handled(stats_port)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            else:
+                child.terminate()
+                raise SystemExit("the controller did not come up")
+            sustained = 0
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for rate in args.rates:
+                    sent, elapsed = send_at_rate(sock, ('127.0.0.1', port), datagrams, rate, args.seconds)
+                    time.sleep(0.5)     # Let the controller work through its socket buffer
+                    before, handled = handled, topology_updates_handled(stats_port)
+                    dropped = 1 - (handled - before) / sent if sent else 0.0
+                    if dropped < 0.005:
+                        sustained = max(sustained, sent / elapsed)
+                    print(f"{n:>8} {batch:>6} {rate:>7} {sent / elapsed:>10.0f} {(handled - before) / elapsed:>10.0f} "
+                          f"{dropped:>8.1%}")
+            child.terminate()
+            child.join()
+            print(f"{n:>8} {batch:>6} sustained {sustained:.0f} TOPOLOGY_UPDATEs/s")
+
+
+def link_loads(graph, fts, flows):
+    """Walk flows flows between every ordered pair through fts. Returns {(u, v): flows}."""
+    loads = {}
+    for src in range(graph.n):
+        for dest in range(graph.n):
+            for flow in range(flows):
+                cur = src
+                while cur != dest:
+                    nxt = fts[cur].lookup(src, dest, flow)
+                    if nxt is None:
+                        break
+                    loads[(cur, nxt)] = loads.get((cur, nxt), 0) + 1
+                    cur = nxt
+    return loads
+
+
+def bench_ecmp(args):
+    topologies = [(path, Graph.from_config(path)) for path in args.configs]
+    topologies += [(f"random {n}", random_topology(n, args.degree, args.seed, args.max_cost)) for n in args.sizes]
+    print(f"{'topology':>18} {'links':>6} {'groups':>7} {'mode':>7} {'used':>5} {'max':>6} {'mean':>7} {'cv':>6}")
+    for name, graph in topologies:
+        n = graph.n
+        _, tables = compute_routes(graph, set(range(n)), set())
+        for mode in ("single", "ecmp"):
+            fts = []
+            group_cnt = 0
+            for sid in range(n):
+                groups = dict(equal_cost_groups(graph, sid, tables, set())) if mode == "ecmp" else None
+                group_cnt += len(groups or ())
+                ft = ForwardingTable(sid)
+                ft.compile({dest: nh for dest, nh, _ in tables[sid]}, {nid: nid for nid in graph.neighbor_ids(sid)},
+                           groups)
+                fts.append(ft)
+            loads = link_loads(graph, fts, args.flows)
+            # Every directed link counts, idle ones with 0
+            values = [loads.get((u, v), 0) for u, v, _ in graph.links()] + \
+                     [loads.get((v, u), 0) for u, v, _ in graph.links()]
+            mean = statistics.mean(values)
+            cv = statistics.pstdev(values) / mean if mean else 0.0
+            print(f"{name[-18:]:>18} {graph.m:>6} {group_cnt:>7} {mode:>7} {len(loads):>5} {max(values):>6} "
+                  f"{mean:>7.1f} {cv:>6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controller benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("routes", help="per-event latency of the route engines")
+    p.add_argument("--sizes", type=int_list, default=[100, 200, 400])
+    p.add_argument("--events", type=int, default=20)
+    p.add_argument("--degree", type=int, default=4)
+    p.add_argument("--tree-cache", type=int, default=0)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_routes)
+
+    p = sub.add_parser("wire", help="text vs binary encode/decode cost")
+    p.add_argument("--entries", type=int, default=10000)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_wire)
+
+    p = sub.add_parser("timers", help="failure detection cost and latency, scan vs deadline")
+    p.add_argument("--sizes", type=int_list, default=[1000, 10000, 50000])
+    p.add_argument("--failures", type=int, default=100)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_timers)
+
+    p = sub.add_parser("coalesce", help="recomputations for a rack restart, without and with a coalescing window")
+    p.add_argument("--sizes", type=int_list, default=[100, 400])
+    p.add_argument("--rack", type=int, default=20)
+    p.add_argument("--windows", type=float_list, default=[0.0, 0.05])
+    p.add_argument("--degree", type=int, default=4)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_coalesce)
+
+    p = sub.add_parser("graph", help="config parse time and memory, dicts vs CSR")
+    p.add_argument("--links", type=int_list, default=[100000, 1000000])
+    p.add_argument("--degree", type=int, default=8)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_graph)
+
+    p = sub.add_parser("backends", help="full recompute, heapq Dijkstra vs NumPy matrix")
+    p.add_argument("--sizes", type=int_list, default=[100, 200, 400])
+    p.add_argument("--degrees", type=int_list, default=[4, 32])
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_backends)
+
+    p = sub.add_parser("pool", help="full recompute, in-process vs forked worker pool")
+    p.add_argument("--sizes", type=int_list, default=[500, 1000, 2000])
+    p.add_argument("--workers", type=int_list, default=[2, 4, 8])
+    p.add_argument("--degree", type=int, default=4)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser("dataplane", help="forwarding lookup cost, packets per second and hop latency")
+    p.add_argument("--sizes", type=int_list, default=[16, 64, 256])
+    p.add_argument("--packets", type=int, default=20000)
+    p.add_argument("--window", type=int, default=64)
+    p.add_argument("--degree", type=int, default=4)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_dataplane)
+
+    p = sub.add_parser("chunks", help="chunked transport throughput for large ROUTE_UPDATEs over loopback")
+    p.add_argument("--dests", type=int, default=10000)
+    p.add_argument("--repeat", type=int, default=50)
+    p.add_argument("--chunk-sizes", type=int_list, default=[1472, 8972, 65507])
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_chunks)
+
+    p = sub.add_parser("ingest", help="TOPOLOGY_UPDATEs per second a controller handles, per datagram vs batched")
+    p.add_argument("--sizes", type=int_list, default=[1000, 10000])
+    p.add_argument("--rates", type=int_list, default=[5000, 10000, 20000, 40000])
+    p.add_argument("--batch", type=int, default=256)
+    p.add_argument("--seconds", type=float, default=2.0)
+    p.add_argument("--degree", type=int, default=4)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("ecmp", help="link load spread, single next hops vs equal-cost groups")
+    p.add_argument("--configs", nargs='*', default=["Config/graph_6.txt"])
+    p.add_argument("--sizes", type=int_list, default=[64, 256])
+    p.add_argument("--degree", type=int, default=4)
+    p.add_argument("--max-cost", type=int, default=1)
+    p.add_argument("--flows", type=int, default=8)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_ecmp)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""Chunked transport for messages larger than one datagram.
+
+A UDP datagram carries at most MAX_DATAGRAM bytes, so the ROUTE_UPDATE or
+REGISTER_RESPONSE of a switch in a graph of a few thousand switches cannot
+be sent whole. Chunker.datagrams() leaves anything that fits alone and
+splits the rest into chunks of at most size bytes, header included:
+
+    magic (1 byte, 0xC7) | message id (4) | chunk index (2) | chunk count (2) | payload
+
+The magic byte is none of a text message's, a binary message's (0xB5) or a
+data packet's (0xD5), so a receiver tells chunks apart by the first byte.
+Every message gets the next message id of its sender, so chunks of two
+messages in flight never mix.
+
+Reassembler.add() collects chunks per (sender address, message id) and
+returns the whole message once the last one arrives. Partial messages are
+dropped after timeout seconds, and the oldest ones are evicted as soon as
+more than max_bytes or max_messages are buffered, so lost chunks and a
+flood of bogus ones cost bounded memory. A message with a lost chunk is
+lost like any other datagram: a missed ROUTE_DELTA is recovered by
+ROUTE_RESYNC, everything else by the next periodic message.
+
+Chunks are as large as allowed, so a message takes as few datagrams as
+possible. On loopback the default never gets IP fragmented; where the path
+MTU is smaller, --chunk-size <bytes> keeps each chunk under it so a lost
+fragment costs one chunk rather than a 64 KB datagram.
+"""
+
+import struct
+import time
+from collections import OrderedDict
+
+MAGIC = 0xC7
+HEADER = struct.Struct("!BIHH")         # magic, message id, chunk index, chunk count
+MAX_DATAGRAM = 65507                    # Largest UDP payload over IPv4
+CHUNK_SIZE = MAX_DATAGRAM               # Largest chunk sent, header included
+REASSEMBLY_TIMEOUT = 2.0                # Seconds a partial message waits for its missing chunks
+REASSEMBLY_BYTES = 32 << 20             # Bytes of partial messages buffered at most
+REASSEMBLY_MESSAGES = 1024              # Partial messages buffered at most
+
+
+def is_chunk(data):
+    """True if data is one chunk of a larger message."""
+    return len(data) > HEADER.size and data[0] == MAGIC
+
+
+class Chunker:
+    """Splits outgoing messages that do not fit in one datagram."""
+
+    def __init__(self, size=CHUNK_SIZE):
+        if not HEADER.size < size <= MAX_DATAGRAM:
+            raise ValueError(f"chunk size must be between {HEADER.size + 1} and {MAX_DATAGRAM}")
+        self.size = size
+        self.next_id = 0
+        # Stats
+        self.messages_split = 0
+        self.chunks_sent = 0
+
+    def datagrams(self, data):
+        """Return the datagrams to send data in: [data] itself if it fits."""
+        if len(data) <= self.size:
+            return [data]
+        payload = self.size - HEADER.size
+        count = -(-len(data) // payload)
+        if count > 0xFFFF:
+            raise ValueError(f"message of {len(data)} bytes needs more than 65535 chunks")
+        msg_id = self.next_id
+        self.next_id = (msg_id + 1) & 0xFFFFFFFF
+        view = memoryview(data)
+        chunks = [HEADER.pack(MAGIC, msg_id, i, count) + view[i * payload:(i + 1) * payload]
+                  for i in range(count)]
+        self.messages_split += 1
+        self.chunks_sent += count
+        return chunks
+
+    def stats(self):
+        return {
+            "chunk_size": self.size,
+            "messages_split": self.messages_split,
+            "chunks_sent": self.chunks_sent,
+        }
+
+
+class Reassembler:
+    """Bounded buffers of partial chunked messages, per sender and message id."""
+
+    def __init__(self, timeout=REASSEMBLY_TIMEOUT, max_bytes=REASSEMBLY_BYTES, max_messages=REASSEMBLY_MESSAGES):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.partial = OrderedDict()    # (addr, message id) -> [first chunk time, count, {index: payload}, bytes]
+        self.buffered = 0
+        # Stats
+        self.chunks_received = 0
+        self.reassembled = 0
+        self.duplicates = 0
+        self.expired = 0
+        self.evicted = 0
+        self.buffered_peak = 0
+
+    def add(self, data, addr, now=None):
+        """Take one received datagram.
+
+        Returns data itself if it is not a chunk, the whole message if data
+        was its last missing chunk, and None otherwise.
+        """
+        if not is_chunk(data):
+            return data
+        now = time.time() if now is None else now
+        self.expire(now)
+        _, msg_id, index, count = HEADER.unpack_from(data)
+        if index >= count:
+            return None
+        self.chunks_received += 1
+        key = (addr, msg_id)
+        entry = self.partial.get(key)
+        if entry is None:
+            entry = self.partial[key] = [now, count, {}, 0]
+        parts = entry[2]
+        if index in parts or count != entry[1]:
+            self.duplicates += 1
+            return None
+        payload = bytes(data[HEADER.size:])
+        parts[index] = payload
+        entry[3] += len(payload)
+        self.buffered += len(payload)
+        if len(parts) == count:
+            del self.partial[key]
+            self.buffered -= entry[3]
+            self.reassembled += 1
+            return b"".join(parts[i] for i in range(count))
+        self.buffered_peak = max(self.buffered_peak, self.buffered)
+        while self.partial and (self.buffered > self.max_bytes or len(self.partial) > self.max_messages):
+            self._drop_oldest()
+            self.evicted += 1
+        return None
+
+    def expire(self, now):
+        """Drop the partial messages whose first chunk is older than timeout."""
+        while self.partial:
+            first = next(iter(self.partial.values()))[0]
+            if now - first <= self.timeout:
+                break
+            self._drop_oldest()
+            self.expired += 1
+
+    def _drop_oldest(self):
+        _, entry = self.partial.popitem(last=False)
+        self.buffered -= entry[3]
+
+    def stats(self):
+        return {
+            "chunks_received": self.chunks_received,
+            "reassembled": self.reassembled,
+            "partial": len(self.partial),
+            "duplicates": self.duplicates,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "buffered_bytes": self.buffered,
+            "buffered_peak_bytes": self.buffered_peak,
+        }
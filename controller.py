@@ -6,17 +6,39 @@ Email: du201@purdue.edu
 Last Modified Date: December 9th, 2021
 """
 
+import atexit
+import json
+import os
 import sys
 import socket
-import heapq
+import asyncio
 import threading
 import time
+from contextlib import contextmanager
 from datetime import date, datetime
 
+from chunking import CHUNK_SIZE, Chunker, Reassembler
+from logwriter import LogWriter, install_exit_handler, install_stats_dump
+from protocol import (Message, decode, encode, REGISTER_REQUEST, REGISTER_RESPONSE,
+                      TOPOLOGY_UPDATE, ROUTE_UPDATE, ROUTE_DELTA, ROUTE_RESYNC, HEARTBEAT,
+                      SHARD_SUMMARY, ROUTE_ECMP, TrafficStats)
+from graph import Graph
+from linkcost import LinkCosts
+from metrics import Sampler, TimedLock, Timing, serve_stats
+from netem import NetEm, parse_spec
+from sendqueue import BULK, CONTROL, SendQueue
+from shard import Shard, parse_peers
+from snapshot import read_snapshot, write_snapshot
+from routing import RouteEngine, compute_routes as compute_routes_full, equal_cost_groups, link_key, source_pool
+from timers import DeadlineScheduler, DetectionStats, TickStats
+
 # Please do not modify the name of the log file, otherwise you will lose points because the grader won't be able to find your log file
 LOG_FILE = "Controller.log"
 K = 2
 TIMEOUT = 3 * K
+HEARTBEAT_TIMEOUT = 3 * 5 * K   # Timeout of --heartbeat switches, which may stay silent 5 * K seconds
+ROUTE_ENGINE = "incremental"  # "incremental" reuses shortest-path trees between events, "full" recomputes everything
+LOG_WRITER = None   # Set to a logwriter.LogWriter by --log buffered
 
 # Those are logging functions to help you follow the correct logging standard
 
@@ -108,119 +130,788 @@ def topology_update_switch_alive(switch_id):
     write_to_log(log) 
 
 def write_to_log(log):
+    if LOG_WRITER is not None:
+        LOG_WRITER.write(LOG_FILE, "\n\n" + "".join(log))
+        return
     with open(LOG_FILE, 'a+') as log_file:
         log_file.write("\n\n")
         # Write to log
         log_file.writelines(log)
 
-def main():
-    #Check for number of arguments and exit if host/port not provided
-    num_args = len(sys.argv)
-    if num_args < 3:
-        print ("Usage: python controller.py <port> <config file>\n")
-        sys.exit(1)
-    
-    # Write your code below or elsewhere in this file
+def read_config(config):
+    """Read a Config/graph_*.txt file. Returns (switch_cnt, graph)."""
+    graph = Graph.from_config(config)
+    return graph.n, graph
 
-    # Parameters
-    port = int(sys.argv[1])
-    config = sys.argv[2]
 
-    # Variables
-    switch_cnt = 0
-    switch_addresses = {}
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(('', port))
-    sock.settimeout(1.0)
-    topology = {}
-    alive_switches = set() 
-    last_heard = {} 
-    neighbor_reports = {}
-    dead_links = set()          
-    lock = threading.Lock()
+class Controller:
+    """Controller state and message handling, independent of how it is driven.
+
+    The runtime feeds every decoded datagram to handle() and, once
+    registration is complete, calls wakeup() every K seconds with check set
+    and in between whenever next_deadline() is due. Outgoing
+    datagrams go through sendto(data, addr), which is a socket's or an
+    asyncio transport's sendto.
+    """
+
+    def __init__(self, graph, switch_cnt, sendto, detect="scan", coalesce=0.0, workers=1, tree_cache=0):
+        self.graph = graph
+        self.switch_cnt = switch_cnt
+        self.sendto = sendto
+        self.registered = False
+        self.switch_addresses = {}
+        self.alive_switches = set()
+        self.last_heard = {}
+        self.neighbor_reports = {}
+        self.dead_links = set()
+        # With workers > 1 stale sources are spread over forked processes sharing the graph
+        self.pool = source_pool(graph, workers)
+        # With tree_cache > 0 up to that many route entries of earlier topology versions are kept
+        self.engine = RouteEngine(graph, self.pool, tree_cache) if ROUTE_ENGINE == "incremental" else None
+        self.switch_features = {}   # Optional features a switch listed in its Register_Request
+        self.route_seq = {}         # Sequence number of the last table or delta sent to a delta switch
+        self.sent_tables = {}       # Last table a delta switch was sent, to diff the next one against
+        self.sent_groups = {}       # Last equal-cost next hops an ecmp switch was sent
+        self.groups_sent = 0
+        # With detect="deadline" switch timeouts fire from a DeadlineScheduler instead of the K second scan
+        self.timers = DeadlineScheduler() if detect == "deadline" else None
+        # and only the links of switches whose report or liveness changed are checked again
+        self.touched = set() if detect == "deadline" else None
+        self.tick_stats = TickStats()
+        self.detection = self.timers.detection if self.timers is not None else DetectionStats()
+        # Topology events within coalesce seconds of the first one share one route recomputation
+        self.coalesce = coalesce
+        self.recompute_at = None
+        self.topology_events = 0
+        self.recomputes = 0
+        self.traffic = TrafficStats()
+        # With --batch the threads receiver hands over every pending datagram at once
+        self.batches = 0
+        self.batched = 0
+        self.batch_max = 0
+        # Instrumentation: hot path timings, the threads runtime's lock, --profile and --metrics
+        self.timings = {name: Timing() for name in
+                        ("handle", "check_status", "compute_routes", "compute_and_send_routes")}
+        self.lock = None
+        self.sampler = None
+        self.metrics_path = None
+        self.route_rows = 0
+        self.trees_recomputed = 0
+        self.trees_repaired = 0
+        self.tables_changed = 0
+        # With --send-queue datagrams are handed to a SendQueue instead of sendto()
+        self.outbox = None
+        # Messages larger than a datagram go out in chunks (see chunking.py)
+        self.chunker = Chunker()
+        self.reassembler = Reassembler()
+        # With --netem a NetEm impairs everything sent (see netem.py)
+        self.netem = None
+        self.address_ids = {}
+        # Link costs measured by --rtt switches or set through --stats-port (see linkcost.py)
+        self.link_costs = LinkCosts(graph)
+        # With --shards only the switches of one partition are handled here (see shard.py)
+        self.shard = None
+        self.owned = range(switch_cnt)
+        self.last_summary = None
+        self.local_change = True    # False while only peer summaries changed since the last routes
+        self.switch_tables = {}     # Last computed table of every alive switch
+        self.tables_version = 0
+        # With --snapshot the state is saved for a warm restart (see snapshot.py)
+        self.snapshot_path = None
+        self.snapshot_key = None
+        self.snapshots = 0
+        self.snapshot_bytes = 0
+        self.snapshot_time = Timing()
+        self.restored_at = None
+
+    @contextmanager
+    def section(self, name):
+        """Time a hot path and, with --profile, sample the stacks inside it."""
+        with self.timings[name]:
+            if self.sampler is None:
+                yield
+            else:
+                with self.sampler.section(name):
+                    yield
 
-    # ========== Functions ==========
+    # ========== Sending ==========
+
+    def send_message(self, sid, msg):
+        """Send msg to a switch in the format it negotiated at registration."""
+        binary = "binary" in self.switch_features.get(sid, ())
+        data = encode(msg, binary)
+        self.traffic.count_sent(msg.kind, len(data))
+        addr = self.switch_addresses[sid]
+        for datagram in self.chunker.datagrams(data):
+            if self.outbox is not None:
+                self.outbox.put(datagram, addr, CONTROL if msg.kind == REGISTER_RESPONSE else BULK)
+            else:
+                self.sendto(datagram, addr)
+
+    def peer_of(self, addr):
+        """Name the switch at addr for --netem rules, or None."""
+        sid = self.address_ids.get(addr)
+        if sid is None or self.switch_addresses.get(sid) != addr:
+            self.address_ids = {a: s for s, a in list(self.switch_addresses.items())}
+            sid = self.address_ids.get(addr)
+        return sid
+
+    def use_sendto(self, sendto, loop=None):
+        """Send through sendto, behind the NetEm if there is one."""
+        if self.netem is not None:
+            sendto = self.netem.wrap(sendto, self.peer_of)
+            if loop is not None:
+                self.netem.start_loop(loop)
+            else:
+                self.netem.start_thread()
+        self.sendto = sendto
+        if self.outbox is not None:
+            self.outbox.sendto = sendto
 
-    def send_register_response(sid):
+    def send_register_response(self, sid):
         """Send Register Response to a switch with all its configured neighbors."""
-        neighbors = topology.get(sid, {})
-        resp_lines = ["REGISTER_RESPONSE", str(len(neighbors))]
-        for nid in sorted(neighbors.keys()):
-            if nid in alive_switches and nid in switch_addresses:
-                na = switch_addresses[nid]
-                resp_lines.append(f"{nid} True {na[0]} {na[1]}")
+        entries = []
+        for nid in self.graph.neighbor_ids(sid):
+            if nid in self.alive_switches and nid in self.switch_addresses:
+                entries.append((nid, True, self.switch_addresses[nid]))
+            elif self.peer_alive(nid) and self.shard.address(nid) is not None:
+                entries.append((nid, True, self.shard.address(nid)))
             else:
-                resp_lines.append(f"{nid} False")
-        sock.sendto("\n".join(resp_lines).encode(), switch_addresses[sid])
+                entries.append((nid, False, None))
+        self.send_message(sid, Message(REGISTER_RESPONSE, sid, entries=entries))
 
-    def compute_routes():
+    def compute_routes(self):
         """Compute shortest paths using Dijkstra on the effective topology."""
-        eff_topo = {}
-        for sid in alive_switches:
-            eff_topo[sid] = {}
-            for nid, dist in topology.get(sid, {}).items():
-                if nid in alive_switches:
-                    lk = (min(sid, nid), max(sid, nid))
-                    if lk not in dead_links:
-                        eff_topo[sid][nid] = dist
-
-        all_routes = []
-        switch_tables = {}
-
-        for src in sorted(alive_switches):
-            switch_tables[src] = []
-
-            # Dijkstra
-            dists = {s: float('inf') for s in alive_switches}
-            dists[src] = 0
-            parents = {s: None for s in alive_switches}
-            pq = [(0, src)]
-            visited = set()
-
-            while pq:
-                d, u = heapq.heappop(pq)
-                if u in visited:
-                    continue
-                visited.add(u)
-                for v, w in eff_topo.get(u, {}).items():
-                    if v not in visited and dists[u] + w < dists[v]:
-                        dists[v] = dists[u] + w
-                        parents[v] = u
-                        heapq.heappush(pq, (dists[v], v))
-
-            # Build routing table entries for this source
-            for dest in range(switch_cnt):
-                if dest == src:
-                    all_routes.append([src, dest, src, 0])
-                    switch_tables[src].append(f"{dest} {src} 0")
-                elif dest not in alive_switches or dists.get(dest, float('inf')) == float('inf'):
-                    all_routes.append([src, dest, -1, 9999])
-                    switch_tables[src].append(f"{dest} -1 9999")
-                else:
-                    d_val = dists[dest]
-                    nh = dest
-                    while parents[nh] is not None and parents[nh] != src:
-                        nh = parents[nh]
-                    all_routes.append([src, dest, nh, d_val])
-                    switch_tables[src].append(f"{dest} {nh} {d_val}")
-
-        return all_routes, switch_tables
-
-    def compute_and_send_routes():
+        with self.section("compute_routes"):
+            if self.shard is not None:
+                return self.shard.compute_routes(self.alive_switches, self.dead_links)
+            if self.engine is None:
+                return compute_routes_full(self.graph, self.alive_switches, self.dead_links, self.pool)
+            routes = self.engine.compute(self.alive_switches, self.dead_links)
+            self.trees_recomputed += len(self.engine.last_recomputed)
+            self.trees_repaired += len(self.engine.last_repaired)
+            self.tables_changed += len(self.engine.last_changed)
+            return routes
+
+    def send_full_routes(self, sid, table):
+        """Send a switch its whole routing table."""
+        seq = None
+        if "delta" in self.switch_features.get(sid, ()):
+            seq = self.route_seq[sid] = self.route_seq.get(sid, 0)
+            self.sent_tables[sid] = list(table)
+        self.send_message(sid, Message(ROUTE_UPDATE, sid, seq, table))
+
+    def send_routes(self, sid, table):
+        """Send a switch the entries that changed since the last table it was sent.
+
+        Switches that did not ask for deltas at registration, or that have no
+        table yet, get the whole table. An unchanged table still produces an
+        empty delta so the switch logs a Routing Update like it always has.
+        """
+        prev = self.sent_tables.get(sid)
+        if prev is None or len(prev) != len(table):
+            self.send_full_routes(sid, table)
+            return
+        self.route_seq[sid] += 1
+        changes = [new for old, new in zip(prev, table) if old != new]
+        self.sent_tables[sid] = list(table)
+        self.send_message(sid, Message(ROUTE_DELTA, sid, self.route_seq[sid], changes))
+
+    def send_groups(self, sid, force=False):
+        """Send an ecmp switch every destination it reaches over several equal-cost next hops.
+
+        The ROUTE_UPDATE or ROUTE_DELTA before it keeps the single next hop that
+        is logged; this only adds the alternatives, and only when they changed.
+        """
+        if sid not in self.switch_tables:
+            return
+        groups = equal_cost_groups(self.graph, sid, self.switch_tables, self.dead_links)
+        if not force and self.sent_groups.get(sid) == groups:
+            return
+        self.sent_groups[sid] = groups
+        self.groups_sent += 1
+        self.send_message(sid, Message(ROUTE_ECMP, sid, entries=groups))
+
+    def compute_and_send_routes(self):
         """Compute routes, log them, and send to all alive switches."""
-        all_routes, switch_tables = compute_routes()
-        routing_table_update(all_routes)
-        for sid in alive_switches:
-            if sid in switch_addresses and sid in switch_tables:
-                msg_lines = ["ROUTE_UPDATE", str(sid)]
-                msg_lines.extend(switch_tables[sid])
-                sock.sendto("\n".join(msg_lines).encode(), switch_addresses[sid])
-    
+        with self.section("compute_and_send_routes"):
+            all_routes, switch_tables = self.compute_routes()
+            unchanged = not self.local_change and switch_tables == self.switch_tables
+            self.local_change = False
+            self.switch_tables = switch_tables
+            self.tables_version += 1
+            if self.shard is not None and unchanged:
+                return  # A peer's summary changed without moving any route of this shard
+            self.route_rows = len(all_routes)
+            routing_table_update(all_routes)
+            for sid in self.alive_switches:
+                if sid in self.switch_addresses and sid in switch_tables:
+                    self.send_routes(sid, switch_tables[sid])
+                    if "ecmp" in self.switch_features.get(sid, ()):
+                        self.send_groups(sid)
+
+    # ========== Receiving ==========
+
+    def handle(self, msg, addr, size=0):
+        """Handle one decoded message from a switch. size is the datagram length."""
+        self.traffic.count_received(msg, size)
+        with self.section("handle"):
+            self._handle(msg, addr)
+
+    def handle_batch(self, messages):
+        """Handle (msg, addr, size) of datagrams drained together, under one lock acquisition."""
+        self.batches += 1
+        self.batched += len(messages)
+        self.batch_max = max(self.batch_max, len(messages))
+        for msg, addr, size in messages:
+            self.handle(msg, addr, size)
+
+    def _handle(self, msg, addr):
+        if msg is None:
+            return
+        if msg.kind == SHARD_SUMMARY:
+            self.handle_shard_summary(msg)
+        elif not self.registered:
+            self.handle_initial_registration(msg, addr)
+        elif msg.kind == REGISTER_REQUEST:
+            self.handle_register_request(msg, addr)
+        elif msg.kind == TOPOLOGY_UPDATE:
+            sid = msg.sid
+            self.heard_from(sid, time.time())
+            report = self.neighbor_reports.setdefault(sid, {})
+            for nid, is_alive, *rtt in msg.entries:
+                if report.get(nid) != is_alive:
+                    report[nid] = is_alive
+                    self.touch(sid)
+                if rtt and rtt[0] is not None and self.shard is None:
+                    self.link_costs.report(sid, nid, rtt[0])
+        elif msg.kind == HEARTBEAT:
+            # The switch's report is unchanged apart from maybe a reset by a
+            # re-registration here, so only the down neighbors need applying
+            sid = msg.sid
+            self.heard_from(sid, time.time())
+            report = self.neighbor_reports.get(sid)
+            if report is not None:
+                down = set(msg.entries)
+                for nid, is_alive in report.items():
+                    if is_alive == (nid in down):
+                        report[nid] = not is_alive
+                        self.touch(sid)
+        elif msg.kind == ROUTE_RESYNC:
+            # A switch missed a delta, send it the last table again
+            sid = msg.sid
+            if sid in self.sent_tables and sid in self.switch_addresses:
+                self.send_full_routes(sid, self.sent_tables[sid])
+            elif sid in self.switch_tables and sid in self.switch_addresses:
+                self.send_full_routes(sid, self.switch_tables[sid])  # Nothing sent since a warm restart
+            if "ecmp" in self.switch_features.get(sid, ()) and sid in self.switch_addresses:
+                self.send_groups(sid, force=True)
+
+    def handle_initial_registration(self, msg, addr):
+        """Collect Register Requests until every switch in the config registered."""
+        if msg.kind != REGISTER_REQUEST or msg.sid not in self.owned:
+            return
+        sid = msg.sid
+        register_request_received(sid)
+        self.switch_addresses[sid] = addr
+        self.switch_features[sid] = set(msg.features)
+        self.alive_switches.add(sid)
+        self.heard_from(sid, time.time())
+        self.finish_registration()
+
+    def finish_registration(self):
+        """Answer every switch once all of them, and with --shards every peer's switches, registered."""
+        if len(self.switch_addresses) < len(self.owned):
+            return
+        if self.shard is not None:
+            self.publish_summary()
+            if not self.shard.ready():
+                return
+
+        # Send Register Responses to all
+        for sid in self.owned:
+            self.send_register_response(sid)
+            register_response_sent(sid)
+
+        # Initialize neighbor reports
+        for sid in self.owned:
+            self.neighbor_reports[sid] = {}
+            for nid in self.graph.neighbor_ids(sid):
+                self.neighbor_reports[sid][nid] = True
+
+        # Update last_heard after responses sent and send initial routes
+        now = time.time()
+        for sid in self.owned:
+            self.heard_from(sid, now)
+        self.compute_and_send_routes()
+        self.registered = True
+
+    def handle_register_request(self, msg, addr):
+        """Handle a Register Request from a switch that (re)joins after startup."""
+        sid = msg.sid
+        if sid not in self.owned:
+            return
+        register_request_received(sid)
+        self.switch_addresses[sid] = addr
+        self.switch_features[sid] = set(msg.features)
+        self.sent_tables.pop(sid, None)  # A restarted switch has no table to apply deltas to
+        self.route_seq.pop(sid, None)
+        self.sent_groups.pop(sid, None)
+        self.heard_from(sid, time.time())
+
+        if sid not in self.alive_switches:
+            self.alive_switches.add(sid)
+            topology_update_switch_alive(sid)
+            self.neighbor_reports[sid] = {}
+            for nid in self.graph.neighbor_ids(sid):   # Reset this report
+                self.neighbor_reports[sid][nid] = True
+            for other_sid in self.alive_switches:    # Reset others reports
+                if sid in self.neighbor_reports.get(other_sid, {}):
+                    self.neighbor_reports[other_sid][sid] = True
+            self.dead_links.difference_update({lk for lk in self.dead_links if sid in lk}) # Clear dead links
+            self.touch(sid)
+        # Send Register Response and recompute routes
+        self.send_register_response(sid)
+        register_response_sent(sid)
+        self.topology_changed()
+
+    # ========== Shards ==========
+
+    def peer_alive(self, sid):
+        """True if sid belongs to another shard that reports it alive."""
+        return self.shard is not None and self.shard.peer_alive(sid)
+
+    def publish_summary(self, force=True):
+        """Send the peer shards a SHARD_SUMMARY, unless unchanged and not forced."""
+        entries = self.shard.summary(self.alive_switches, self.dead_links, self.switch_addresses,
+                                     len(self.switch_addresses) >= len(self.owned))
+        if not force and entries == self.last_summary:
+            return
+        self.last_summary = entries
+        data = self.shard.encode_summary(entries)
+        datagrams = self.chunker.datagrams(data)
+        for addr in self.shard.peer_addresses():
+            self.traffic.count_sent(SHARD_SUMMARY, len(data))
+            if self.outbox is not None:
+                for datagram in datagrams:
+                    self.outbox.put(datagram, addr, BULK)
+                continue
+            try:
+                for datagram in datagrams:
+                    self.sendto(datagram, addr)
+            except OSError:
+                pass    # The peer is not up yet; it gets the next one
+
+    def handle_shard_summary(self, msg):
+        """Take in a peer's SHARD_SUMMARY and reroute if it changed anything."""
+        if self.shard is None:
+            return
+        changed, first, revived = self.shard.apply(msg, time.time())
+        if first:
+            self.publish_summary()  # The peer may have missed ours while it was not up
+        if not self.registered:
+            self.finish_registration()
+            return
+        # As in switch_dead(), a link to a peer switch that died is no dead link anymore
+        self.dead_links.difference_update({lk for lk in self.dead_links
+                                           if not all(u in self.alive_switches or self.peer_alive(u) for u in lk)})
+        for sid in revived:
+            # As for a re-registration, links to a switch that is back count as up again
+            for nid in self.graph.neighbor_ids(sid):
+                if nid in self.alive_switches and sid in self.neighbor_reports.get(nid, {}):
+                    self.neighbor_reports[nid][sid] = True
+            self.touch(sid)
+        if changed:
+            self.topology_changed(peer=True)
+
+    # ========== Periodic ==========
+
+    def heard_from(self, sid, now):
+        """Record that a switch was heard from and push back its timeout."""
+        self.last_heard[sid] = now
+        if self.timers is not None:
+            self.timers.schedule(sid, now + self.timeout(sid))
+
+    def timeout(self, sid):
+        """Return how long switch sid may stay silent before it is declared dead."""
+        return HEARTBEAT_TIMEOUT if "heartbeat" in self.switch_features.get(sid, ()) else TIMEOUT
+
+    def next_deadline(self):
+        """Return when the next switch timeout or coalesced recomputation is due, or None."""
+        deadline = self.recompute_at
+        if self.timers is not None:
+            timeout = self.timers.next_deadline()
+            if timeout is not None and (deadline is None or timeout < deadline):
+                deadline = timeout
+        return deadline
+
+    def topology_changed(self, events=1, peer=False):
+        """Recompute and send routes now, or at the end of the coalescing window."""
+        if self.shard is not None:
+            self.local_change = self.local_change or not peer
+            self.publish_summary(force=False)
+        self.topology_events += events
+        if self.coalesce <= 0:
+            self.recomputes += 1
+            self.compute_and_send_routes()
+        elif self.recompute_at is None:
+            self.recompute_at = time.time() + self.coalesce
+
+    def flush_routes(self):
+        """Run the coalesced recomputation once its window closed."""
+        if self.recompute_at is not None and time.time() >= self.recompute_at:
+            self.recompute_at = None
+            self.recomputes += 1
+            self.compute_and_send_routes()
+
+    def switch_dead(self, sid):
+        self.alive_switches.discard(sid)
+        topology_update_switch_dead(sid)
+        self.dead_links.difference_update({lk for lk in self.dead_links if sid in lk})
+        self.touch(sid)
+        if self.timers is not None:
+            self.timers.cancel(sid)
+
+    def touch(self, sid):
+        """Have the next check_status() look at the links of switch sid again."""
+        if self.touched is not None:
+            self.touched.add(sid)
+
+    def reported_dead(self, u, v):
+        """True if an alive switch here reports link (u, v) down and the other end is alive."""
+        for sid, nid in ((u, v), (v, u)):
+            if (sid in self.alive_switches and not self.neighbor_reports.get(sid, {}).get(nid, True)
+                    and (nid in self.alive_switches or self.peer_alive(nid))):
+                return True
+        return False
+
+    def wakeup(self, check):
+        """Run one wakeup of the periodic loop: due deadlines, then check_status() if check is set.
+
+        tick_stats counts the wakeup once, whichever of the two it ran.
+        """
+        with self.tick_stats:
+            self.fire_deadlines()
+            if check:
+                with self.section("check_status"):
+                    self.check_status()
+        if check and self.metrics_path is not None:
+            self.write_metrics()
+        if check and self.snapshot_path is not None:
+            self.save_snapshot()
+
+    def fire_deadlines(self):
+        """Handle expired switch timeouts and a due coalesced recomputation."""
+        if self.timers is not None:
+            newly_dead = [sid for sid in self.timers.pop_expired(time.time()) if sid in self.alive_switches]
+            for sid in newly_dead:
+                self.switch_dead(sid)
+            if newly_dead:
+                self.topology_changed(len(newly_dead))
+        self.flush_routes()
+
+    def check_status(self):
+        """Check switch and link status, recompute routes if anything changed."""
+        alive_switches = self.alive_switches
+        dead_links = self.dead_links
+        now = time.time()
+        changed = 0
+        # Detect dead switches
+        if self.timers is None:
+            newly_dead = []
+            for sid in list(alive_switches):
+                late = now - self.last_heard.get(sid, 0) - self.timeout(sid)
+                if late > 0:
+                    newly_dead.append(sid)
+                    self.detection.record(late)
+            for sid in newly_dead:
+                self.switch_dead(sid)
+                changed += 1
+        # Forget peer shards that went silent
+        if self.shard is not None and self.shard.expire(now, TIMEOUT):
+            changed += 1
+            if self.touched is not None:
+                self.touched.update(alive_switches)     # Links to their switches are no dead links anymore
+        # Detect link changes among alive switches
+        if self.touched is None:
+            cur_dead_links = set()
+            for sid in alive_switches:
+                for nid, is_alive in self.neighbor_reports.get(sid, {}).items():
+                    if not is_alive and (nid in alive_switches or self.peer_alive(nid)):
+                        cur_dead_links.add((min(sid, nid), max(sid, nid)))
+            checked = set(dead_links)
+        else:
+            # With --detect deadline only the links of switches touched since the last check
+            checked = {link_key(sid, nid) for sid in self.touched for nid in self.graph.neighbor_ids(sid)}
+            self.touched.clear()
+            cur_dead_links = {lk for lk in checked if self.reported_dead(*lk)}
+            checked &= dead_links
+        for lk in cur_dead_links - dead_links:  # New dead links
+            topology_update_link_dead(lk[0], lk[1])
+            changed += 1
+        changed += len(checked - cur_dead_links)    # Links that came back alive
+        dead_links.difference_update(checked)
+        dead_links.update(cur_dead_links)
+        # Follow the link costs measured since, the ones that pass damping
+        for u, v, cost in self.link_costs.updates(now):
+            self.set_link_cost(u, v, cost)
+            changed += 1
+        if changed:
+            self.topology_changed(changed)
+        if self.shard is not None:
+            self.publish_summary()
+
+    def timer_stats(self):
+        """Return failure detection and per-tick CPU metrics."""
+        stats = {**self.tick_stats.stats(), **self.detection.stats()}
+        if self.timers is not None:
+            stats["tracked"] = len(self.timers)
+        return stats
+
+    # ========== Link costs ==========
+
+    def set_link_cost(self, u, v, cost):
+        """Give link u-v a new cost; the next recomputation routes with it."""
+        if self.engine is not None:
+            self.engine.set_cost(u, v, cost)
+        else:
+            self.graph.set_cost(u, v, cost)
+
+    def admin(self, text):
+        """Run a command sent to --stats-port and return the reply.
+
+        COST <switch> <switch> <cost> pins the cost of a link and reroutes at
+        once; COST <switch> <switch> returns it to its measured or configured cost.
+        """
+        parts = text.split()
+        if parts[:1] != ["COST"] or len(parts) not in (3, 4):
+            return {"error": f"unknown command {text!r}"}
+        try:
+            u, v, *cost = map(int, parts[1:])
+        except ValueError:
+            return {"error": f"cannot parse {text!r}"}
+        if self.shard is not None:
+            return {"error": "link costs are fixed with --shards"}
+        if not (0 <= u < self.switch_cnt and 0 <= v < self.switch_cnt) or self.graph.cost(u, v) is None:
+            return {"error": f"no link {u},{v}"}
+        if cost and cost[0] < 1:
+            return {"error": "link costs must be positive"}
+        old = self.graph.cost(u, v)
+        new = self.link_costs.pin(u, v, cost[0] if cost else None, time.time())
+        if new != old:
+            self.set_link_cost(u, v, new)
+            if self.registered:
+                self.topology_changed()
+        return {"link": [min(u, v), max(u, v)], "cost": new, "previous": old, "pinned": bool(cost)}
+
+    def coalesce_stats(self):
+        """Return how many topology events were absorbed into shared recomputations."""
+        return {
+            "topology_events": self.topology_events,
+            "recomputes": self.recomputes,
+            "events_absorbed": max(0, self.topology_events - self.recomputes),
+        }
+
+    def stats(self):
+        """Return every counter the controller keeps, for --stats, --stats-port and --metrics."""
+        stats = {
+            "traffic": self.traffic.stats(),
+            "timers": self.timer_stats(),
+            "coalesce": self.coalesce_stats(),
+            "timings": {name: timing.stats() for name, timing in self.timings.items()},
+            "routes": {
+                "alive_switches": len(self.alive_switches),
+                "dead_links": len(self.dead_links),
+                "route_rows": self.route_rows,
+                "recomputes": self.recomputes,
+                "trees_recomputed": self.trees_recomputed,
+                "trees_repaired": self.trees_repaired,
+                "tables_changed": self.tables_changed,
+                "ecmp_groups_sent": self.groups_sent,
+                "tree_cache": self.engine.cache.stats() if self.engine and self.engine.cache else None,
+            },
+        }
+        if self.lock is not None:
+            stats["locks"] = self.lock.stats()
+        if self.outbox is not None:
+            stats["send_queue"] = self.outbox.stats()
+        if self.batches:
+            stats["batches"] = {
+                "batches": self.batches,
+                "datagrams": self.batched,
+                "avg": self.batched / self.batches,
+                "max": self.batch_max,
+            }
+        if self.chunker.messages_split or self.reassembler.chunks_received:
+            stats["chunks"] = {**self.chunker.stats(), **self.reassembler.stats()}
+        if self.shard is not None:
+            stats["shard"] = self.shard.stats()
+        if self.snapshot_path is not None:
+            stats["snapshot"] = self.snapshot_stats()
+        if self.netem is not None:
+            stats["netem"] = self.netem.stats()
+        if self.link_costs.reports or self.link_costs.applied:
+            stats["link_costs"] = self.link_costs.stats()
+        return stats
+
+    # ========== Snapshots ==========
+
+    def save_snapshot(self):
+        """Rewrite the --snapshot file if routes or topology changed since the last one."""
+        key = (self.tables_version, frozenset(self.alive_switches), frozenset(self.dead_links),
+               self.graph.cost_version)
+        if key == self.snapshot_key:
+            return
+        graph = self.graph
+        pinned = self.link_costs.pinned
+        costs = [(graph.edge_u[e], graph.edge_v[e], w, (graph.edge_u[e], graph.edge_v[e]) in pinned)
+                 for e, w in graph.changed_costs.items()]
+        with self.snapshot_time:
+            self.snapshot_bytes = write_snapshot(self.snapshot_path, graph, self.switch_addresses,
+                                                 self.switch_features, self.alive_switches, self.neighbor_reports,
+                                                 self.dead_links, self.switch_tables, costs)
+        self.snapshot_key = key
+        self.snapshots += 1
+
+    def restore_snapshot(self, path):
+        """Take the state from a snapshot instead of waiting for every switch to register.
+
+        Switches keep sending to the same port while the controller is down,
+        so it carries on from their next TOPOLOGY_UPDATEs; a switch that did
+        not survive times out. Returns False if there is no usable snapshot.
+        """
+        state = read_snapshot(path, self.graph)
+        if state is None:
+            return False
+        owned = self.owned
+        self.switch_addresses = {sid: addr for sid, addr in state["addresses"].items() if sid in owned}
+        self.switch_features = {sid: f for sid, f in state["features"].items() if sid in owned}
+        self.alive_switches = {sid for sid in state["alive"] if sid in owned}
+        self.neighbor_reports = {sid: report for sid, report in state["reports"].items() if sid in owned}
+        self.dead_links = state["dead_links"]
+        if self.touched is not None:
+            self.touched.update(self.neighbor_reports)
+        self.switch_tables = {sid: table for sid, table in state["tables"].items() if sid in owned}
+        for u, v, cost, pinned in state["costs"]:
+            self.link_costs.restore(u, v, cost, pinned)
+            self.set_link_cost(u, v, cost)
+        now = time.time()
+        for sid in self.alive_switches:
+            self.heard_from(sid, now)
+        self.registered = True
+        self.restored_at = state["time"]
+        return True
+
+    def snapshot_stats(self):
+        return {
+            "snapshots": self.snapshots,
+            "bytes": self.snapshot_bytes,
+            "write": self.snapshot_time.stats(),
+            "restored_from": self.restored_at,
+        }
+
+    def write_metrics(self):
+        """Replace the --metrics file with the current stats."""
+        tmp = self.metrics_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(dict(self.stats(), time=time.time()), f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, self.metrics_path)
+
+
+# ========== Runtimes ==========
+
+def run_threads(ctrl, sock, stats_port=None, batch=1):
+    """Drive the controller with a blocking receiver thread and a periodic thread.
+
+    With batch > 1 every blocking receive is followed by non-blocking ones
+    that drain up to batch datagrams already waiting in the socket buffer.
+    They are decoded outside the lock and handled under one acquisition,
+    so a burst of TOPOLOGY_UPDATEs costs one lock round trip instead of one
+    per switch. Python has no recvmmsg(), so draining is still one
+    recvfrom() per datagram.
+    """
+    lock = ctrl.lock = TimedLock()
+    wakeup = threading.Event()     # Set when a coalesced recomputation got scheduled
+    sock.settimeout(1.0)
+    ctrl.use_sendto(sock.sendto)
+    if ctrl.outbox is not None:
+        ctrl.outbox.start_thread()
+
+    if stats_port is not None:
+        def collect():
+            with lock:
+                return ctrl.stats()
+
+        def command(text):
+            with lock:
+                pending = ctrl.recompute_at
+                reply = ctrl.admin(text)
+                if pending is None and ctrl.recompute_at is not None:
+                    wakeup.set()
+            return reply
+        serve_stats(stats_port, collect, command)
+
+    # Wait for Registration, under its own name in the lock stats
+    main_thread = threading.current_thread()
+    main_name, main_thread.name = main_thread.name, "registration"
+    while not ctrl.registered:
+        try:
+            data, addr = sock.recvfrom(65535)
+        except socket.timeout:
+            continue
+        except ConnectionResetError:
+            continue
+        data = ctrl.reassembler.add(data, addr)
+        if data is None:
+            continue
+        with lock:
+            ctrl.handle(decode(data), addr, len(data))
+    main_thread.name = main_name
+
+    # Same socket, but reads on it return at once instead of waiting for the timeout
+    nowait = sock.dup()
+    nowait.setblocking(False)
+
+    def drain(received):
+        """Append the datagrams already waiting on sock to received, up to batch."""
+        while len(received) < batch:
+            try:
+                received.append(nowait.recvfrom(65535))
+            except BlockingIOError:
+                break
+            except ConnectionResetError:
+                continue
+
+    def batch_receiver():
+        """Thread to receive messages from switches in batches."""
+        while True:
+            try:
+                received = [sock.recvfrom(65535)]
+            except socket.timeout:
+                continue
+            except ConnectionResetError:
+                continue
+            except OSError:
+                break
+
+            drain(received)
+            messages = []
+            for data, addr in received:
+                data = ctrl.reassembler.add(data, addr)
+                if data is not None:
+                    messages.append((decode(data), addr, len(data)))
+            with lock:
+                pending = ctrl.recompute_at
+                ctrl.handle_batch(messages)
+                if pending is None and ctrl.recompute_at is not None:
+                    wakeup.set()
+
     def receiver():
         """Thread to receive messages from switches."""
         while True:
             try:
-                data, addr = sock.recvfrom(4096)
+                data, addr = sock.recvfrom(65535)
             except socket.timeout:
                 continue
             except ConnectionResetError:
@@ -228,128 +919,34 @@ def main():
             except OSError:
                 break
 
-            msg = data.decode().strip()
-            msg_lines = msg.split('\n')
-
+            data = ctrl.reassembler.add(data, addr)
+            if data is None:
+                continue    # Chunk of a message still incomplete
+            msg = decode(data)
             with lock:
-                first_parts = msg_lines[0].split()
-                if len(first_parts) >= 2 and first_parts[1] == "Register_Request":
-                    sid = int(first_parts[0])
-                    register_request_received(sid)
-                    switch_addresses[sid] = addr
-                    last_heard[sid] = time.time()
-
-                    if sid not in alive_switches:
-                        alive_switches.add(sid)
-                        topology_update_switch_alive(sid)s
-                        neighbor_reports[sid] = {}
-                        for nid in topology.get(sid, {}):   # Reset this report
-                            neighbor_reports[sid][nid] = True
-                        for other_sid in alive_switches:    # Reset others reports
-                            if sid in neighbor_reports.get(other_sid, {}):
-                                neighbor_reports[other_sid][sid] = True
-                        dead_links.difference_update({lk for lk in dead_links if sid in lk}) # Clear dead links
-                    # Send Register Response and recompute routes
-                    send_register_response(sid)
-                    register_response_sent(sid)
-                    compute_and_send_routes()
-                elif msg_lines[0] == "TOPOLOGY_UPDATE":
-                    sid = int(msg_lines[1])
-                    last_heard[sid] = time.time()
-                    for line in msg_lines[2:]:
-                        lparts = line.split()
-                        if len(lparts) >= 2:
-                            nid = int(lparts[0])
-                            is_alive = lparts[1] == "True"
-                            neighbor_reports.setdefault(sid, {})[nid] = is_alive
+                pending = ctrl.recompute_at
+                ctrl.handle(msg, addr, len(data))
+                if pending is None and ctrl.recompute_at is not None:
+                    wakeup.set()
 
     def periodic():
         """Thread to periodically check switch and link status."""
+        next_tick = time.time() + K
         while True:
-            time.sleep(K)
             with lock:
-                now = time.time()
-                changed = False
-                # Detect dead switches
-                newly_dead = []
-                for sid in list(alive_switches):
-                    if now - last_heard.get(sid, 0) > TIMEOUT:
-                        newly_dead.append(sid)
-                for sid in newly_dead:
-                    alive_switches.discard(sid)
-                    topology_update_switch_dead(sid)
-                    dead_links.difference_update({lk for lk in dead_links if sid in lk})
-                    changed = True
-                # Detect link changes among alive switches
-                cur_dead_links = set()
-                for sid in alive_switches:
-                    for nid, is_alive in neighbor_reports.get(sid, {}).items():
-                        if nid in alive_switches and not is_alive:
-                            cur_dead_links.add((min(sid, nid), max(sid, nid)))
-                for lk in cur_dead_links - dead_links:  # New dead links
-                    topology_update_link_dead(lk[0], lk[1])
-                    changed = True
-                if dead_links - cur_dead_links:         # Links that came back alive# Revived links
-                    changed = True
-                dead_links.clear()
-                dead_links.update(cur_dead_links)
-                if changed:
-                    compute_and_send_routes()
-    
-    # ============================================
-
-    # Read Configuration
-    try:
-        with open(config, 'r') as f:
-            lines = [l.strip() for l in f.readlines() if l.strip()]
-            switch_cnt = int(lines[0])
-            topology = {i: {} for i in range(switch_cnt)}
-            
-            for line in lines[1:]:
-                parts = line.split()
-                if len(parts) < 3: continue
-                u, v, dist = int(parts[0]), int(parts[1]), int(parts[2])
-                topology[u][v] = dist
-                topology[v][u] = dist
-    except Exception as e:
-        print(f"Error read file: {e}")
-        sys.exit(1)
-    
-    # Wait for Registration
-    while len(switch_addresses) < switch_cnt:
-        try:
-            data, addr = sock.recvfrom(4096)
-        except socket.timeout:
-            continue
-        msg = data.decode().strip()
-        parts = msg.split()
-        if len(parts) >= 2 and parts[1] == "Register_Request":
-            sid = int(parts[0])
-            register_request_received(sid)
-            switch_addresses[sid] = addr
-            alive_switches.add(sid)
-            last_heard[sid] = time.time()
-
-    # Send Register Responses to all
-    for sid in range(switch_cnt):
-        send_register_response(sid)
-        register_response_sent(sid)
-
-    # Initialize neighbor reports
-    for sid in range(switch_cnt):
-        neighbor_reports[sid] = {}
-        for nid in topology.get(sid, {}):
-            neighbor_reports[sid][nid] = True
-
-    # Update last_heard after responses sent and send initial routes
-    now = time.time()
-    for sid in range(switch_cnt):
-        last_heard[sid] = now
-    compute_and_send_routes()
+                deadline = ctrl.next_deadline()
+            wake = next_tick if deadline is None else min(next_tick, deadline)
+            wakeup.wait(max(0.0, wake - time.time()))
+            wakeup.clear()
+            with lock:
+                check = time.time() >= next_tick
+                ctrl.wakeup(check)
+                if check:
+                    next_tick += K
 
     # Start Threads
-    recv_thread = threading.Thread(target=receiver, daemon=True)
-    per_thread = threading.Thread(target=periodic, daemon=True)
+    recv_thread = threading.Thread(target=batch_receiver if batch > 1 else receiver, name="receiver", daemon=True)
+    per_thread = threading.Thread(target=periodic, name="periodic", daemon=True)
     recv_thread.start()
     per_thread.start()
 
@@ -361,5 +958,221 @@ def main():
         pass
 
 
+class ControllerProtocol(asyncio.DatagramProtocol):
+    """asyncio endpoint that feeds datagrams to a Controller.
+
+    Everything runs on the event loop thread, so no lock is needed and there
+    is no receive timeout to poll: handle() runs as soon as a datagram
+    arrives and wakeup() runs from a loop timer every K seconds and at
+    controller deadlines.
+    """
+
+    def __init__(self, ctrl):
+        self.ctrl = ctrl
+        self.loop = None
+        self.ticking = False
+        self.next_tick = None
+        self.timer = None
+
+    def connection_made(self, transport):
+        self.loop = asyncio.get_running_loop()
+        self.ctrl.use_sendto(transport.sendto, self.loop)
+        if self.ctrl.outbox is not None:
+            self.ctrl.outbox.start_loop(self.loop)
+
+    def datagram_received(self, data, addr):
+        data = self.ctrl.reassembler.add(data, addr)
+        if data is None:
+            return
+        pending = self.ctrl.recompute_at
+        self.ctrl.handle(decode(data), addr, len(data))
+        if self.ctrl.registered and not self.ticking:
+            self.ticking = True
+            self.next_tick = time.time() + K
+            self.schedule()
+        elif pending is None and self.ctrl.recompute_at is not None:
+            self.schedule()     # A coalescing window opened, it may close before the next wakeup
+
+    def error_received(self, exc):
+        pass    # ICMP errors for switches that went away
+
+    def schedule(self):
+        """Wake up at the next K tick or controller deadline, whichever comes first."""
+        if self.timer is not None:
+            self.timer.cancel()
+        deadline = self.ctrl.next_deadline()
+        wake = self.next_tick if deadline is None else min(self.next_tick, deadline)
+        self.timer = self.loop.call_later(max(0.0, wake - time.time()), self.tick)
+
+    def tick(self):
+        check = time.time() >= self.next_tick
+        self.ctrl.wakeup(check)
+        if check:
+            self.next_tick += K
+        self.schedule()
+
+
+async def serve_asyncio(ctrl, port, stats_port=None):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: ControllerProtocol(ctrl), local_addr=('0.0.0.0', port))
+    if stats_port is not None:
+        async def snapshot():
+            return ctrl.stats()
+
+        async def command(text):
+            pending = ctrl.recompute_at
+            reply = ctrl.admin(text)
+            if protocol.ticking and pending is None and ctrl.recompute_at is not None:
+                protocol.schedule()
+            return reply
+        # The stats thread must not read the controller while the loop changes it
+        serve_stats(stats_port, lambda: asyncio.run_coroutine_threadsafe(snapshot(), loop).result(),
+                    lambda text: asyncio.run_coroutine_threadsafe(command(text), loop).result())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+def run_asyncio(ctrl, port, stats_port=None):
+    """Drive the controller from an asyncio event loop."""
+    try:
+        asyncio.run(serve_asyncio(ctrl, port, stats_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def use_log_writer(kind):
+    """Switch write_to_log() to the buffered backend for --log buffered."""
+    global LOG_WRITER
+    if kind == "buffered" and LOG_WRITER is None:
+        LOG_WRITER = LogWriter()
+        install_exit_handler()
+
+
+def main():
+    global LOG_FILE
+
+    #Check for number of arguments and exit if host/port not provided
+    num_args = len(sys.argv)
+    if num_args < 3:
+        print ("Usage: python controller.py <port> <config file> [--mode threads|asyncio] [--log sync|buffered] [--detect scan|deadline] [--coalesce <seconds>] [--workers <n>] [--tree-cache <entries>] [--stats <file>] [--stats-port <port>] [--metrics <file>] [--profile <file>] [--send-queue] [--pace <datagrams/s>] [--shards <port>,<port>,...] [--snapshot <file>] [--chunk-size <bytes>] [--batch <datagrams>] [--netem <spec>] [--rtt-unit <ms>]\n")
+        sys.exit(1)
+    
+    # Write your code below or elsewhere in this file
+
+    # Parameters
+    port = int(sys.argv[1])
+    config = sys.argv[2]
+    mode = "threads"
+    log = "sync"
+    detect = "scan"
+    coalesce = 0.0
+    workers = 1
+    tree_cache = 0
+    stats = None
+    stats_port = None
+    metrics = None
+    profile = None
+    send_queue = False
+    pace = 0.0
+    shards = None
+    snapshot = None
+    chunk_size = CHUNK_SIZE
+    batch = 1
+    netem = None
+    rtt_unit = None
+    args = sys.argv[3:]
+    while args:
+        opt = args.pop(0)
+        if opt == '--mode' and args:
+            mode = args.pop(0)
+        elif opt == '--log' and args:
+            log = args.pop(0)
+        elif opt == '--detect' and args:
+            detect = args.pop(0)
+        elif opt == '--coalesce' and args:
+            coalesce = float(args.pop(0))
+        elif opt == '--workers' and args:
+            workers = int(args.pop(0))
+        elif opt == '--tree-cache' and args:
+            tree_cache = int(args.pop(0))
+        elif opt == '--stats' and args:
+            stats = args.pop(0)
+        elif opt == '--stats-port' and args:
+            stats_port = int(args.pop(0))
+        elif opt == '--metrics' and args:
+            metrics = args.pop(0)
+        elif opt == '--profile' and args:
+            profile = args.pop(0)
+        elif opt == '--send-queue':
+            send_queue = True
+        elif opt == '--pace' and args:
+            send_queue = True
+            pace = float(args.pop(0))
+        elif opt == '--shards' and args:
+            shards = parse_peers(args.pop(0))
+        elif opt == '--snapshot' and args:
+            snapshot = args.pop(0)
+        elif opt == '--chunk-size' and args:
+            chunk_size = int(args.pop(0))
+        elif opt == '--batch' and args:
+            batch = int(args.pop(0))
+        elif opt == '--netem' and args:
+            netem = parse_spec(args.pop(0))
+        elif opt == '--rtt-unit' and args:
+            rtt_unit = float(args.pop(0))
+
+    if shards is not None and workers > 1:
+        print("--workers cannot be combined with --shards: shards route over their own overlay graph")
+        sys.exit(1)
+
+    # Read Configuration
+    try:
+        switch_cnt, graph = read_config(config)
+    except Exception as e:
+        print(f"Error read file: {e}")
+        sys.exit(1)
+
+    # The --workers pool forks here, before any thread (like the log writer's) exists
+    ctrl = Controller(graph, switch_cnt, None, detect, coalesce, workers, tree_cache)
+    use_log_writer(log)
+    ctrl.chunker = Chunker(chunk_size)
+    if netem is not None:
+        ctrl.netem = NetEm(netem)
+    if rtt_unit is not None:
+        ctrl.link_costs.unit = rtt_unit
+    if shards is not None:
+        ports = [peer_port for _, peer_port in shards]
+        if port not in ports:
+            print(f"--shards does not list this controller's port {port}")
+            sys.exit(1)
+        index = ports.index(port)
+        LOG_FILE = f"Controller{index}.log"
+        ctrl.shard = Shard(graph, shards, index)
+        ctrl.owned = ctrl.shard.owned
+    if snapshot is not None:
+        ctrl.snapshot_path = snapshot
+        ctrl.restore_snapshot(snapshot)     # Warm restart if a snapshot of this config exists
+    if stats is not None:
+        install_stats_dump(stats, ctrl.stats)
+    ctrl.metrics_path = metrics
+    if send_queue:
+        ctrl.outbox = SendQueue(None, pace)
+    if profile is not None:
+        # Collapsed stacks of the hot paths, written on exit
+        ctrl.sampler = Sampler()
+        atexit.register(ctrl.sampler.dump, profile)
+        install_exit_handler()
+    if mode == "asyncio":
+        run_asyncio(ctrl, port, stats_port)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('', port))
+        ctrl.sendto = sock.sendto
+        run_threads(ctrl, sock, stats_port, batch)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""End-to-end convergence benchmark for controller.py.
+
+Usage: python convergence.py run [--shapes ring,grid,fattree,random] [--sizes 16,64] [--kills 2]
+                                 [--link-failures 2] [--out results.json] [--controller-args "..."]
+                                 [--netem <spec>]
+       python convergence.py topology <shape> <switches> <config file>
+
+run:      for every shape and size, writes a Config/graph_*.txt style file,
+          starts controller.py and simulate.py against it in a scratch
+          directory, fails links with -f from the start and kills switches
+          one at a time once routing settled. Timings are read back from
+          Controller.log and switch#.log, message and byte counts from the
+          --stats files of both processes. Everything is written as JSON to
+          --out and summarized on stdout.
+          --netem <spec> impairs every link of both processes (see
+          netem.py), to measure convergence and false detections under loss.
+topology: only writes the config file of one shape.
+
+Shapes: ring, grid (as square as possible), fattree (k-ary fat-tree with
+the smallest even k that has at least the requested number of switches)
+and random (connected, average degree 4). Link costs are random in 1..10.
+
+Reported per run, in seconds:
+  registration      first switch started -> first Routing Update
+  switch_detection  switch killed -> Switch Dead in Controller.log
+  switch_converge   switch killed -> every remaining switch logged a Routing Update
+  link_detection    registration -> Link Dead for a -f link
+  link_converge     registration -> every switch logged a Routing Update after that
+and the false detections: Switch Dead for a switch that was never killed
+and Link Dead for a link that was never failed, which loss makes likely
+when it drops K/TIMEOUT worth of periodic messages.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+from benchmark import int_list, percentile, random_links
+
+K = 2
+TIMEOUT = 3 * K
+HERE = os.path.dirname(os.path.abspath(__file__))
+TIMESTAMP = re.compile(r"^\d\d:\d\d:\d\d(\.\d+)?$")
+
+
+# ========== Topologies ==========
+
+def ring(size, rng):
+    n = max(3, size)
+    return n, [(i, (i + 1) % n, rng.randint(1, 10)) for i in range(n)]
+
+
+def grid(size, rng):
+    cols = max(2, round(math.sqrt(size)))
+    rows = max(2, math.ceil(size / cols))
+    links = []
+    for r in range(rows):
+        for c in range(cols):
+            sid = r * cols + c
+            if c + 1 < cols:
+                links.append((sid, sid + 1, rng.randint(1, 10)))
+            if r + 1 < rows:
+                links.append((sid, sid + cols, rng.randint(1, 10)))
+    return rows * cols, links
+
+
+def fattree(size, rng):
+    k = 2
+    while 5 * k * k // 4 < size:
+        k += 2
+    half = k // 2
+    cores = half * half
+    links = []
+    for pod in range(k):
+        aggs = [cores + pod * k + j for j in range(half)]
+        edges = [cores + pod * k + half + j for j in range(half)]
+        for j, agg in enumerate(aggs):
+            for core in range(j * half, (j + 1) * half):
+                links.append((core, agg, rng.randint(1, 10)))
+            for edge in edges:
+                links.append((agg, edge, rng.randint(1, 10)))
+    return cores + k * k, links
+
+
+def random_graph(size, rng):
+    n = max(2, size)
+    return n, [(u, v, 1 + w % 10) for u, v, w in random_links(n, 4, rng.randrange(1 << 30))]
+
+
+SHAPES = {"ring": ring, "grid": grid, "fattree": fattree, "random": random_graph}
+
+
+def write_topology(shape, size, path, seed=1):
+    """Write a topology in the Config/graph_*.txt format. Returns (switch_cnt, links)."""
+    n, links = SHAPES[shape](size, random.Random(seed))
+    with open(path, 'w') as f:
+        f.write(f"{n}\n")
+        f.writelines(f"{u} {v} {w}\n" for u, v, w in links)
+    return n, links
+
+
+# ========== Logs ==========
+
+def read_log(path):
+    """Return [(epoch seconds, event line)] of a Controller.log or switch#.log."""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    today = date.today()
+    stamp = None
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if TIMESTAMP.match(line):
+                stamp = datetime.combine(today, datetime.strptime(line, "%H:%M:%S.%f" if "." in line
+                                                                   else "%H:%M:%S").time()).timestamp()
+            elif line and stamp is not None:
+                entries.append((stamp, line))
+                stamp = None
+    return entries
+
+
+def first(entries, event, after=0.0):
+    """Time of the first event entry at or after after, or None."""
+    return next((t for t, line in entries if line == event and t >= after), None)
+
+
+def converged(switch_logs, since):
+    """Time by which every switch logged a Routing Update at or after since, or None."""
+    times = [first(entries, "Routing Update", since) for entries in switch_logs.values()]
+    if not times or None in times:
+        return None
+    return max(times)
+
+
+def wait_for(path, event, timeout, after=0.0):
+    """Poll a log until event shows up. Returns its time or None."""
+    end = time.time() + timeout
+    while time.time() < end:
+        t = first(read_log(path), event, after)
+        if t is not None:
+            return t
+        time.sleep(0.2)
+    return None
+
+
+# ========== Runs ==========
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+
+def summarize(samples):
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None
+    return {"count": len(samples), "p50": percentile(samples, 50), "p90": percentile(samples, 90),
+            "p99": percentile(samples, 99), "max": max(samples)}
+
+
+def read_stats(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def false_detections(log, victims, failed):
+    """Count the Switch Dead and Link Dead lines of log for switches and links that never failed."""
+    failed_links = {(min(u, v), max(u, v)) for u, v in failed.items()}
+    false_switch = false_link = 0
+    for _, line in log:
+        if line.startswith("Switch Dead "):
+            false_switch += int(line.split()[2]) not in victims
+        elif line.startswith("Link Dead "):
+            u, v = map(int, line.split()[2].split(','))
+            false_link += (u, v) not in failed_links
+    return false_switch, false_link
+
+
+def run_one(shape, size, args, workdir):
+    """Run one topology end to end. Returns the JSON record of the run."""
+    rng = random.Random(f"{args.seed}-{shape}-{size}")
+    config = os.path.join(workdir, f"graph_{shape}_{size}.txt")
+    n, links = write_topology(shape, size, config, args.seed)
+    victims = rng.sample(range(n), min(args.kills, n - 2))
+    candidates = [(u, v) for u, v, _ in links if u not in victims and v not in victims]
+    failed = {}
+    for u, v in rng.sample(candidates, min(len(candidates), 4 * args.link_failures)):
+        if len(failed) < args.link_failures and u not in failed:
+            failed[u] = v
+
+    netem = ["--netem", args.netem] if args.netem else []
+    port = free_port()
+    quiet = dict(cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ctrl = subprocess.Popen([sys.executable, os.path.join(HERE, "controller.py"), str(port), config,
+                             "--stats", "controller.json", *netem, *shlex.split(args.controller_args)], **quiet)
+    time.sleep(0.5)
+    started = time.time()
+    sim_args = [sys.executable, os.path.join(HERE, "simulate.py"), config, "localhost", str(port),
+                "--stats", "switches.json", *netem, *shlex.split(args.switch_args)]
+    for u, v in failed.items():
+        sim_args += ["-f", str(u), str(v)]
+    for sid in victims:
+        sim_args += ["-x", str(sid)]
+    procs = [subprocess.Popen(sim_args, **quiet)]
+    killable = {}
+    for sid in victims:
+        killable[sid] = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "switch.py"), str(sid), "localhost", str(port),
+             "--stats", f"victim{sid}.json", *netem, *shlex.split(args.switch_args)], **quiet)
+
+    controller_log = os.path.join(workdir, "Controller.log")
+    try:
+        registered = wait_for(controller_log, "Routing Update", 30 + 0.1 * n)
+        if registered is None:
+            raise RuntimeError(f"{shape} {size}: switches never finished registering")
+        time.sleep(TIMEOUT + 2 * K)     # Let the -f links be declared dead first
+
+        kills = []
+        for sid in victims:
+            killed = time.time()
+            killable[sid].terminate()
+            killable[sid].wait()
+            wait_for(controller_log, f"Switch Dead {sid}", TIMEOUT + 3 * K, killed)
+            time.sleep(K)
+            kills.append((sid, killed))
+    finally:
+        for proc in [*procs, *killable.values(), ctrl]:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in [*procs, *killable.values(), ctrl]:
+            proc.wait()
+
+    log = read_log(controller_log)
+    switch_logs = {sid: read_log(os.path.join(workdir, f"switch{sid}.log"))
+                   for sid in range(n) if sid not in victims}
+    link_detection, link_converge = [], []
+    for u, v in failed.items():
+        dead = first(log, f"Link Dead {min(u, v)},{max(u, v)}", registered)
+        done = converged(switch_logs, dead) if dead is not None else None
+        link_detection.append(None if dead is None else dead - registered)
+        link_converge.append(None if done is None else done - registered)
+    switch_detection, switch_converge = [], []
+    for sid, killed in kills:
+        dead = first(log, f"Switch Dead {sid}", killed)
+        done = converged(switch_logs, dead) if dead is not None else None
+        switch_detection.append(None if dead is None else dead - killed)
+        switch_converge.append(None if done is None else done - killed)
+
+    false_switch, false_link = false_detections(log, victims, failed)
+
+    switch_traffic = [read_stats(os.path.join(workdir, "switches.json")).get("traffic", {})]
+    switch_traffic += [read_stats(os.path.join(workdir, f"victim{sid}.json")).get("traffic", {})
+                       for sid in victims]
+    controller = read_stats(os.path.join(workdir, "controller.json"))
+    return {
+        "shape": shape,
+        "switches": n,
+        "links": len(links),
+        "killed": victims,
+        "failed_links": sorted(failed.items()),
+        "registration": registered - started,
+        "switch_detection": summarize(switch_detection),
+        "switch_converge": summarize(switch_converge),
+        "link_detection": summarize(link_detection),
+        "link_converge": summarize(link_converge),
+        "samples": {"switch_detection": switch_detection, "switch_converge": switch_converge,
+                    "link_detection": link_detection, "link_converge": link_converge},
+        "false_switch_dead": false_switch,
+        "false_link_dead": false_link,
+        "controller": controller,
+        "switch_messages_sent": sum(t.get("sent_messages", 0) for t in switch_traffic),
+        "switch_bytes_sent": sum(t.get("sent_bytes", 0) for t in switch_traffic),
+    }
+
+
+def cmd_run(args):
+    results = {"params": {k: v for k, v in vars(args).items() if k != "func"},
+               "started": datetime.now().isoformat(timespec="seconds"), "runs": []}
+    print(f"{'shape':>8} {'switches':>8} {'register s':>10} {'sw detect p50':>14} {'sw conv p50':>12} "
+          f"{'link conv p50':>14} {'false dead':>10} {'ctrl msgs':>10} {'ctrl bytes':>11}")
+    for shape in args.shapes:
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory() as workdir:
+                run = run_one(shape, size, args, workdir)
+            results["runs"].append(run)
+            traffic = run["controller"].get("traffic", {})
+
+            def p50(key):
+                return f"{run[key]['p50']:.3f}" if run[key] else "-"
+            print(f"{shape:>8} {run['switches']:>8} {run['registration']:>10.3f} {p50('switch_detection'):>14} "
+                  f"{p50('switch_converge'):>12} {p50('link_converge'):>14} "
+                  f"{run['false_switch_dead'] + run['false_link_dead']:>10} "
+                  f"{traffic.get('sent_messages', 0):>10} {traffic.get('sent_bytes', 0):>11}")
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print(f"wrote {args.out}")
+
+
+def cmd_topology(args):
+    n, links = write_topology(args.shape, args.switches, args.config, args.seed)
+    print(f"wrote {args.config}: {n} switches, {len(links)} links")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controller convergence benchmark")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("run", help="run the controller and switches and measure convergence")
+    p.add_argument("--shapes", type=lambda s: [x for x in s.split(',') if x], default=list(SHAPES))
+    p.add_argument("--sizes", type=int_list, default=[16, 64])
+    p.add_argument("--kills", type=int, default=2)
+    p.add_argument("--link-failures", type=int, default=2)
+    p.add_argument("--controller-args", default="", help="extra controller.py options, e.g. \"--detect deadline\"")
+    p.add_argument("--switch-args", default="", help="extra simulate.py/switch.py options, e.g. \"--binary\"")
+    p.add_argument("--netem", default="", help="netem.py spec for every link, e.g. \"loss=0.05,delay=20ms\"")
+    p.add_argument("--out", default="convergence.json")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("topology", help="write one synthetic topology")
+    p.add_argument("shape", choices=list(SHAPES))
+    p.add_argument("switches", type=int)
+    p.add_argument("config")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_topology)
+
+    args = parser.parse_args()
+    if args.cmd == "run":
+        unknown = set(args.shapes) - set(SHAPES)
+        if unknown:
+            parser.error(f"unknown shape(s): {', '.join(sorted(unknown))}")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
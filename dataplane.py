@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""Data plane for switch.py --dataplane.
+
+A switch started with --dataplane compiles every routing table it applies
+into a ForwardingTable: next_hops[dest] is the next hop towards dest, or -1,
+and hop_addrs[dest] the UDP address of that next hop, so forwarding a packet
+is one list index. Tables are recompiled when a ROUTE_UPDATE or ROUTE_DELTA
+is applied or a neighbor's address changes, never per packet.
+
+Data packets are fixed-size datagrams
+
+    magic (1 byte, 0xD5) | ttl (1) | hops (1) | source (4) | dest (4) | flow (2) | seq (4) | sent (8, time.time())
+
+The magic byte is neither a text control message's first byte nor the
+binary format's, so a receiver tells data from control by the first byte
+before decoding anything. forward() works on the buffer the datagram was
+received into: it rewrites ttl and hops in place and sends that same buffer
+on, without a Message, a bytes copy or a new buffer per packet.
+
+With --traffic <packets/s> a switch also sends packets to random
+destinations, and every destination records the end-to-end latency and the
+number of hops of what it receives.
+
+With --ecmp the switch also applies the ROUTE_ECMP groups the controller
+sends: every equal-cost next hop of a destination. hop_groups[dest] then
+holds their addresses, and a packet takes the one picked by a hash of its
+(source, dest, flow), so a flow keeps one path while different flows
+spread over all of them. Generated traffic uses FLOWS flow labels per
+destination. The hash is salted with the switch id so that
+consecutive switches do not make the same choice.
+"""
+
+import random
+import struct
+import time
+from array import array
+
+MAGIC = 0xD5
+PACKET = struct.Struct("!BBBIIHId")    # magic, ttl, hops, source, dest, flow, seq, sent
+ENDPOINTS = struct.Struct("!IIH")       # source, dest, flow
+ENDPOINTS_OFFSET = 3
+TTL = 64
+FLOWS = 8                   # Flow labels generated traffic uses per destination
+TRAFFIC_INTERVAL = 0.01     # Seconds between two bursts of generated packets
+
+
+def is_packet(data):
+    """True if data is a data packet rather than a control message."""
+    return len(data) == PACKET.size and data[0] == MAGIC
+
+
+def flow_hash(source, dest, flow, salt):
+    """Hash a flow to an int, the same for every packet of it."""
+    return ((source * 0x9E3779B1 ^ dest * 0x85EBCA6B ^ flow * 0xC2B2AE35 ^ salt) >> 16) & 0xFFFF
+
+
+class ForwardingTable:
+    """Dense per-destination next hops of one switch and its data plane counters."""
+
+    def __init__(self, my_id, rate=0.0, seed=None):
+        self.my_id = my_id
+        self.salt = my_id * 0x27D4EB2F & 0xFFFFFFFF
+        self.next_hops = array('i')
+        self.hops = ([], [])                # (hop_addrs, hop_groups), swapped together
+        self.tx = bytearray(PACKET.size)    # Packets this switch originates
+        self.rx = bytearray(PACKET.size)    # Copy of a packet handed over as bytes
+        self.seq = 0
+        self.rate = rate                    # Generated packets per second
+        self.credit = 0.0
+        self.rng = random.Random(my_id if seed is None else seed)
+        # Stats
+        self.compiles = 0
+        self.originated = 0
+        self.forwarded = 0
+        self.delivered = 0
+        self.no_route = 0
+        self.multipath = 0                  # Packets sent through an equal-cost group
+        self.expired = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.hops_total = 0
+
+    def compile(self, routes, nb_addrs, groups=None):
+        """Rebuild the arrays from a {dest: next hop} table and the neighbor addresses.
+
+        groups maps a destination to all its equal-cost next hops. A group is
+        only used while it still contains the table's next hop, so a group
+        sent before the latest delta is ignored rather than followed.
+        """
+        size = max(routes) + 1 if routes else 0
+        next_hops = array('i', [-1]) * size
+        hop_addrs = [None] * size
+        hop_groups = [None] * size
+        for dest, nh in routes.items():
+            next_hops[dest] = nh
+            if nh >= 0 and nh != self.my_id:
+                hop_addrs[dest] = nb_addrs.get(nh)
+        for dest, hops in (groups or {}).items():
+            if dest < size and next_hops[dest] in hops:
+                addrs = tuple(addr for addr in map(nb_addrs.get, hops) if addr is not None)
+                if len(addrs) > 1:
+                    hop_groups[dest] = addrs
+        # Swapped in whole, so a forward() running in another thread never sees half a table
+        self.next_hops, self.hops = next_hops, (hop_addrs, hop_groups)
+        self.compiles += 1
+
+    def lookup(self, source, dest, flow=0):
+        """Return the address a packet of flow from source to dest is sent to, or None."""
+        hop_addrs, hop_groups = self.hops
+        if dest >= len(hop_addrs):
+            return None
+        group = hop_groups[dest]
+        if group is None:
+            return hop_addrs[dest]
+        return group[flow_hash(source, dest, flow, self.salt) % len(group)]
+
+    # ========== Fast path ==========
+
+    def forward(self, packet, sendto):
+        """Deliver the packet in the writable buffer packet, or forward it in place."""
+        source, dest, flow = ENDPOINTS.unpack_from(packet, ENDPOINTS_OFFSET)
+        if dest == self.my_id:
+            self.deliver(packet)
+            return
+        hop_addrs, hop_groups = self.hops
+        if dest >= len(hop_addrs):
+            self.no_route += 1
+            return
+        group = hop_groups[dest]
+        if group is None:
+            addr = hop_addrs[dest]
+        else:
+            addr = group[flow_hash(source, dest, flow, self.salt) % len(group)]
+            self.multipath += 1
+        if addr is None:
+            self.no_route += 1
+            return
+        ttl = packet[1]
+        if ttl <= 1:
+            self.expired += 1
+            return
+        packet[1] = ttl - 1
+        packet[2] += 1
+        try:
+            sendto(packet, addr)
+        except OSError:
+            return
+        self.forwarded += 1
+
+    def forward_bytes(self, data, sendto):
+        """forward() for a packet received as bytes, e.g. by asyncio."""
+        self.rx[:] = data
+        self.forward(self.rx, sendto)
+
+    def deliver(self, packet):
+        _, _, hops, _, _, _, _, sent = PACKET.unpack_from(packet)
+        latency = time.time() - sent
+        self.delivered += 1
+        self.hops_total += hops
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    # ========== Traffic ==========
+
+    def originate(self, dest, sendto, flow=0):
+        """Send one new packet of flow towards dest. Returns False if there is no route."""
+        hop_addrs, hop_groups = self.hops
+        group = hop_groups[dest] if dest < len(hop_groups) else None
+        if group is None:
+            addr = hop_addrs[dest] if dest < len(hop_addrs) else None
+        else:
+            addr = group[flow_hash(self.my_id, dest, flow, self.salt) % len(group)]
+            self.multipath += 1
+        if addr is None:
+            self.no_route += 1
+            return False
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        PACKET.pack_into(self.tx, 0, MAGIC, TTL, 1, self.my_id, dest, flow, self.seq, time.time())
+        try:
+            sendto(self.tx, addr)
+        except OSError:
+            return False
+        self.originated += 1
+        return True
+
+    def generate(self, elapsed, sendto):
+        """Send the packets due after elapsed seconds at rate, to random destinations."""
+        size = len(self.hops[0])
+        if self.rate <= 0 or size < 2:
+            return
+        self.credit = min(self.credit + elapsed * self.rate, self.rate)    # At most 1 s of backlog
+        while self.credit >= 1:
+            self.credit -= 1
+            dest = self.rng.randrange(size - 1)
+            self.originate(dest if dest < self.my_id else dest + 1, sendto, self.rng.randrange(FLOWS))
+
+    def stats(self):
+        return combined_stats([self])
+
+
+def combined_stats(tables):
+    """Return the data plane counters of tables added together."""
+    delivered = sum(t.delivered for t in tables)
+    hops = sum(t.hops_total for t in tables)
+    latency = sum(t.latency_total for t in tables)
+    return {
+        "compiles": sum(t.compiles for t in tables),
+        "originated": sum(t.originated for t in tables),
+        "forwarded": sum(t.forwarded for t in tables),
+        "delivered": delivered,
+        "no_route": sum(t.no_route for t in tables),
+        "multipath": sum(t.multipath for t in tables),
+        "expired": sum(t.expired for t in tables),
+        "hops_avg": hops / delivered if delivered else 0.0,
+        "latency_avg_ms": latency / delivered * 1000 if delivered else 0.0,
+        "latency_max_ms": max((t.latency_max for t in tables), default=0.0) * 1000,
+        "hop_latency_avg_ms": latency / hops * 1000 if hops else 0.0,
+    }
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""Compact topology store for the controller.
+
+Graph holds the configured topology in CSR form: the neighbors of switch u
+are targets[offsets[u]:offsets[u + 1]], with the matching link costs in
+weights and link ids in edge_ids. Every undirected link has one id, used to
+index the edge_live bitmap; node_live does the same for switches. Route
+computation walks these arrays directly and masks dead switches and links
+with the bitmaps, so a topology change only flips a few bytes instead of
+rebuilding an adjacency dict. set_cost() changes the cost of a link in
+place, in weights for both directions and in edge_w.
+
+from_config() parses a Config/graph_*.txt file a 64 KB block at a time
+into flat arrays, and the links are put in order by a counting sort over
+arrays, so only one block's lines, never the whole file, exist as Python
+objects at once.
+"""
+
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+
+class Graph:
+    """CSR adjacency with per-switch and per-link liveness bitmaps."""
+
+    def __init__(self, switch_cnt, links):
+        """Build from switch_cnt and an iterable of (u, v, cost).
+
+        As with the original dict parser a link listed twice keeps the
+        last cost.
+        """
+        keys, costs = array('q'), array('q')
+        for u, v, w in links:
+            keys.append(self._key(switch_cnt, u, v))
+            costs.append(w)
+        self._build(switch_cnt, keys, costs)
+
+    @classmethod
+    def from_config(cls, path, block=1 << 16):
+        """Stream a Config/graph_*.txt file into a Graph, about block bytes at a time."""
+        keys, costs = array('q'), array('q')
+        n = None
+        with open(path, 'r') as f:
+            for line in f:
+                if line.split():
+                    n = int(line.split()[0])
+                    break
+            if n is None:
+                raise ValueError(f"{path} is empty")
+            while True:
+                lines = f.readlines(block)
+                if not lines:
+                    break
+                tokens = "".join(lines).split()
+                if len(tokens) != 3 * len(lines):
+                    # Blank or malformed lines: keep only the ones with a full link
+                    tokens = [t for parts in map(str.split, lines) if len(parts) >= 3 for t in parts[:3]]
+                values = list(map(int, tokens))
+                us, vs = values[0::3], values[1::3]
+                if us and (min(min(us), min(vs)) < 0 or max(max(us), max(vs)) >= n):
+                    bad = next((u, v) for u, v in zip(us, vs) if not (0 <= u < n and 0 <= v < n))
+                    raise ValueError(f"link {bad[0]} {bad[1]} refers to a switch outside 0..{n - 1}")
+                keys.extend([u * n + v if u < v else v * n + u for u, v in zip(us, vs)])
+                costs.extend(values[2::3])
+        graph = cls.__new__(cls)
+        graph._build(n, keys, costs)
+        return graph
+
+    @staticmethod
+    def _key(n, u, v):
+        """Pack link u-v into one integer ordered by (low, high)."""
+        if not (0 <= u < n and 0 <= v < n):
+            raise ValueError(f"link {u} {v} refers to a switch outside 0..{n - 1}")
+        return u * n + v if u < v else v * n + u
+
+    @staticmethod
+    def _sort_links(n, keys):
+        """Return the indices of keys in link order, as an array, stable among duplicates.
+
+        A counting sort by the low end puts every link into its switch's
+        bucket, and each bucket, a switch's degree long, is sorted on its own,
+        so no Python object per link is ever alive at once.
+        """
+        starts = array('q', bytes(8 * (n + 1)))
+        for key in keys:
+            starts[key // n + 1] += 1
+        starts = array('q', accumulate(starts))
+        fill = array('q', starts)
+        order = array('q', bytes(8 * len(keys)))
+        for i, key in enumerate(keys):
+            u = key // n
+            order[fill[u]] = i
+            fill[u] += 1
+        for u in range(n):
+            lo, hi = starts[u], starts[u + 1]
+            if hi - lo > 1:
+                order[lo:hi] = array('q', sorted(order[lo:hi], key=keys.__getitem__))
+        return order
+
+    def _build(self, n, keys, costs):
+        # Stable sort by link, so the last line of a duplicated link ends its run
+        order = self._sort_links(n, keys)
+        last = len(order) - 1
+        edge_u, edge_v, edge_w = array('i'), array('i'), array('q')
+        degree = array('q', bytes(8 * (n + 1)))
+        for j in range(len(order)):
+            i = order[j]
+            key = keys[i]
+            if j < last and keys[order[j + 1]] == key:
+                continue
+            u, v = divmod(key, n)
+            if u == v:
+                continue    # Self-loops carry no route
+            edge_u.append(u)
+            edge_v.append(v)
+            edge_w.append(costs[i])
+            degree[u + 1] += 1
+            degree[v + 1] += 1
+        del order
+        m = len(edge_u)
+
+        # Links are numbered in (low, high) order, so filling them in id
+        # order leaves every adjacency list sorted by neighbor id
+        offsets = array('q', accumulate(degree))
+        fill = array('q', offsets)
+        targets = array('i', bytes(4 * 2 * m))
+        weights = array('q', bytes(8 * 2 * m))
+        edge_ids = array('i', bytes(4 * 2 * m))
+        for e in range(m):
+            u, v, w = edge_u[e], edge_v[e], edge_w[e]
+            i = fill[u]
+            targets[i] = v
+            weights[i] = w
+            edge_ids[i] = e
+            fill[u] = i + 1
+            i = fill[v]
+            targets[i] = u
+            weights[i] = w
+            edge_ids[i] = e
+            fill[v] = i + 1
+        self.n = n
+        self.m = m
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.edge_ids = edge_ids
+        self.edge_u, self.edge_v, self.edge_w = edge_u, edge_v, edge_w
+
+        self.node_live = bytearray(n)               # 1 if the switch is alive
+        self.edge_live = bytearray(b"\1" * self.m)  # 0 if the link was reported dead
+        self.changed_costs = {}                     # Link id -> cost, for links set_cost() changed
+        self.cost_version = 0
+        self._alive = set()
+        self._dead = set()
+
+    # ========== Lookups ==========
+
+    def __len__(self):
+        return self.n
+
+    def neighbors(self, u):
+        """Yield (neighbor, cost, link id) of u, by neighbor id."""
+        targets, weights, edge_ids = self.targets, self.weights, self.edge_ids
+        for i in range(self.offsets[u], self.offsets[u + 1]):
+            yield targets[i], weights[i], edge_ids[i]
+
+    def neighbor_ids(self, u):
+        """Return the configured neighbors of u, sorted."""
+        return self.targets[self.offsets[u]:self.offsets[u + 1]].tolist()
+
+    def edge_id(self, u, v):
+        """Return the id of link u-v, or None if it is not configured."""
+        hi = self.offsets[u + 1]
+        i = bisect_left(self.targets, v, self.offsets[u], hi)
+        if i < hi and self.targets[i] == v:
+            return self.edge_ids[i]
+        return None
+
+    def cost(self, u, v):
+        """Return the cost of link u-v, or None if it is not configured."""
+        e = self.edge_id(u, v)
+        return None if e is None else self.edge_w[e]
+
+    def set_cost(self, u, v, w):
+        """Change the cost of link u-v in place. Returns the old cost, or None if it is not configured."""
+        e = self.edge_id(u, v)
+        if e is None:
+            return None
+        old = self.edge_w[e]
+        for a, b in ((u, v), (v, u)):
+            self.weights[bisect_left(self.targets, b, self.offsets[a], self.offsets[a + 1])] = w
+        self.edge_w[e] = w
+        self.changed_costs[e] = w
+        self.cost_version += 1
+        return old
+
+    def links(self):
+        """Yield (u, v, cost) of every link with u < v."""
+        for e in range(self.m):
+            yield self.edge_u[e], self.edge_v[e], self.edge_w[e]
+
+    def to_dict(self):
+        """Return the {u: {v: cost}} form used by the starter code."""
+        topology = {u: {} for u in range(self.n)}
+        for u, v, w in self.links():
+            topology[u][v] = w
+            topology[v][u] = w
+        return topology
+
+    # ========== Liveness ==========
+
+    def apply_state(self, alive_switches, dead_links):
+        """Set the liveness bitmaps to alive_switches and dead_links (u, v) keys.
+
+        Only the switches and links that differ from the last call are touched.
+        """
+        for sid in self._alive - alive_switches:
+            self.node_live[sid] = 0
+        for sid in alive_switches - self._alive:
+            self.node_live[sid] = 1
+        for u, v in self._dead - dead_links:
+            e = self.edge_id(u, v)
+            if e is not None:
+                self.edge_live[e] = 1
+        for u, v in dead_links - self._dead:
+            e = self.edge_id(u, v)
+            if e is not None:
+                self.edge_live[e] = 0
+        self._alive = set(alive_switches)
+        self._dead = set(dead_links)
+
+    def is_up(self, u, v):
+        """True if u and v are alive and the link between them is configured and not dead."""
+        if not (self.node_live[u] and self.node_live[v]):
+            return False
+        e = self.edge_id(u, v)
+        return e is not None and self.edge_live[e] == 1
+
+    def memory_bytes(self):
+        """Approximate size of the arrays backing the graph."""
+        arrays = (self.offsets, self.targets, self.weights, self.edge_ids,
+                  self.edge_u, self.edge_v, self.edge_w)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.node_live) + len(self.edge_live)
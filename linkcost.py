@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Link costs that change at runtime, from measured RTTs or an admin.
+
+Usage: python switch.py <Id_self> <Controller hostname> <Controller Port> --rtt
+       python metrics.py <stats port> [host] --cost <switch> <switch> [<cost>]
+
+A switch started with --rtt sends every alive neighbor a PROBE each K
+seconds, keeps a smoothed RTT per neighbor from the PROBE_REPLYs, and adds
+it to the entries of its TOPOLOGY_UPDATEs. LinkCosts turns those reports
+into link costs: the mean RTT of both ends, in units of unit milliseconds,
+at least 1. Costs are integers like the config file's, so the RTTs of one
+box's loopback all come out as 1 unless unit is made smaller.
+
+Measured costs are damped so that jitter does not flood the switches with
+route updates: a new cost is only applied if it is at least damping times
+the current one away from it, and no sooner than hold seconds after the
+link's last change. A cost set by an admin through the controller's
+--stats-port is applied at once and pins the link until it is cleared;
+clearing it returns the link to its measured or configured cost.
+"""
+
+RTT_UNIT = 1.0          # Milliseconds of RTT per unit of link cost
+COST_DAMPING = 0.25     # Smallest change applied from RTT reports, relative to the current cost
+COST_HOLD = 6.0         # Seconds a measured cost stays before it may change again
+
+
+class LinkCosts:
+    """Measured and pinned link costs, and when the graph should follow them."""
+
+    def __init__(self, graph, unit=RTT_UNIT, damping=COST_DAMPING, hold=COST_HOLD):
+        self.graph = graph
+        self.unit = unit
+        self.damping = damping
+        self.hold = hold
+        self.base = {}          # Link -> configured cost, for links changed since
+        self.measured = {}      # Link -> {reporting switch: RTT in microseconds}
+        self.pinned = {}        # Link -> cost set by an admin
+        self.dirty = set()      # Links with reports since the last updates()
+        self.changed_at = {}    # Link -> time its cost last changed
+        # Stats
+        self.reports = 0
+        self.applied = 0
+        self.damped = 0
+
+    def report(self, sid, nid, rtt_us):
+        """Take the RTT switch sid measured to its neighbor nid."""
+        lk = (sid, nid) if sid < nid else (nid, sid)
+        if self.graph.edge_id(*lk) is None:
+            return
+        self.measured.setdefault(lk, {})[sid] = rtt_us
+        self.dirty.add(lk)
+        self.reports += 1
+
+    def measured_cost(self, lk):
+        """Return the cost the RTTs reported for lk map to, or None without reports."""
+        ends = self.measured.get(lk)
+        if not ends:
+            return None
+        rtt_ms = sum(ends.values()) / len(ends) / 1000
+        return max(1, round(rtt_ms / self.unit))
+
+    def updates(self, now):
+        """Return [(u, v, cost)] of the measured costs that pass damping, and record them as applied."""
+        changes = []
+        for lk in sorted(self.dirty):
+            if lk in self.pinned:
+                continue
+            cost = self.measured_cost(lk)
+            current = self.graph.cost(*lk)
+            if cost is None or cost == current:
+                continue
+            if abs(cost - current) < self.damping * current or now - self.changed_at.get(lk, -self.hold) < self.hold:
+                self.damped += 1
+                continue
+            changes.append((*lk, cost))
+            self.changed(lk, now)
+        self.dirty.clear()
+        return changes
+
+    def pin(self, u, v, cost, now):
+        """Set the cost of u-v by hand, or clear that with cost None. Returns the cost to apply now."""
+        lk = (u, v) if u < v else (v, u)
+        if cost is None:
+            self.pinned.pop(lk, None)
+            cost = self.measured_cost(lk)
+            if cost is None:
+                cost = self.base.get(lk, self.graph.cost(*lk))
+        else:
+            self.pinned[lk] = cost
+        self.changed(lk, now)
+        return cost
+
+    def restore(self, u, v, cost, pinned):
+        """Take a cost saved in a snapshot, before the graph gets it."""
+        lk = (u, v) if u < v else (v, u)
+        self.base.setdefault(lk, self.graph.cost(*lk))
+        if pinned:
+            self.pinned[lk] = cost
+
+    def changed(self, lk, now):
+        self.base.setdefault(lk, self.graph.cost(*lk))
+        self.changed_at[lk] = now
+        self.applied += 1
+
+    def stats(self):
+        return {
+            "reports": self.reports,
+            "measured_links": len(self.measured),
+            "pinned_links": len(self.pinned),
+            "changed_links": len(self.base),
+            "applied": self.applied,
+            "damped": self.damped,
+        }
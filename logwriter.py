@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""Buffered log backend shared by controller.py, switch.py and simulate.py.
+
+With --log buffered, write_to_log() hands each record to a LogWriter instead
+of opening, appending to and closing the log file itself. A background
+thread drains the queue, groups whatever records are waiting by file and
+writes each group with one call, so disk latency no longer adds to the time
+the controller or switch spends holding its lock. Records keep the timestamp
+taken when they were created, so the file contents are unchanged.
+
+Everything queued is written before the process exits: close() runs from
+atexit, and install_exit_handler() turns SIGTERM into a normal exit so it
+also runs when a switch or the controller is killed. install_stats_dump()
+uses the same hooks to leave a JSON stats file behind for --stats.
+"""
+
+import atexit
+import json
+import queue
+import signal
+import sys
+import threading
+
+
+class LogWriter:
+    """Queue log records and append them to their files from a background thread."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        self.closed = False
+        self.batches = 0
+        self.records = 0
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, path, text):
+        """Queue text to be appended to path."""
+        self.queue.put((path, text))
+
+    def flush(self):
+        """Block until every record queued so far is on disk."""
+        if self.closed:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Flush everything queued and stop the writer thread."""
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            pending = {}
+            events = []
+            stop = False
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                else:
+                    pending.setdefault(item[0], []).append(item[1])
+            self._write(pending)
+            for event in events:
+                event.set()
+            if stop:
+                for f in self.files.values():
+                    f.close()
+                self.files.clear()
+                return
+
+    def _write(self, pending):
+        for path, texts in pending.items():
+            f = self.files.get(path)
+            if f is None:
+                f = self.files[path] = open(path, 'a+')
+            f.write("".join(texts))
+            f.flush()
+            self.records += len(texts)
+        if pending:
+            self.batches += 1
+
+
+def install_exit_handler():
+    """Exit normally on SIGTERM so that queued log records are flushed."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def install_stats_dump(path, collect):
+    """Write collect() to path as JSON when the process exits, SIGTERM included."""
+    def dump():
+        with open(path, 'w') as f:
+            json.dump(collect(), f, indent=2, sort_keys=True)
+            f.write("\n")
+    atexit.register(dump)
+    install_exit_handler()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""Runtime metrics for controller.py.
+
+Usage: python metrics.py <stats port> [host] [--cost <switch> <switch> [<cost>]]
+
+Timing counts and times a code section. TimedLock is the lock of the
+threads runtime with the time every thread spent waiting for it and
+holding it. Sampler is a small sampling profiler: a background thread takes
+a snapshot of the stack of every thread that is inside a profiled section
+and counts them, and dump() writes the counts in the collapsed-stack format
+that flamegraph.pl and speedscope read.
+
+The controller answers any datagram sent to its --stats-port with its
+current stats as JSON; running this file queries it and prints the reply.
+With --cost it sends a COST command instead, which sets the cost of a link,
+or clears a cost set that way when no cost is given (see linkcost.py).
+"""
+
+import json
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class Timing:
+    """Wall-clock time spent in a section: calls, total and worst case."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "total_s": self.total,
+            "avg_ms": self.total / self.calls * 1000 if self.calls else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class TimedLock:
+    """threading.Lock that records wait and hold times per thread name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = {}         # thread name -> Timing-like [count, total, max]
+        self.holds = {}
+        self._acquired = {}     # thread id -> time the lock was acquired
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        now = time.perf_counter()
+        self._record(self.waits, now - start)
+        self._acquired[threading.get_ident()] = now
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self._acquired.pop(threading.get_ident())
+        self._record(self.holds, held)
+        self.lock.release()
+
+    @staticmethod
+    def _record(table, elapsed):
+        name = threading.current_thread().name
+        entry = table.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def stats(self):
+        """Return {thread name: {"wait": {...}, "hold": {...}}}."""
+        result = {}
+        for kind, table in (("wait", self.waits), ("hold", self.holds)):
+            for name, (count, total, worst) in list(table.items()):
+                result.setdefault(name, {})[kind] = {
+                    "count": count,
+                    "avg_ms": total / count * 1000 if count else 0.0,
+                    "max_ms": worst * 1000,
+                    "total_s": total,
+                }
+        return result
+
+
+class Sampler:
+    """Sampling profiler for the sections wrapped in section()."""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = Counter()
+        self.active = {}        # thread id -> name of the section it is in
+        self.thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self.thread.start()
+
+    def section(self, name):
+        return _Section(self, name)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, name in list(self.active.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join([name, *reversed(stack)])] += 1
+
+    def dump(self, path):
+        """Write the samples as collapsed stacks: "frame;frame;... count" per line."""
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _Section:
+    def __init__(self, sampler, name):
+        self.sampler = sampler
+        self.name = name
+        self.outer = None
+
+    def __enter__(self):
+        ident = threading.get_ident()
+        self.outer = self.sampler.active.get(ident)
+        if self.outer is None:     # Nested sections are attributed to the outermost one
+            self.sampler.active[ident] = self.name
+        return self
+
+    def __exit__(self, *exc):
+        if self.outer is None:
+            self.sampler.active.pop(threading.get_ident(), None)
+
+
+def serve_stats(port, collect, command=None):
+    """Answer every datagram on 127.0.0.1:port with collect() as JSON, from a thread.
+
+    With command, a datagram other than STATS is answered with command(text) instead.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', port))
+
+    def loop():
+        while True:
+            try:
+                data, addr = sock.recvfrom(512)
+                text = data.decode(errors="replace").strip()
+                reply = collect() if command is None or text in ("", "STATS") else command(text)
+                sock.sendto(json.dumps(reply, sort_keys=True).encode(), addr)
+            except OSError:
+                continue
+
+    threading.Thread(target=loop, name="stats", daemon=True).start()
+    return sock
+
+
+def query(port, host='127.0.0.1', timeout=2.0, request="STATS"):
+    """Ask a controller for its stats, or send it another command."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(request.encode(), (host, port))
+        data, _ = sock.recvfrom(65535)
+    return json.loads(data)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python metrics.py <stats port> [host] [--cost <switch> <switch> [<cost>]]\n")
+        sys.exit(1)
+    args = sys.argv[2:]
+    request = "STATS"
+    if '--cost' in args:
+        i = args.index('--cost')
+        request = " ".join(["COST", *args[i + 1:]])
+        args = args[:i]
+    host = args[0] if args else '127.0.0.1'
+    try:
+        stats = query(int(sys.argv[1]), host, request=request)
+    except socket.timeout:
+        print("No answer from the controller")
+        sys.exit(1)
+    print(json.dumps(stats, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""Loss, delay, jitter and reordering on outgoing datagrams, for testing.
+
+Usage: python controller.py <port> <config file> --netem <spec>
+       python switch.py <Id_self> <Controller hostname> <Controller Port> --netem <spec>
+
+A NetEm wraps the sendto(data, addr) of a controller or switch, so one
+Linux box can run the whole lab under lossy conditions without tc. A spec
+is a ";" separated list of rules:
+
+    [<peer>:]loss=<fraction>,delay=<time>,jitter=<time>,reorder=<fraction>
+
+where time is in seconds or with an "ms" suffix, and peer picks the link
+the rule applies to: a switch id (for a switch, one of its neighbors; for
+the controller, that switch), "controller" for a switch's link to the
+controller, or "*" (the default) for every link without a rule of its
+own. For example
+
+    loss=0.05,delay=20ms,jitter=5ms;3:loss=0.3
+
+drops 5% of everything, delays it by 15-25 ms, and drops 30% on the link
+to 3. Like tc netem, the fraction reorder of datagrams skips the delay and
+overtakes the ones still waiting, and jitter alone already reorders
+datagrams sent closer together than it. Each side only impairs what it
+sends, so the two directions of a link are set at their two ends.
+
+Delayed datagrams wait in a heap drained by a thread (start_thread()) or
+by callbacks on an asyncio loop (start_loop()), like sendqueue.SendQueue.
+"""
+
+import heapq
+import random
+import threading
+import time
+
+DEFAULT = "*"
+
+
+class Impairment:
+    """What happens to datagrams sent over one link."""
+
+    def __init__(self, loss=0.0, delay=0.0, jitter=0.0, reorder=0.0):
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        # Stats
+        self.sent = 0
+        self.dropped = 0
+        self.delayed = 0
+        self.reordered = 0
+        self.delay_total = 0.0
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "delayed": self.delayed,
+            "reordered": self.reordered,
+            "delay_avg_ms": self.delay_total / self.delayed * 1000 if self.delayed else 0.0,
+        }
+
+
+def parse_time(text):
+    return float(text[:-2]) / 1000 if text.endswith("ms") else float(text)
+
+
+def parse_spec(spec):
+    """Parse a --netem spec into {peer: Impairment}; peer is an int, "controller" or "*"."""
+    rules = {}
+    for rule in spec.split(';'):
+        rule = rule.strip()
+        if not rule:
+            continue
+        peer, sep, params = rule.partition(':')
+        if not sep or '=' in peer:
+            peer, params = DEFAULT, rule
+        peer = peer.strip()
+        if peer not in (DEFAULT, "controller"):
+            peer = int(peer)
+        values = {}
+        for item in params.split(','):
+            key, _, value = item.partition('=')
+            key = key.strip()
+            if key in ("loss", "reorder"):
+                values[key] = float(value)
+            elif key in ("delay", "jitter"):
+                values[key] = parse_time(value.strip())
+            else:
+                raise ValueError(f"unknown netem parameter {key!r} in {rule!r}")
+        rules[peer] = Impairment(**values)
+    return rules
+
+
+class NetEm:
+    """Applies per-link Impairments to a sendto function."""
+
+    def __init__(self, rules, seed=None):
+        self.rules = rules
+        self.default = rules.get(DEFAULT)
+        self.rng = random.Random(seed)
+        self.sendto = None
+        self.peer_of = None
+        self.heap = []          # (due, sequence, data, addr)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.loop = None
+
+    def wrap(self, sendto, peer_of):
+        """Return a sendto that impairs datagrams before handing them to sendto.
+
+        peer_of(addr) names the peer at addr, as a rule key, or returns None.
+        """
+        self.sendto = sendto
+        self.peer_of = peer_of
+        return self.send
+
+    def send(self, data, addr):
+        rule = self.rules.get(self.peer_of(addr), self.default)
+        if rule is None:
+            self.sendto(data, addr)
+            return
+        rule.sent += 1
+        rng = self.rng
+        if rule.loss and rng.random() < rule.loss:
+            rule.dropped += 1
+            return
+        delay = rule.delay
+        if rule.jitter:
+            delay = max(0.0, delay + rng.uniform(-rule.jitter, rule.jitter))
+        if rule.reorder and rng.random() < rule.reorder:
+            rule.reordered += 1
+            delay = 0.0
+        if delay <= 0:
+            self.sendto(data, addr)
+            return
+        rule.delayed += 1
+        rule.delay_total += delay
+        data = bytes(data)      # The caller may reuse its buffer, e.g. the data plane's
+        if self.loop is not None:
+            self.loop.call_later(delay, self._deliver, data, addr)
+            return
+        with self.cond:
+            self.seq += 1
+            heapq.heappush(self.heap, (time.monotonic() + delay, self.seq, data, addr))
+            self.cond.notify()
+
+    def _deliver(self, data, addr):
+        try:
+            self.sendto(data, addr)
+        except OSError:
+            pass    # The peer went away while the datagram was delayed
+
+    # ========== Delivery ==========
+
+    def start_thread(self):
+        """Send delayed datagrams from a thread."""
+        def deliverer():
+            while True:
+                with self.cond:
+                    while not self.heap:
+                        self.cond.wait()
+                    wait = self.heap[0][0] - time.monotonic()
+                    if wait > 0:
+                        self.cond.wait(wait)
+                        continue
+                    _, _, data, addr = heapq.heappop(self.heap)
+                self._deliver(data, addr)
+        threading.Thread(target=deliverer, name="netem", daemon=True).start()
+
+    def start_loop(self, loop):
+        """Send delayed datagrams from callbacks on an asyncio loop. send() must then run on that loop."""
+        self.loop = loop
+
+    def stats(self):
+        return {str(peer): rule.stats() for peer, rule in self.rules.items()}
+
+
+def combined_stats(netems):
+    """Return the per-peer counters of several NetEms added together."""
+    total = {}
+    for netem in netems:
+        for peer, rule in netem.rules.items():
+            counts = total.setdefault(str(peer), Impairment())
+            counts.sent += rule.sent
+            counts.dropped += rule.dropped
+            counts.delayed += rule.delayed
+            counts.reordered += rule.reordered
+            counts.delay_total += rule.delay_total
+    return {peer: counts.stats() for peer, counts in total.items()}
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+"""Wire format of the messages exchanged by controller.py and switch.py.
+
+Every message can be sent in one of two encodings:
+
+text    The newline-delimited ASCII format of the starter code. This is the
+        default and the only format a switch uses until it is told otherwise.
+
+binary  A struct-packed format. A switch asks for it by listing "binary"
+        after Register_Request; the controller then answers in binary and
+        both sides keep using it. Every binary message starts with
+
+            magic (1 byte, 0xB5) | version (1 byte) | type (1 byte) | switch id (4 bytes)
+
+        followed by a type specific body of fixed-width big-endian fields.
+        The magic byte is never the first byte of a text message, so decode()
+        accepts either format without knowing what was negotiated.
+"""
+
+import json
+import socket
+import struct
+
+REGISTER_REQUEST = "Register_Request"
+REGISTER_RESPONSE = "REGISTER_RESPONSE"
+TOPOLOGY_UPDATE = "TOPOLOGY_UPDATE"
+ROUTE_UPDATE = "ROUTE_UPDATE"
+ROUTE_DELTA = "ROUTE_DELTA"
+KEEP_ALIVE = "KEEP_ALIVE"
+ROUTE_RESYNC = "ROUTE_RESYNC"
+HEARTBEAT = "HEARTBEAT"
+SHARD_SUMMARY = "SHARD_SUMMARY"
+ROUTE_ECMP = "ROUTE_ECMP"
+PROBE = "PROBE"
+PROBE_REPLY = "PROBE_REPLY"
+
+MAGIC = 0xB5
+VERSION = 1
+NO_SEQ = 0xFFFFFFFF
+NO_METRIC = 0xFFFFFFFF
+
+KIND_CODES = {
+    REGISTER_REQUEST: 0,
+    REGISTER_RESPONSE: 1,
+    TOPOLOGY_UPDATE: 2,
+    ROUTE_UPDATE: 3,
+    ROUTE_DELTA: 4,
+    KEEP_ALIVE: 5,
+    ROUTE_RESYNC: 6,
+    HEARTBEAT: 7,
+    SHARD_SUMMARY: 8,
+    ROUTE_ECMP: 9,
+    PROBE: 10,
+    PROBE_REPLY: 11,
+}
+CODE_KINDS = {code: kind for kind, code in KIND_CODES.items()}
+
+HEADER = struct.Struct("!BBBI")         # magic, version, type, switch id
+COUNT = struct.Struct("!I")             # number of entries
+SEQ_COUNT = struct.Struct("!II")        # sequence number, number of entries
+NEIGHBOR = struct.Struct("!IB4sH")      # neighbor id, alive, IPv4 address, port
+LINK = struct.Struct("!IB")             # neighbor id, alive
+ROUTE = struct.Struct("!Iii")           # dest, next hop, distance
+GROUP = struct.Struct("!IB")            # dest, number of next hops that follow
+STAMP = struct.Struct("!Q")             # probe send time, in microseconds of the prober's clock
+
+
+class Message:
+    """One decoded controller/switch message.
+
+    entries holds, depending on kind:
+      REGISTER_RESPONSE   (neighbor id, alive, (host, port) or None)
+      TOPOLOGY_UPDATE     (neighbor id, alive), or (neighbor id, alive, RTT in
+                          microseconds or None) from a switch that measures it
+      PROBE/PROBE_REPLY   the probe's send time, echoed by the reply
+      HEARTBEAT           neighbor id of every neighbor that is down
+      SHARD_SUMMARY       a dict describing the sending shard, see shard.py
+      ROUTE_ECMP          (dest, (next hop, next hop, ...)) per multipath dest
+      ROUTE_UPDATE/DELTA  (dest, next hop, distance)
+    """
+
+    __slots__ = ("kind", "sid", "seq", "entries", "features", "binary")
+
+    def __init__(self, kind, sid=None, seq=None, entries=(), features=(), binary=False):
+        self.kind = kind
+        self.sid = sid
+        self.seq = seq
+        self.entries = entries
+        self.features = features
+        self.binary = binary
+
+
+# ========== Text format ==========
+
+def encode_text(msg):
+    kind = msg.kind
+    if kind in (REGISTER_REQUEST, KEEP_ALIVE, ROUTE_RESYNC):
+        return " ".join([str(msg.sid), kind, *msg.features]).encode()
+    if kind in (HEARTBEAT, PROBE, PROBE_REPLY):
+        return " ".join([str(msg.sid), kind, *map(str, msg.entries)]).encode()
+    if kind == SHARD_SUMMARY:
+        return f"{kind} {msg.sid}\n{json.dumps(msg.entries, separators=(',', ':'))}".encode()
+    if kind == REGISTER_RESPONSE:
+        lines = [kind, str(len(msg.entries))]
+        for nid, alive, addr in msg.entries:
+            if alive and addr is not None:
+                lines.append(f"{nid} True {addr[0]} {addr[1]}")
+            else:
+                lines.append(f"{nid} False")
+    elif kind == TOPOLOGY_UPDATE:
+        lines = [kind, str(msg.sid)]
+        for entry in msg.entries:
+            metric = entry[2] if len(entry) > 2 else None
+            lines.append(f"{entry[0]} {bool(entry[1])}" if metric is None else f"{entry[0]} {bool(entry[1])} {metric}")
+    elif kind in (ROUTE_UPDATE, ROUTE_DELTA):
+        lines = [kind, str(msg.sid) if msg.seq is None else f"{msg.sid} {msg.seq}"]
+        lines.extend(f"{dest} {nh} {dist}" for dest, nh, dist in msg.entries)
+    elif kind == ROUTE_ECMP:
+        lines = [kind, str(msg.sid)]
+        lines.extend(" ".join(map(str, (dest, *hops))) for dest, hops in msg.entries)
+    else:
+        raise ValueError(f"unknown message type {kind}")
+    return "\n".join(lines).encode()
+
+
+def decode_text(data):
+    lines = data.decode().strip().split('\n')
+    first = lines[0].split()
+    if len(first) >= 2 and first[1] in (REGISTER_REQUEST, KEEP_ALIVE, ROUTE_RESYNC):
+        return Message(first[1], int(first[0]), features=tuple(first[2:]))
+    if len(first) >= 2 and first[1] in (HEARTBEAT, PROBE, PROBE_REPLY):
+        return Message(first[1], int(first[0]), entries=[int(x) for x in first[2:]])
+    if first[0] == SHARD_SUMMARY:
+        return Message(SHARD_SUMMARY, int(first[1]), entries=json.loads("\n".join(lines[1:])))
+    kind = lines[0]
+    if kind == REGISTER_RESPONSE:
+        entries = []
+        for line in lines[2:2 + int(lines[1])]:
+            parts = line.split()
+            if parts[1] == "True" and len(parts) >= 4:
+                entries.append((int(parts[0]), True, (parts[2], int(parts[3]))))
+            else:
+                entries.append((int(parts[0]), False, None))
+        return Message(kind, entries=entries)
+    if kind == TOPOLOGY_UPDATE:
+        entries = []
+        for line in lines[2:]:
+            parts = line.split()
+            if len(parts) >= 3:
+                entries.append((int(parts[0]), parts[1] == "True", int(parts[2])))
+            elif len(parts) >= 2:
+                entries.append((int(parts[0]), parts[1] == "True"))
+        return Message(kind, int(lines[1]), entries=entries)
+    if kind == ROUTE_ECMP:
+        entries = []
+        for line in lines[2:]:
+            parts = list(map(int, line.split()))
+            entries.append((parts[0], tuple(parts[1:])))
+        return Message(kind, int(lines[1]), entries=entries)
+    if kind in (ROUTE_UPDATE, ROUTE_DELTA):
+        header = lines[1].split()
+        seq = int(header[1]) if len(header) >= 2 else None
+        entries = []
+        for line in lines[2:]:
+            parts = line.split()
+            entries.append((int(parts[0]), int(parts[1]), int(parts[2])))
+        return Message(kind, int(header[0]), seq, entries)
+    return None
+
+
+# ========== Binary format ==========
+
+def encode_binary(msg):
+    kind = msg.kind
+    head = HEADER.pack(MAGIC, VERSION, KIND_CODES[kind], msg.sid if msg.sid is not None else 0)
+    if kind in (REGISTER_REQUEST, KEEP_ALIVE, ROUTE_RESYNC):
+        if msg.features:
+            return head + " ".join(msg.features).encode()
+        return head
+    entries = msg.entries
+    if kind == HEARTBEAT:
+        return head + COUNT.pack(len(entries)) + struct.pack(f"!{len(entries)}I", *entries)
+    if kind in (PROBE, PROBE_REPLY):
+        return head + STAMP.pack(entries[0])
+    if kind == SHARD_SUMMARY:
+        return head + json.dumps(entries, separators=(',', ':')).encode()
+    if kind == REGISTER_RESPONSE:
+        parts = [head, COUNT.pack(len(entries))]
+        for nid, alive, addr in entries:
+            if alive and addr is not None:
+                parts.append(NEIGHBOR.pack(nid, 1, socket.inet_aton(addr[0]), addr[1]))
+            else:
+                parts.append(NEIGHBOR.pack(nid, 0, b"\0\0\0\0", 0))
+        return b"".join(parts)
+    if kind == TOPOLOGY_UPDATE:
+        flat = [x for entry in entries for x in (entry[0], 1 if entry[1] else 0)]
+        data = head + COUNT.pack(len(entries)) + struct.pack("!" + "IB" * len(entries), *flat)
+        metrics = [entry[2] if len(entry) > 2 and entry[2] is not None else NO_METRIC for entry in entries]
+        if any(metric != NO_METRIC for metric in metrics):
+            # Trailing metrics, one per entry; decoders that predate them stop before
+            data += struct.pack(f"!{len(entries)}I", *metrics)
+        return data
+    if kind == ROUTE_ECMP:
+        parts = [head, COUNT.pack(len(entries))]
+        for dest, hops in entries:
+            parts.append(struct.pack(f"!IB{len(hops)}I", dest, len(hops), *hops))
+        return b"".join(parts)
+    if kind in (ROUTE_UPDATE, ROUTE_DELTA):
+        seq = NO_SEQ if msg.seq is None else msg.seq
+        flat = [x for entry in entries for x in entry]
+        return head + SEQ_COUNT.pack(seq, len(entries)) + struct.pack(f"!{len(entries) * 3}i", *flat)
+    raise ValueError(f"unknown message type {kind}")
+
+
+def decode_binary(data):
+    magic, version, code, sid = HEADER.unpack_from(data)
+    if version != VERSION or code not in CODE_KINDS:
+        return None
+    kind = CODE_KINDS[code]
+    body = memoryview(data)[HEADER.size:]
+    if kind in (REGISTER_REQUEST, KEEP_ALIVE, ROUTE_RESYNC):
+        features = tuple(bytes(body).decode().split()) if body else ()
+        return Message(kind, sid, features=features, binary=True)
+    if kind == HEARTBEAT:
+        (count,) = COUNT.unpack_from(body)
+        entries = list(struct.unpack_from(f"!{count}I", body, COUNT.size))
+        return Message(kind, sid, entries=entries, binary=True)
+    if kind in (PROBE, PROBE_REPLY):
+        return Message(kind, sid, entries=list(STAMP.unpack_from(body)), binary=True)
+    if kind == SHARD_SUMMARY:
+        return Message(kind, sid, entries=json.loads(bytes(body)), binary=True)
+    if kind == REGISTER_RESPONSE:
+        (count,) = COUNT.unpack_from(body)
+        entries = []
+        for nid, alive, ip, port in NEIGHBOR.iter_unpack(body[COUNT.size:COUNT.size + count * NEIGHBOR.size]):
+            if alive:
+                entries.append((nid, True, (socket.inet_ntoa(ip), port)))
+            else:
+                entries.append((nid, False, None))
+        return Message(kind, sid, entries=entries, binary=True)
+    if kind == TOPOLOGY_UPDATE:
+        (count,) = COUNT.unpack_from(body)
+        end = COUNT.size + count * LINK.size
+        entries = [(nid, alive == 1) for nid, alive in LINK.iter_unpack(body[COUNT.size:end])]
+        if len(body) >= end + 4 * count > end:
+            metrics = struct.unpack_from(f"!{count}I", body, end)
+            entries = [(nid, alive, None if metric == NO_METRIC else metric)
+                       for (nid, alive), metric in zip(entries, metrics)]
+        return Message(kind, sid, entries=entries, binary=True)
+    if kind == ROUTE_ECMP:
+        (count,) = COUNT.unpack_from(body)
+        pos = COUNT.size
+        entries = []
+        for _ in range(count):
+            dest, hop_cnt = GROUP.unpack_from(body, pos)
+            pos += GROUP.size
+            entries.append((dest, struct.unpack_from(f"!{hop_cnt}I", body, pos)))
+            pos += 4 * hop_cnt
+        return Message(kind, sid, entries=entries, binary=True)
+    seq, count = SEQ_COUNT.unpack_from(body)
+    entries = list(ROUTE.iter_unpack(body[SEQ_COUNT.size:SEQ_COUNT.size + count * ROUTE.size]))
+    return Message(kind, sid, None if seq == NO_SEQ else seq, entries, binary=True)
+
+
+# ============================================
+
+def encode(msg, binary=False):
+    """Encode msg in the binary format if binary is set, otherwise as text."""
+    return encode_binary(msg) if binary else encode_text(msg)
+
+
+def decode(data):
+    """Decode a datagram in either format. Returns None for unknown messages."""
+    try:
+        if data and data[0] == MAGIC:
+            return decode_binary(data)
+        return decode_text(data)
+    except (ValueError, IndexError, struct.error, UnicodeDecodeError, OSError):
+        return None
+
+
+# ========== Accounting ==========
+
+class TrafficStats:
+    """Datagrams and bytes sent and received, per message kind."""
+
+    def __init__(self):
+        self.sent = {}          # kind -> [datagrams, bytes]
+        self.received = {}
+
+    def count_sent(self, kind, size):
+        counts = self.sent.setdefault(kind, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+
+    def count_received(self, msg, size):
+        """Count a received datagram; msg is what decode() returned for it."""
+        counts = self.received.setdefault("invalid" if msg is None else msg.kind, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+
+    def add(self, other):
+        """Add the counts of another TrafficStats, e.g. of a switch hosted in the same process."""
+        for mine, theirs in ((self.sent, other.sent), (self.received, other.received)):
+            for kind, (datagrams, size) in theirs.items():
+                counts = mine.setdefault(kind, [0, 0])
+                counts[0] += datagrams
+                counts[1] += size
+
+    def stats(self):
+        """Return {"sent"|"received": {kind: {"messages", "bytes"}}} plus totals."""
+        result = {}
+        for direction, table in (("sent", self.sent), ("received", self.received)):
+            result[direction] = {kind: {"messages": d, "bytes": b} for kind, (d, b) in sorted(table.items())}
+            result[direction + "_messages"] = sum(d for d, _ in table.values())
+            result[direction + "_bytes"] = sum(b for _, b in table.values())
+        return result
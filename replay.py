@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+"""Offline route replay for the ECE50863 Lab Project 1 controller.
+
+Usage: python replay.py <config file> [<events file>] [--engine incremental|full] [--out <file>]
+                        [--compare <Controller.log>] [--random <events>] [--costs <fraction>] [--seed 1]
+
+Replays topology events against a config file without sockets, switches or
+timeouts and writes the blocks Controller.log would get: the Routing
+Update once every switch registered, then for every step its Switch Dead,
+Switch Alive and Link Dead lines followed by the new Routing Update. A
+step that changes nothing logs nothing, like a K second check that finds
+nothing. Events come from the events file, or stdin if it is "-":
+
+    kill <switch>           the switch times out
+    revive <switch>         the switch registers again
+    fail <switch> <switch>  a switch reports the link between them dead
+    restore <switch> <switch>
+    cost <switch> <switch> <cost>   the link gets a new cost
+    # comment
+
+Events on one line separated by ";" happen in the same K second check and
+share one Routing Update. State changes follow controller.py: a dead or
+revived switch takes its dead links with it, and a link only fails
+between two alive switches. A cost change reroutes like the controller's
+--rtt or admin cost changes, whatever state the link is in.
+
+--compare reads a Controller.log, e.g. from SampleLog/, and checks that
+its Switch Dead, Switch Alive, Link Dead and Routing Update blocks, without
+timestamps, are the replayed ones; the exit status is 1 if they differ.
+--random replays that many random events instead of an events file and
+reports events per second on stderr, to benchmark route engine changes;
+--costs makes that fraction of them cost changes of random links.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+
+from graph import Graph
+from routing import RouteEngine, compute_routes, link_key
+
+EVENTS = ("Switch Dead", "Switch Alive", "Link Dead", "Routing Update")
+
+
+def parse_events(lines):
+    """Yield the steps of an events file: lists of (verb, switch ids)."""
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        step = []
+        for event in line.split(';'):
+            parts = event.split()
+            if not parts:
+                continue
+            verb, ids = parts[0], parts[1:]
+            arity = {"kill": 1, "revive": 1, "fail": 2, "restore": 2, "cost": 3}.get(verb)
+            if arity is None or len(ids) != arity:
+                raise ValueError(f"line {number}: cannot parse event {event.strip()!r}")
+            step.append((verb, tuple(map(int, ids))))
+        yield step
+
+
+def random_steps(graph, count, seed, costs=0.0):
+    """Yield count single-event steps that kill, revive, fail, restore and, for a costs fraction, change costs at random."""
+    rng = random.Random(seed)
+    links = [(u, v) for u, v, _ in graph.links()]
+    alive = set(range(graph.n))
+    dead = set()
+    if graph.n < 2:
+        return  # Nothing can be killed or revived, and there are no links
+    produced = 0
+    while produced < count:
+        if links and rng.random() < costs:
+            step = [("cost", (*rng.choice(links), rng.randint(1, 10)))]
+        else:
+            kind = rng.random()
+            if kind < 0.25 and len(alive) > 1:
+                sid = rng.choice(sorted(alive))
+                alive.discard(sid)
+                step = [("kill", (sid,))]
+            elif 0.25 <= kind < 0.5 and len(alive) < graph.n:
+                sid = rng.choice(sorted(set(range(graph.n)) - alive))
+                alive.add(sid)
+                step = [("revive", (sid,))]
+            elif 0.5 <= kind < 0.75 and links:
+                lk = rng.choice(links)
+                dead.add(lk)
+                step = [("fail", lk)]
+            elif kind >= 0.75 and dead:
+                lk = rng.choice(sorted(dead))
+                dead.discard(lk)
+                step = [("restore", lk)]
+            else:
+                continue    # The draw is not possible in this state, draw again
+        produced += 1
+        yield step
+
+
+class Replay:
+    """The controller's view of the topology, driven by events instead of datagrams."""
+
+    def __init__(self, graph, engine="incremental"):
+        self.graph = graph
+        self.engine = RouteEngine(graph) if engine == "incremental" else None
+        self.alive = set(range(graph.n))
+        self.dead_links = set()
+        self.blocks = []    # Logged blocks, each a list of lines without the timestamp
+        self.lines = {}     # Source -> (its rows, their log lines), reused while the engine keeps the rows
+        self.steps = 0
+        self.updates = 0
+        self.trees_recomputed = 0
+        self.trees_repaired = 0
+
+    def routing_update(self):
+        lines = ["Routing Update"]
+        if self.engine is not None:
+            self.engine.compute(self.alive, self.dead_links)
+            self.trees_recomputed += len(self.engine.last_recomputed)
+            self.trees_repaired += len(self.engine.last_repaired)
+            for src in sorted(self.alive):
+                rows = self.engine.rows[src]
+                cached = self.lines.get(src)
+                if cached is None or cached[0] is not rows:
+                    cached = self.lines[src] = (rows, [f"{s},{d}:{h},{c}" for s, d, h, c in rows])
+                lines.extend(cached[1])
+        else:
+            all_routes, _ = compute_routes(self.graph, self.alive, self.dead_links)
+            lines.extend(f"{s},{d}:{h},{c}" for s, d, h, c in all_routes)
+        lines.append("Routing Complete")
+        self.blocks.append(lines)
+        self.updates += 1
+
+    def step(self, events):
+        """Apply the events of one K second check and log them like the controller."""
+        self.steps += 1
+        changed = False
+        for verb, ids in events:
+            if verb == "kill" and ids[0] in self.alive:
+                sid = ids[0]
+                self.alive.discard(sid)
+                self.blocks.append([f"Switch Dead {sid}"])
+                self.dead_links.difference_update({lk for lk in self.dead_links if sid in lk})
+                changed = True
+            elif verb == "revive" and 0 <= ids[0] < self.graph.n and ids[0] not in self.alive:
+                sid = ids[0]
+                self.alive.add(sid)
+                self.blocks.append([f"Switch Alive {sid}"])
+                self.dead_links.difference_update({lk for lk in self.dead_links if sid in lk})
+                changed = True
+            elif verb == "fail":
+                lk = link_key(*ids)
+                if (lk not in self.dead_links and lk[0] in self.alive and lk[1] in self.alive
+                        and self.graph.edge_id(*lk) is not None):
+                    self.dead_links.add(lk)
+                    self.blocks.append([f"Link Dead {lk[0]},{lk[1]}"])
+                    changed = True
+            elif verb == "restore":
+                lk = link_key(*ids)
+                if lk in self.dead_links:
+                    self.dead_links.discard(lk)
+                    changed = True
+            elif verb == "cost":
+                u, v, w = ids
+                old = self.graph.cost(u, v)
+                if old is not None and old != w and w > 0:
+                    if self.engine is not None:
+                        self.engine.set_cost(u, v, w)
+                    else:
+                        self.graph.set_cost(u, v, w)
+                    changed = True
+        if changed:
+            self.routing_update()
+
+    def write(self, out):
+        """Write the blocks in Controller.log's format, timestamped now."""
+        stamp = str(datetime.time(datetime.now()))
+        out.write("".join(f"\n\n{stamp}\n" + "\n".join(lines) + "\n" for lines in self.blocks))
+
+
+def log_blocks(path):
+    """Read the Switch/Link/Routing Update blocks of a Controller.log, without timestamps."""
+    blocks = []
+    current = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0].isdigit() and line.count(':') == 2 and ',' not in line:
+                continue    # Blank line or timestamp
+            if line.startswith(EVENTS):
+                current = [line]
+                blocks.append(current)
+            elif line.startswith("Register"):
+                current = None
+            elif current is not None and current[0] == "Routing Update":
+                current.append(line)
+    return blocks
+
+
+def compare(expected, got):
+    """Return a description of the first difference between two block lists, or None."""
+    for i, (want, have) in enumerate(zip(expected, got)):
+        if want != have:
+            return f"block {i + 1}: expected {' | '.join(want)}\n{'':>9}got {' | '.join(have)}"
+    if len(expected) != len(got):
+        return f"expected {len(expected)} blocks, replayed {len(got)}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay topology events offline and log the routing updates")
+    parser.add_argument("config")
+    parser.add_argument("events", nargs='?')
+    parser.add_argument("--engine", choices=("incremental", "full"), default="incremental")
+    parser.add_argument("--out", default="-")
+    parser.add_argument("--compare")
+    parser.add_argument("--random", type=int, default=0)
+    parser.add_argument("--costs", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    graph = Graph.from_config(args.config)
+    if args.random:
+        steps = list(random_steps(graph, args.random, args.seed, args.costs))
+    elif args.events is None or args.events == '-':
+        steps = list(parse_events(sys.stdin))
+    else:
+        with open(args.events) as f:
+            steps = list(parse_events(f))
+
+    replay = Replay(graph, args.engine)
+    t0 = time.perf_counter()
+    replay.routing_update()     # Every switch registered
+    for events in steps:
+        replay.step(events)
+    elapsed = time.perf_counter() - t0
+
+    if args.out == '-':
+        replay.write(sys.stdout)
+    elif args.out:
+        with open(args.out, 'w') as f:
+            replay.write(f)
+    if args.random:
+        trees = (f", {replay.trees_recomputed} trees recomputed, {replay.trees_repaired} repaired"
+                 if replay.engine is not None else "")
+        print(f"{len(steps)} events, {replay.updates} routing updates in {elapsed:.3f} s: "
+              f"{len(steps) / elapsed:.0f} events/s{trees}", file=sys.stderr)
+    if args.compare:
+        diff = compare(log_blocks(args.compare), replay.blocks)
+        if diff is not None:
+            print(f"{args.compare} differs at {diff}", file=sys.stderr)
+            sys.exit(1)
+        print(f"{args.compare}: {len(replay.blocks)} blocks match", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
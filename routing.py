@@ -0,0 +1,809 @@
+#!/usr/bin/env python
+
+"""Route computation for the ECE50863 Lab Project 1 controller.
+
+compute_routes() is the reference full recompute: one Dijkstra from every
+alive switch over the live switches and links of a graph.Graph, or one
+NumPy Floyd-Warshall pass when that is cheaper (see use_matrix()). With a
+SourcePool the per-source Dijkstra runs are spread over forked workers. RouteEngine produces exactly the same
+rows, but keeps every source's shortest-path tree between calls and repairs
+only the part of each tree that a topology change or a link cost change
+(RouteEngine.set_cost()) moves.
+
+Both rely on the same tie-breaking: with positive link costs Dijkstra settles
+switches in (distance, id) order, so the parent of a switch is always its
+tight neighbor with the smallest (distance, id). Repaired trees pick parents
+the same way, which is what makes the incremental output identical.
+equal_cost_groups() lists the other tight neighbors too, for ECMP switches.
+"""
+
+import gc
+import heapq
+import multiprocessing
+from array import array
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+except ImportError:     # The matrix backend is optional
+    np = None
+
+INF = float('inf')
+
+# "auto" picks the matrix backend when NumPy is installed and it is expected
+# to be cheaper than one heapq Dijkstra per source; "heapq" or "matrix" force one
+BACKEND = "auto"
+MATRIX_MAX_SWITCHES = 2000      # Keeps the few n x n int64 matrices around 160 MB
+DIJKSTRA_COST_RATIO = 100       # Cost of one heapq relaxation over one Floyd-Warshall cell update
+MATRIX_STEP_COST = 5000         # NumPy call overhead of one Floyd-Warshall step, in cell updates
+TREE_CACHE_ENTRIES = 0          # Route entries (trees x switches) RouteEngine's TreeCache may hold, 0 for none
+REPAIR_MIN_SWITCHES = 10        # With fewer alive switches a touched tree is cheaper to rerun than to repair
+POOL_MIN_SOURCES = 16           # Fewer stale sources than this are cheaper to run in-process
+
+
+def link_key(u, v):
+    """Return the canonical (low, high) key used for links."""
+    return (u, v) if u < v else (v, u)
+
+
+def dijkstra(graph, src):
+    """Run Dijkstra from src over the live switches and links of graph.
+
+    Returns (dists, parents, first_hops) holding only reachable switches.
+    first_hops[v] is the neighbor of src on the path to v.
+    """
+    offsets, targets, weights, edge_ids = graph.offsets, graph.targets, graph.weights, graph.edge_ids
+    node_live, edge_live = graph.node_live, graph.edge_live
+    dists = {src: 0}
+    parents = {src: None}
+    first_hops = {src: src}
+    pq = [(0, src)]
+    visited = set()
+
+    while pq:
+        d, u = heapq.heappop(pq)
+        if u in visited:
+            continue
+        visited.add(u)
+        p = parents[u]
+        if p is not None:
+            first_hops[u] = u if p == src else first_hops[p]
+        for i in range(offsets[u], offsets[u + 1]):
+            v = targets[i]
+            if v in visited or not node_live[v] or not edge_live[edge_ids[i]]:
+                continue
+            nd = d + weights[i]
+            if nd < dists.get(v, INF):
+                dists[v] = nd
+                parents[v] = u
+                heapq.heappush(pq, (nd, v))
+
+    return dists, parents, first_hops
+
+
+def matrix_shortest_paths(graph, sources):
+    """All-pairs Floyd-Warshall over the live part of graph with NumPy.
+
+    Returns {src: (dists, parents, first_hops)} exactly as dijkstra() would:
+    the parent of a switch is its tight neighbor with the smallest
+    (distance, id), and first hops follow those parents back to src.
+    """
+    node_live = np.frombuffer(graph.node_live, dtype=np.uint8).astype(bool)
+    nodes = np.flatnonzero(node_live)
+    index = np.full(graph.n, -1, dtype=np.int64)
+    index[nodes] = np.arange(len(nodes))
+    na = len(nodes)
+    big = np.iinfo(np.int64).max // 4
+
+    edge_u = np.frombuffer(graph.edge_u, dtype=np.intc)
+    edge_v = np.frombuffer(graph.edge_v, dtype=np.intc)
+    edge_w = np.frombuffer(graph.edge_w, dtype=np.longlong).astype(np.int64)
+    up = (np.frombuffer(graph.edge_live, dtype=np.uint8).astype(bool)
+          & node_live[edge_u] & node_live[edge_v])
+    iu, iv, w = index[edge_u[up]], index[edge_v[up]], edge_w[up]
+
+    dist = np.full((na, na), big, dtype=np.int64)
+    dist[iu, iv] = w
+    dist[iv, iu] = w
+    np.fill_diagonal(dist, 0)
+    for k in range(na):
+        np.minimum(dist, dist[:, k:k + 1] + dist[k:k + 1, :], out=dist)
+
+    # Canonical parents: neighbors are grouped by switch and sorted by id, so
+    # argmin over the distances of the tight ones picks the smallest (distance, id)
+    order = np.lexsort((np.concatenate([iu, iv]), np.concatenate([iv, iu])))
+    heads = np.concatenate([iv, iu])[order]
+    tails = np.concatenate([iu, iv])[order]
+    costs = np.concatenate([w, w])[order]
+    bounds = np.searchsorted(heads, np.arange(na + 1))
+    parent = np.full((na, na), -1, dtype=np.int64)
+    for v in range(na):
+        lo, hi = bounds[v], bounds[v + 1]
+        if lo == hi:
+            continue
+        nbrs = tails[lo:hi]
+        via = dist[:, nbrs]
+        tight = (via + costs[lo:hi] == dist[:, v:v + 1]) & (dist[:, v:v + 1] < big)
+        pick = np.argmin(np.where(tight, via, big), axis=1)
+        parent[:, v] = np.where(tight.any(axis=1), nbrs[pick], -1)
+    rows = np.arange(na)
+    parent[rows, rows] = rows
+
+    # First hop: walk every switch up to the child of src by pointer doubling
+    hop = np.where((parent == rows[:, None]) | (parent < 0), rows[None, :], parent)
+    while True:
+        nxt = np.take_along_axis(hop, hop, axis=1)
+        if np.array_equal(nxt, hop):
+            break
+        hop = nxt
+
+    ids = nodes.tolist()
+    results = {}
+    for src in sources:
+        s = index[src]
+        reach = np.flatnonzero(dist[s] < big)
+        dests = [ids[j] for j in reach.tolist()]
+        dists = dict(zip(dests, dist[s, reach].tolist()))
+        parents = dict(zip(dests, [ids[j] for j in parent[s, reach].tolist()]))
+        first_hops = dict(zip(dests, [ids[j] for j in hop[s, reach].tolist()]))
+        parents[src] = None
+        results[src] = (dists, parents, first_hops)
+    return results
+
+
+def use_matrix(graph, source_cnt):
+    """Decide whether source_cnt Dijkstra runs should be replaced by one matrix pass."""
+    if np is None or BACKEND == "heapq" or source_cnt == 0:
+        return False
+    if BACKEND == "matrix":
+        return True
+    n = graph.node_live.count(1)
+    if n > MATRIX_MAX_SWITCHES:
+        return False
+    return source_cnt * (2 * graph.m + n) * DIJKSTRA_COST_RATIO >= n ** 3 + MATRIX_STEP_COST * n
+
+
+# Graph inherited by SourcePool workers through fork
+_POOL_GRAPH = None
+
+
+def _dijkstra_chunk(node_live, edge_live, costs, sources, tables):
+    """Worker side of SourcePool: adopt the controller's liveness bits and link costs and run sources.
+
+    Results go back as flat arrays, which pickle as one bytes object each
+    where a dict pickles every int: per source (src, dests, dists, parents,
+    first_hops) of the reachable switches, or with tables (src, next_hops,
+    dists) holding the source_rows() entry of every switch.
+    """
+    graph = _POOL_GRAPH
+    graph.node_live[:] = node_live
+    graph.edge_live[:] = edge_live
+    for e, w in costs:
+        if graph.edge_w[e] != w:
+            graph.set_cost(graph.edge_u[e], graph.edge_v[e], w)
+    results = []
+    for src in sources:
+        dists, parents, first_hops = dijkstra(graph, src)
+        if tables:
+            # Only live switches are reachable, so the rest keeps source_rows()'s (-1, 9999)
+            next_hops = array('i', [-1]) * graph.n
+            table_dists = array('q', [9999]) * graph.n
+            for v, d in dists.items():
+                next_hops[v] = first_hops[v]
+                table_dists[v] = d
+            results.append((src, next_hops, table_dists))
+        else:
+            dests = array('i', dists)
+            results.append((src, dests, array('q', dists.values()),
+                            array('i', [-1 if v == src else parents[v] for v in dests]),
+                            array('i', [first_hops[v] for v in dests])))
+    return results
+
+
+class SourcePool:
+    """Runs per-source Dijkstra on a pool of forked worker processes.
+
+    The workers are forked once, right after the graph is built, so each one
+    shares the CSR arrays copy-on-write. A computation only ships the
+    liveness bitmaps, the costs changed since, and a chunk of sources to
+    every worker. The workers send back flat arrays: whole trees for run(),
+    or just the route tables for tables().
+    """
+
+    def __init__(self, graph, workers):
+        global _POOL_GRAPH
+        _POOL_GRAPH = graph
+        self.graph = graph
+        self.workers = workers
+        self.pool = multiprocessing.get_context("fork").Pool(workers)
+
+    def run(self, sources):
+        """Return {src: (dists, parents, first_hops)} for sources."""
+        results = {}
+        for src, dests, dists, parents, first_hops in self._map(sources, False):
+            dests = dests.tolist()
+            parents = dict(zip(dests, parents.tolist()))
+            parents[src] = None
+            results[src] = (dict(zip(dests, dists.tolist())), parents, dict(zip(dests, first_hops.tolist())))
+        return results
+
+    def tables(self, sources):
+        """Return [(src, next_hops, dists)] for sources, arrays of the source_rows() entry of every switch."""
+        return list(self._map(sources, True))
+
+    def _map(self, sources, tables):
+        node_live = bytes(self.graph.node_live)
+        edge_live = bytes(self.graph.edge_live)
+        costs = tuple(self.graph.changed_costs.items())
+        chunk = -(-len(sources) // (4 * self.workers))
+        tasks = [(node_live, edge_live, costs, sources[i:i + chunk], tables) for i in range(0, len(sources), chunk)]
+        for part in self.pool.starmap(_dijkstra_chunk, tasks):
+            yield from part
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def source_pool(graph, workers):
+    """Return a SourcePool with workers processes, or None if that is not possible here."""
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return SourcePool(graph, workers)
+
+
+def shortest_paths(graph, sources, pool=None):
+    """Return {src: (dists, parents, first_hops)} for sources from the cheaper backend."""
+    if use_matrix(graph, len(sources)):
+        return matrix_shortest_paths(graph, sources)
+    if pool is not None and len(sources) >= POOL_MIN_SOURCES:
+        return pool.run(sources)
+    return {src: dijkstra(graph, src) for src in sources}
+
+
+def source_rows(src, switch_cnt, alive_switches, dists, first_hops):
+    """Build the [switch, dest, next_hop, dist] rows and (dest, next_hop, dist) table of src."""
+    rows = []
+    table = []
+    for dest in range(switch_cnt):
+        if dest == src:
+            entry = (dest, src, 0)
+        elif dest not in alive_switches or dest not in dists:
+            entry = (dest, -1, 9999)
+        else:
+            entry = (dest, first_hops[dest], dists[dest])
+        rows.append([src, *entry])
+        table.append(entry)
+    return rows, table
+
+
+def patch_rows(src, rows, table, dests, alive_switches, dists, first_hops):
+    """Return copies of the rows and table source_rows() built for src with the entries of dests rebuilt."""
+    rows = list(rows)
+    table = list(table)
+    for dest in dests:
+        if dest == src:
+            continue
+        if dest not in alive_switches or dest not in dists:
+            entry = (dest, -1, 9999)
+        else:
+            entry = (dest, first_hops[dest], dists[dest])
+        rows[dest] = [src, *entry]
+        table[dest] = entry
+    return rows, table
+
+
+def route_links(dest, start, switch_tables):
+    """Return how many links the route from start to dest takes, or None if it leaves switch_tables."""
+    links = 0
+    while start != dest:
+        table = switch_tables.get(start)
+        if table is None or table[dest][1] < 0:
+            return None
+        start = table[dest][1]
+        links += 1
+    return links
+
+
+def equal_cost_groups(graph, src, switch_tables, dead_links):
+    """Return [(dest, next hops)] for every dest src reaches over several equal-cost neighbors.
+
+    A neighbor v is a next hop towards dest when the link to it is up and
+    cost(src, v) + dist(v, dest) == dist(src, dest). dist(v, dest) is read from
+    v's own table, so this works on the tables of any engine or shard. Every
+    hop along such a path gets strictly closer to dest, so hashing flows
+    over the groups cannot loop.
+
+    Of those only the neighbors whose own route has the fewest links are
+    kept, and the group is only used if the table's next hop is one of them.
+    A flow then crosses as many links as the single-path route, where an
+    equal-cost path over more links, like 0-1-2-3 against 0-3 in
+    graph_6.txt, would load more links with every flow moved to it.
+    """
+    hops = [(v, w, switch_tables[v]) for v, w, _ in graph.neighbors(src)
+            if v in switch_tables and link_key(src, v) not in dead_links]
+    if len(hops) < 2:
+        return []
+    groups = []
+    for dest, nh, dist in switch_tables[src]:
+        if nh < 0 or dest == src:
+            continue
+        group = tuple(v for v, w, table in hops if table[dest][1] >= 0 and w + table[dest][2] == dist)
+        if len(group) < 2 or nh not in group:
+            continue
+        links = [route_links(dest, v, switch_tables) for v in group]
+        if None not in links:
+            group = tuple(v for v, n in zip(group, links) if n == links[group.index(nh)])
+        if len(group) > 1:
+            groups.append((dest, group))
+    return groups
+
+
+@contextmanager
+def gc_paused():
+    """Keep the cyclic garbage collector out of a burst of allocations that form no cycles.
+
+    n * n route rows are that many small lists, and every few hundred
+    thousand of them would otherwise start a collection that walks all the
+    ones before.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def compute_routes(graph, alive_switches, dead_links, pool=None):
+    """Compute shortest paths using Dijkstra on the effective topology."""
+    graph.apply_state(alive_switches, dead_links)
+
+    all_routes = []
+    switch_tables = {}
+
+    sources = sorted(alive_switches)
+    if pool is not None and len(sources) >= POOL_MIN_SOURCES and not use_matrix(graph, len(sources)):
+        # No tree is kept, so the workers only send back the tables
+        dests = range(graph.n)
+        with gc_paused():
+            for src, next_hops, dists in pool.tables(sources):
+                table = list(zip(dests, next_hops.tolist(), dists.tolist()))
+                all_routes.extend([[src, dest, hop, dist] for dest, hop, dist in table])
+                switch_tables[src] = table
+        return all_routes, switch_tables
+
+    trees = shortest_paths(graph, sources, pool)
+    with gc_paused():
+        for src in sources:
+            dists, _, first_hops = trees[src]
+            rows, table = source_rows(src, graph.n, alive_switches, dists, first_hops)
+            all_routes.extend(rows)
+            switch_tables[src] = table
+
+    return all_routes, switch_tables
+
+
+class ShortestPathTree:
+    """Dijkstra result of one source, kept between recomputations."""
+
+    def __init__(self, src, dists, parents, first_hops):
+        self.src = src
+        self.dists = dists
+        self.parents = parents
+        self.first_hops = first_hops
+        # Switches that are the parent of at least one other switch
+        self.internal = {p for p in parents.values() if p is not None}
+        self.touched = False
+        self.moved = set()      # Switches whose route may have changed since touched was cleared
+        self.shared = False     # Also held by a TreeCache, copy before repairing
+
+    def subtrees(self, roots):
+        """Return roots and every switch below them."""
+        if not any(r in self.internal for r in roots):
+            return set(roots)
+        children = defaultdict(list)
+        for v, p in self.parents.items():
+            children[p].append(v)
+        below = set()
+        stack = list(roots)
+        while stack:
+            v = stack.pop()
+            if v not in below:
+                below.add(v)
+                stack.extend(children[v])
+        return below
+
+    def copy(self):
+        tree = ShortestPathTree.__new__(ShortestPathTree)
+        tree.src = self.src
+        tree.dists = dict(self.dists)
+        tree.parents = dict(self.parents)
+        tree.first_hops = dict(self.first_hops)
+        tree.internal = set(self.internal)
+        tree.touched = False
+        tree.moved = set()
+        tree.shared = False
+        return tree
+
+
+class TreeCache:
+    """LRU cache of (tree, rows, table) per source, keyed by topology version.
+
+    A version is the exact set of alive switches and dead links, plus the
+    graph's cost_version since any cost change may move routes. A tree is
+    only valid for the version it was computed for, so a hit needs that
+    exact state again; that is what happens when a switch restarts with all
+    its links intact, and the whole recomputation becomes lookups.
+
+    Every tree costs memory in proportion to the number of switches, so the
+    capacity counts route entries, one per tree and destination: a full
+    topology version of n switches takes n * n of them.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()    # (version, src) -> (tree, rows, table)
+        self.size = 0                   # Route entries held
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, version, src):
+        entry = self.entries.get((version, src))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((version, src))
+        self.hits += 1
+        return entry
+
+    def put(self, version, src, entry):
+        key = (version, src)
+        if len(entry[2]) > self.capacity:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[2])
+        entry[0].shared = True
+        self.entries[key] = entry
+        self.size += len(entry[2])
+        while self.size > self.capacity:
+            _, (_, _, table) = self.entries.popitem(last=False)
+            self.size -= len(table)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "trees": len(self.entries),
+            "entries": self.size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class RouteEngine:
+    """Incremental all-pairs route engine.
+
+    compute() takes the current alive switches and dead links, diffs them
+    against the previous call and repairs every source's tree instead of
+    rerunning Dijkstra, in two steps:
+      - removals: a switch that died, a link that went away or got costlier
+        only moves the switches below it in the tree. Those are dropped and
+        rejoined to the rest by a Dijkstra over just them.
+      - additions: a switch or link that came up, or a link that got cheaper,
+        lowers distances outward from its ends. A Dijkstra that only
+        follows lowered distances finds those, then the switches next to
+        them get their parent picked again, and the switches below every
+        switch whose distance or parent moved get their first hop again.
+    The first step sees the state without the additions, so each step starts
+    from an exact tree. Parents are always picked like dijkstra() does, as
+    the tight neighbor with the smallest (distance, id), so the rows equal
+    compute_routes()'s. Only new sources run a full Dijkstra, and with fewer
+    than REPAIR_MIN_SWITCHES alive switches every tree a change touches.
+    With cache_entries > 0, trees are first looked up in a TreeCache for the
+    exact topology version, so returning to an earlier state reruns nothing.
+    A cached tree is only copied when it is about to be repaired.
+    """
+
+    def __init__(self, graph, pool=None, cache_entries=TREE_CACHE_ENTRIES):
+        self.graph = graph
+        self.switch_cnt = graph.n
+        self.pool = pool
+        self.cache = TreeCache(cache_entries) if cache_entries > 0 else None
+        self.alive = set()
+        self.dead_links = set()
+        self.trees = {}
+        self.rows = {}
+        self.tables = {}
+        self.last_recomputed = set()
+        self.last_repaired = set()
+        self.last_changed = set()
+        self.last_cached = set()
+        self.cost_changes = {}      # Link -> cost before the first set_cost() since the last compute()
+        self.primed = False
+
+    def set_cost(self, u, v, w):
+        """Change the cost of link u-v; the next compute() reroutes around it.
+
+        Returns the old cost, or None if the link is not configured.
+        """
+        old = self.graph.set_cost(u, v, w)
+        if old is not None and old != w:
+            self.cost_changes.setdefault(link_key(u, v), old)
+        return old
+
+    def _is_effective(self, lk, alive, dead_links):
+        u, v = lk
+        return u in alive and v in alive and lk not in dead_links and self.graph.edge_id(u, v) is not None
+
+    def _link_changes(self, alive, dead_links):
+        """Return (removed_links, added_links) between the previous and new state."""
+        candidates = set(dead_links ^ self.dead_links)
+        for sid in alive ^ self.alive:
+            for nid in self.graph.neighbor_ids(sid):
+                candidates.add(link_key(sid, nid))
+        removed = []
+        added = []
+        for lk in sorted(candidates):
+            was = self._is_effective(lk, self.alive, self.dead_links)
+            now = self._is_effective(lk, alive, dead_links)
+            if was and not now:
+                removed.append(lk)
+            elif now and not was:
+                added.append(lk)
+        return removed, added
+
+    def _cost_changes(self, alive, dead_links):
+        """Return (raised, lowered) links that are up before and after and changed cost.
+
+        lowered holds (link, old cost). A link that just came up or went
+        down is already one of the added or removed links.
+        """
+        raised = []
+        lowered = []
+        for lk, old in sorted(self.cost_changes.items()):
+            if not (self._is_effective(lk, self.alive, self.dead_links) and self._is_effective(lk, alive, dead_links)):
+                continue
+            w = self.graph.cost(*lk)
+            if w > old:
+                raised.append(lk)
+            elif w < old:
+                lowered.append((lk, old))
+        self.cost_changes = {}
+        return raised, lowered
+
+    def _reparent(self, tree, switches, hidden_edges=(), old_weights=None):
+        """Pick the parent and first hop of switches, whose distances are final, like dijkstra() does.
+
+        A switch's parent must not be among switches unless it comes first
+        by distance. Returns the switches whose parent changed.
+        """
+        graph = self.graph
+        offsets, targets, weights, edge_ids = graph.offsets, graph.targets, graph.weights, graph.edge_ids
+        edge_live = graph.edge_live
+        dists, parents, first_hops, src = tree.dists, tree.parents, tree.first_hops, tree.src
+        moved = []
+        for d, v in sorted((dists[v], v) for v in switches):
+            parent = None
+            for i in range(offsets[v], offsets[v + 1]):
+                u = targets[i]
+                du = dists.get(u)
+                e = edge_ids[i]
+                if du is None or not edge_live[e] or e in hidden_edges:
+                    continue
+                w = weights[i] if old_weights is None else old_weights.get(e, weights[i])
+                if du + w == d and (parent is None or du < dists[parent]):
+                    parent = u  # Neighbors come by id, so the first of the closest ones wins
+            if parent != parents.get(v):
+                parents[v] = parent
+                moved.append(v)
+            first_hops[v] = v if parent == src else first_hops[parent]
+        return moved
+
+    def _repair_removals(self, tree, roots, hidden_nodes, hidden_edges, old_weights):
+        """Rebuild the part of tree below roots, the switches whose tree path lost a switch or link or got costlier.
+
+        Every other switch keeps its distance and parent. The switches and
+        links that came up are hidden and lowered links keep their old cost,
+        since _repair_additions() applies those next.
+        """
+        graph = self.graph
+        offsets, targets, weights, edge_ids = graph.offsets, graph.targets, graph.weights, graph.edge_ids
+        node_live, edge_live = graph.node_live, graph.edge_live
+        dists, parents, first_hops = tree.dists, tree.parents, tree.first_hops
+        below = tree.subtrees(roots)
+        for v in below:
+            del dists[v], parents[v], first_hops[v]
+        tree.moved |= below
+
+        # Join the switches below back to the rest of the tree, closest first
+        pq = []
+        for v in below:
+            if not node_live[v] or v in hidden_nodes:
+                continue
+            best = INF
+            for i in range(offsets[v], offsets[v + 1]):
+                du = dists.get(targets[i])
+                e = edge_ids[i]
+                if du is not None and edge_live[e] and e not in hidden_edges:
+                    best = min(best, du + old_weights.get(e, weights[i]))
+            if best < INF:
+                pq.append((best, v))
+        heapq.heapify(pq)
+        settled = []
+        while pq:
+            d, v = heapq.heappop(pq)
+            if v in dists:
+                continue
+            dists[v] = d
+            settled.append(v)
+            for i in range(offsets[v], offsets[v + 1]):
+                x = targets[i]
+                e = edge_ids[i]
+                if x in below and x not in dists and node_live[x] and edge_live[e] and e not in hidden_edges:
+                    heapq.heappush(pq, (d + old_weights.get(e, weights[i]), x))
+        self._reparent(tree, settled, hidden_edges, old_weights)
+        tree.internal = {p for p in parents.values() if p is not None}
+        tree.touched = True
+
+    def _addition_seeds(self, tree, added_edges):
+        """Return (distance, switch) of every end of added or cheaper links (u, v, link id) that gets closer or ties."""
+        dists, edge_w = tree.dists, self.graph.edge_w
+        seeds = []
+        for u, v, e in added_edges:
+            w = edge_w[e]
+            for a, b in ((u, v), (v, u)):
+                da = dists.get(a)
+                if da is not None and da + w <= dists.get(b, INF):
+                    seeds.append((da + w, b))   # A shorter path, or a tie that may win the parent
+        return seeds
+
+    def _repair_additions(self, tree, added_edges):
+        """Lower the distances that added or cheaper links (u, v, link id) bring, and move parents to them.
+
+        Returns False without touching tree if no link can change it.
+        """
+        graph = self.graph
+        offsets, targets, weights, edge_ids = graph.offsets, graph.targets, graph.weights, graph.edge_ids
+        node_live, edge_live = graph.node_live, graph.edge_live
+        pq = self._addition_seeds(tree, added_edges)
+        if not pq:
+            return False
+        ends = [v for _, v in pq]
+        if tree.shared:
+            tree = self.trees[tree.src] = tree.copy()   # The cache keeps the unrepaired tree
+        dists, parents, first_hops = tree.dists, tree.parents, tree.first_hops
+
+        heapq.heapify(pq)
+        lowered = set()
+        while pq:
+            d, v = heapq.heappop(pq)
+            if d >= dists.get(v, INF):
+                continue
+            dists[v] = d
+            lowered.add(v)
+            for i in range(offsets[v], offsets[v + 1]):
+                x = targets[i]
+                if node_live[x] and edge_live[edge_ids[i]] and d + weights[i] < dists.get(x, INF):
+                    heapq.heappush(pq, (d + weights[i], x))
+
+        # Only switches next to a lowered one or at the end of a new link gain a tight neighbor
+        candidates = set(lowered)
+        candidates.update(ends)
+        for v in lowered:
+            for i in range(offsets[v], offsets[v + 1]):
+                if targets[i] in dists:
+                    candidates.add(targets[i])
+        candidates.discard(tree.src)
+        moved = set(self._reparent(tree, candidates))
+        moved |= lowered
+        if moved:
+            tree.internal = {p for p in parents.values() if p is not None}
+            below = tree.subtrees(moved)
+            for _, v in sorted((dists[v], v) for v in below):
+                p = parents[v]
+                first_hops[v] = v if p == tree.src else first_hops[p]
+            tree.moved |= below
+        tree.touched = True
+        return True
+
+    def compute(self, alive_switches, dead_links):
+        """Return (all_routes, switch_tables) exactly as compute_routes() would."""
+        alive = set(alive_switches)
+        dead_links = set(dead_links)
+        removed_nodes = self.alive - alive
+        added_nodes = alive - self.alive
+        removed_links, added_links = self._link_changes(alive, dead_links)
+        raised, lowered = self._cost_changes(alive, dead_links)
+
+        self.graph.apply_state(alive, dead_links)
+        edge_id = self.graph.edge_id
+        hidden_edges = {edge_id(*lk) for lk in added_links}
+        old_weights = {edge_id(*lk): old for lk, old in lowered}
+        added_edges = [(*lk, edge_id(*lk)) for lk in added_links] + [(*lk, edge_id(*lk)) for lk, _ in lowered]
+        cut_links = removed_links + raised
+        repair = len(alive) >= REPAIR_MIN_SWITCHES
+        version = (frozenset(alive), frozenset(dead_links), self.graph.cost_version)
+        cached = {}
+        stale = []
+        repaired = set()
+        for src in sorted(alive):
+            entry = self.cache.get(version, src) if self.cache is not None else None
+            if entry is not None:
+                cached[src] = entry
+                continue
+            tree = self.trees.get(src)
+            if tree is None or not self.primed:
+                stale.append(src)
+                continue
+            tree.touched = False
+            tree.moved = set()
+            roots = [sid for sid in removed_nodes if sid in tree.dists]
+            for u, v in cut_links:
+                if tree.parents.get(v) == u:
+                    roots.append(v)
+                elif tree.parents.get(u) == v:
+                    roots.append(u)
+            if not repair:
+                if roots or (added_edges and self._addition_seeds(tree, added_edges)):
+                    stale.append(src)
+                continue
+            if roots:
+                if tree.shared:
+                    tree = self.trees[src] = tree.copy()    # The cache keeps the unrepaired tree
+                self._repair_removals(tree, roots, added_nodes, hidden_edges, old_weights)
+            if added_edges:
+                self._repair_additions(tree, added_edges)
+            if self.trees[src].touched:
+                repaired.add(src)
+        for src, result in shortest_paths(self.graph, stale, self.pool).items():
+            self.trees[src] = ShortestPathTree(src, *result)
+        recomputed = set(stale)
+
+        changed = set()
+        for src in sorted(alive):
+            if src in cached:
+                tree, rows, table = cached[src]
+                self.trees[src] = tree
+            else:
+                tree = self.trees[src]
+                if src in recomputed or src not in self.rows:
+                    rows, table = source_rows(src, self.switch_cnt, alive, tree.dists, tree.first_hops)
+                elif tree.touched:
+                    rows, table = patch_rows(src, self.rows[src], self.tables[src], tree.moved, alive,
+                                             tree.dists, tree.first_hops)
+                else:
+                    rows, table = self.rows[src], self.tables[src]
+                if self.cache is not None:
+                    self.cache.put(version, src, (tree, rows, table))
+            if self.tables.get(src) is not table and self.tables.get(src) != table:
+                changed.add(src)
+            self.rows[src] = rows
+            self.tables[src] = table
+
+        for sid in removed_nodes:
+            self.trees.pop(sid, None)
+            self.rows.pop(sid, None)
+            self.tables.pop(sid, None)
+
+        self.alive = alive
+        self.dead_links = dead_links
+        self.primed = True
+        self.last_recomputed = recomputed
+        self.last_repaired = repaired
+        self.last_cached = set(cached)
+        self.last_changed = changed
+
+        all_routes = []
+        switch_tables = {}
+        for src in sorted(alive):
+            all_routes.extend(self.rows[src])
+            switch_tables[src] = self.tables[src]
+        return all_routes, switch_tables
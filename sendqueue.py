@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""Outbound datagram queue for the controller.
+
+With --send-queue, Controller.send_message() only encodes a message and puts
+it on a SendQueue; a writer drains the queue outside the controller lock, so
+pushing routes to every switch no longer holds up the receiver. Datagrams
+wait in one FIFO per priority and the writer always takes from the most
+urgent non-empty one: REGISTER_RESPONSEs overtake a pending route fan-out.
+Order within a priority is kept, so ROUTE_DELTA sequence numbers reach each
+switch in order.
+
+The writer takes up to batch datagrams per wakeup and sends them back to
+back. Python exposes no sendmmsg(), so a batch is still one sendto() per
+datagram, but it costs one lock round trip instead of one per datagram.
+--pace <datagrams/s> adds a token bucket in front of the writer.
+
+In the threads runtime the writer is a thread (start_thread()); in the
+asyncio runtime it is a loop callback (start_loop()) that yields to
+datagram_received() between batches.
+"""
+
+import threading
+import time
+from collections import deque
+
+CONTROL = 0     # Register responses
+BULK = 1        # Route updates and deltas
+PRIORITIES = (CONTROL, BULK)
+
+
+class SendQueue:
+    """Per-priority FIFOs of (data, addr), drained in paced batches."""
+
+    def __init__(self, sendto, rate=0.0, batch=64):
+        self.sendto = sendto
+        self.rate = rate            # Datagrams per second, 0 for no pacing
+        self.batch = batch
+        self.queues = [deque() for _ in PRIORITIES]
+        self.cond = threading.Condition()
+        self.tokens = float(batch)
+        self.refilled = time.monotonic()
+        self.loop = None
+        self.scheduled = False
+        # Stats
+        self.sent = [0] * len(PRIORITIES)
+        self.batches = 0
+        self.max_depth = 0
+        self.wait_total = [0.0] * len(PRIORITIES)
+        self.wait_max = [0.0] * len(PRIORITIES)
+
+    def put(self, data, addr, priority=BULK):
+        with self.cond:
+            self.queues[priority].append((data, addr, time.monotonic()))
+            self.max_depth = max(self.max_depth, sum(len(q) for q in self.queues))
+            self.cond.notify()
+        if self.loop is not None and not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon(self._drain_loop)
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues)
+
+    def _take(self):
+        """Return (batch, delay): up to batch datagrams, or how long pacing wants us to wait."""
+        allowed = self.batch
+        if self.rate > 0:
+            now = time.monotonic()
+            self.tokens = min(float(self.batch), self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens < 1:
+                return [], (1 - self.tokens) / self.rate
+            allowed = min(allowed, int(self.tokens))
+        taken = []
+        now = time.monotonic()
+        for priority, queue in enumerate(self.queues):
+            while queue and len(taken) < allowed:
+                data, addr, queued = queue.popleft()
+                waited = now - queued
+                self.sent[priority] += 1
+                self.wait_total[priority] += waited
+                self.wait_max[priority] = max(self.wait_max[priority], waited)
+                taken.append((data, addr))
+        if self.rate > 0:
+            self.tokens -= len(taken)
+        if taken:
+            self.batches += 1
+        return taken, 0.0
+
+    def _send(self, batch):
+        for data, addr in batch:
+            try:
+                self.sendto(data, addr)
+            except OSError:
+                pass    # The switch went away; its timeout will notice
+
+    # ========== Writers ==========
+
+    def start_thread(self):
+        """Drain the queue from a writer thread."""
+        def writer():
+            while True:
+                with self.cond:
+                    while not len(self):
+                        self.cond.wait()
+                    batch, delay = self._take()
+                if batch:
+                    self._send(batch)
+                else:
+                    time.sleep(delay)
+        threading.Thread(target=writer, name="writer", daemon=True).start()
+
+    def start_loop(self, loop):
+        """Drain the queue from callbacks on an asyncio loop. put() must then run on that loop."""
+        self.loop = loop
+
+    def _drain_loop(self):
+        batch, delay = self._take()
+        self._send(batch)
+        if len(self):
+            self.loop.call_later(delay, self._drain_loop)
+        else:
+            self.scheduled = False
+
+    def stats(self):
+        return {
+            "queued": len(self),
+            "max_depth": self.max_depth,
+            "batches": self.batches,
+            "sent": {name: self.sent[p] for p, name in enumerate(("control", "bulk"))},
+            "wait_avg_ms": {name: self.wait_total[p] / self.sent[p] * 1000 if self.sent[p] else 0.0
+                            for p, name in enumerate(("control", "bulk"))},
+            "wait_max_ms": {name: self.wait_max[p] * 1000 for p, name in enumerate(("control", "bulk"))},
+        }
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""Sharded controllers for large topologies.
+
+Usage: python controller.py <port> <config file> --shards <port>,<port>,...
+
+With --shards one controller process runs per listed port, all reading the
+same config file. The shard listening on the i-th port owns the i-th
+contiguous range of switch ids (partition()) and logs to Controller<i>.log.
+Every switch registers with the shard that owns it; simulate.py --shards
+does that for the switches it hosts.
+
+A shard only sees its own switches. Every K seconds, and whenever its own
+state changed, it sends each peer a SHARD_SUMMARY of its partition:
+
+  alive      the switches it owns that are alive
+  addresses  (host, port) of its alive border switches, for Register Responses
+  dead       links that its switches report dead
+  dists      for every alive border switch b, the distance from b to each
+             switch of the shard using only links inside the shard
+
+Border switches are the ones with a link to another shard. A shard routes
+its own switches over an overlay made of its own switches and links, every
+link between shards, and for every other shard a clique over its alive
+border switches weighted with the summary distances. Any path splits into
+stretches inside one shard between border switches and links between
+shards, so the overlay gives exact distances to the shard's own switches
+and to every border switch. A switch d of another shard is then reached
+through the border switch b of that shard with the smallest
+dist(b) + dists[b][d].
+
+Those are the distances a single controller computes. Next hops are then
+taken from the configured links, with the tie-breaking of routing.py: the
+parent of a switch is its tight neighbor with the smallest (distance, id),
+and the first hop follows the parents back to the source. The overlay's
+own parents are not used, since its clique links are not real links. With
+every shard's dead links in the summaries, the routes are exactly the ones
+of a single controller.
+"""
+
+from bisect import bisect_right
+
+from graph import Graph
+from protocol import Message, SHARD_SUMMARY, encode
+from routing import link_key, shortest_paths, source_rows
+
+
+def partition(switch_cnt, shards, index):
+    """Return the range of switch ids owned by shard index out of shards."""
+    return range(index * switch_cnt // shards, (index + 1) * switch_cnt // shards)
+
+
+def parse_peers(spec, default_host='127.0.0.1'):
+    """Parse "port,host:port,..." into a list of (host, port)."""
+    peers = []
+    for item in spec.split(','):
+        host, _, port = item.rpartition(':')
+        peers.append((host or default_host, int(port)))
+    return peers
+
+
+class Shard:
+    """The partition a controller owns and what its peers last told it."""
+
+    def __init__(self, graph, peers, index):
+        self.graph = graph
+        self.peers = peers
+        self.index = index
+        n = graph.n
+        self.ranges = [partition(n, len(peers), i) for i in range(len(peers))]
+        self.starts = [r.start for r in self.ranges]
+        self.owned = self.ranges[index]
+        owned = self.owned
+        inside, self.cross = [], []
+        for u, v, w in graph.links():
+            if self.owner(u) == self.owner(v):
+                if u in owned:
+                    inside.append((u, v, w))
+            else:
+                self.cross.append((u, v, w))
+        self.borders = sorted({u for lk in self.cross for u in lk[:2] if u in owned})
+        self.local = Graph(n, inside)           # Links inside this shard only
+        self.overlay_links = inside + self.cross
+        self.local_state = None
+        self.local_dists = []
+        self.summaries = {}     # Peer index -> last SHARD_SUMMARY entries
+        self.heard = {}         # Peer index -> time of that summary
+        # Stats
+        self.summaries_sent = 0
+        self.summaries_received = 0
+
+    def owner(self, sid):
+        """Return the index of the shard that owns switch sid."""
+        return bisect_right(self.starts, sid) - 1
+
+    # ========== Own summary ==========
+
+    def summary(self, alive, dead_links, addresses, ready):
+        """Build the SHARD_SUMMARY entries describing this shard."""
+        state = (frozenset(alive), frozenset(dead_links))
+        if state != self.local_state:
+            self.local_state = state
+            self.local.apply_state(alive, {lk for lk in dead_links if self.owner(lk[0]) == self.owner(lk[1])})
+            sources = [b for b in self.borders if b in alive]
+            trees = shortest_paths(self.local, sources)
+            self.local_dists = [[b, [None if d not in trees[b][0] else int(trees[b][0][d]) for d in self.owned]]
+                                for b in sources]
+        return {
+            "ready": ready,
+            "alive": sorted(alive),
+            "addresses": [[b, *addresses[b]] for b in self.borders if b in alive and b in addresses],
+            "dead": sorted([u, v] for u, v in dead_links),
+            "dists": self.local_dists,
+        }
+
+    def encode_summary(self, entries):
+        self.summaries_sent += len(self.peers) - 1
+        return encode(Message(SHARD_SUMMARY, self.index, entries=entries))
+
+    def peer_addresses(self):
+        return [addr for i, addr in enumerate(self.peers) if i != self.index]
+
+    # ========== Peer summaries ==========
+
+    def apply(self, msg, now):
+        """Store a peer's SHARD_SUMMARY.
+
+        Returns (changed, first, revived): whether anything used for routing
+        changed, whether this is the first summary since the peer was last
+        unknown, and the switches of the peer that came back alive.
+        """
+        peer = msg.sid
+        if peer == self.index or not 0 <= peer < len(self.peers):
+            return False, False, set()
+        self.summaries_received += 1
+        self.heard[peer] = now
+        old = self.summaries.get(peer)
+        self.summaries[peer] = msg.entries
+        if old is None:
+            return True, True, set(msg.entries["alive"])
+        changed = any(old[key] != msg.entries[key] for key in ("alive", "dead", "dists"))
+        return changed, False, set(msg.entries["alive"]) - set(old["alive"])
+
+    def expire(self, now, timeout):
+        """Forget peers not heard from for timeout seconds. Returns True if any was dropped."""
+        expired = [peer for peer, heard in self.heard.items() if now - heard > timeout]
+        for peer in expired:
+            del self.heard[peer]
+            del self.summaries[peer]
+        return bool(expired)
+
+    def ready(self):
+        """True once every peer finished its initial registration."""
+        return all(self.summaries.get(i, {}).get("ready") for i in range(len(self.peers)) if i != self.index)
+
+    def peer_alive(self, sid):
+        summary = self.summaries.get(self.owner(sid))
+        return summary is not None and sid in summary["alive"]
+
+    def address(self, sid):
+        """Return the address a peer reported for its border switch sid, or None."""
+        summary = self.summaries.get(self.owner(sid))
+        if summary is None:
+            return None
+        for b, host, port in summary["addresses"]:
+            if b == sid:
+                return (host, port)
+        return None
+
+    # ========== Routes ==========
+
+    def compute_routes(self, alive, dead_links):
+        """Return (all_routes, switch_tables) for the alive switches of this shard.
+
+        The overlay is a new Graph every time, so it runs in-process: a
+        SourcePool's workers only know the graph they were forked with.
+        """
+        links = list(self.overlay_links)
+        overlay_alive = set(alive)
+        dead = set(dead_links)
+        everyone = set(alive)
+        for peer, summary in self.summaries.items():
+            everyone.update(summary["alive"])
+            dead.update((u, v) for u, v in summary["dead"])
+            rows = summary["dists"]
+            start = self.ranges[peer].start
+            for i, (b, row) in enumerate(rows):
+                overlay_alive.add(b)
+                for c, _ in rows[i + 1:]:
+                    if row[c - start] is not None:
+                        links.append((b, c, row[c - start]))
+        overlay = Graph(self.graph.n, links)
+        # A peer's links inside its shard are clique links in the overlay, already net of its dead ones
+        overlay.apply_state(overlay_alive, {lk for lk in dead if self.owner(lk[0]) == self.index
+                                            or self.owner(lk[0]) != self.owner(lk[1])})
+        trees = shortest_paths(overlay, sorted(alive))
+
+        all_routes = []
+        switch_tables = {}
+        for src in sorted(alive):
+            dists = dict(trees[src][0])
+            for peer, summary in self.summaries.items():
+                start = self.ranges[peer].start
+                reach = [(dists[b], row) for b, row in summary["dists"] if b in dists]
+                for d in summary["alive"]:
+                    best = min((db + row[d - start] for db, row in reach if row[d - start] is not None), default=None)
+                    if best is not None:
+                        dists[d] = best
+            first_hops = self.first_hops(src, dists, dead)
+            rows, table = source_rows(src, self.graph.n, everyone, dists, first_hops)
+            all_routes.extend(rows)
+            switch_tables[src] = table
+        return all_routes, switch_tables
+
+    def first_hops(self, src, dists, dead_links):
+        """Return the first hop from src to every switch in dists, as routing.dijkstra() picks it."""
+        first_hops = {src: src}
+        for d, v in sorted((d, v) for v, d in dists.items()):
+            if v == src:
+                continue
+            parent = None
+            for u, w, _ in self.graph.neighbors(v):
+                du = dists.get(u)
+                if (du is not None and du + w == d and (parent is None or du < dists[parent])
+                        and link_key(u, v) not in dead_links):
+                    parent = u  # Neighbors come by id, so the first of the closest ones wins
+            if parent is not None:
+                first_hops[v] = v if parent == src else first_hops[parent]
+        return first_hops
+
+    def stats(self):
+        return {
+            "index": self.index,
+            "shards": len(self.peers),
+            "owned": [self.owned.start, self.owned.stop - 1],
+            "borders": len(self.borders),
+            "peers_known": sorted(self.summaries),
+            "summaries_sent": self.summaries_sent,
+            "summaries_received": self.summaries_received,
+        }
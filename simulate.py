@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""Run every switch of a topology inside one process.
+
+Usage: python simulate.py <config file> <Controller hostname> <Controller Port> [-f <Switch ID> <Neighbor ID>]... [-x <Switch ID>]... [--binary] [--log sync|buffered] [--detect scan|deadline] [--heartbeat] [--stats <file>] [--shards <port>,<port>,...] [--dataplane] [--traffic <packets/s>] [--ecmp] [--netem <spec>] [--rtt]
+
+Each switch of the Config/graph_*.txt file gets its own UDP socket, its own
+switch#.log and the same Switch state machine as switch.py, but all of them
+share one asyncio event loop instead of running one interpreter with two
+threads per switch. -f <Switch ID> <Neighbor ID> behaves like
+switch.py <Switch ID> ... -f <Neighbor ID> and can be repeated for other
+switches; like switch.py, a switch takes one failed neighbor. -x <Switch ID>
+leaves that switch out, e.g. to run it as its own switch.py process that
+can be killed. --stats writes the summed counters of all hosted switches.
+With --shards every switch registers with the controller shard that owns it
+instead of the one at <Controller Port> (see shard.py). --dataplane,
+--traffic <packets/s>, --ecmp, --netem <spec> and --rtt are switch.py's,
+for every hosted switch; the rate is per switch.
+"""
+
+import asyncio
+import socket
+import sys
+
+from controller import read_config
+from dataplane import ForwardingTable, combined_stats
+from logwriter import install_stats_dump
+from netem import NetEm, combined_stats as netem_stats, parse_spec
+from protocol import TrafficStats
+from shard import parse_peers, partition
+from switch import RECV_BUFFER, Switch, SwitchProtocol, use_log_writer
+from timers import DetectionStats, TickStats
+
+
+async def start_switches(switches):
+    """Open one endpoint per switch on the running loop. Returns the transports."""
+    loop = asyncio.get_running_loop()
+    transports = []
+    for switch in switches:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda switch=switch: SwitchProtocol(switch), local_addr=('0.0.0.0', 0))
+        transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        transports.append(transport)
+    return transports
+
+
+def switches_stats(switches):
+    """Return the counters of all switches added together."""
+    traffic = TrafficStats()
+    ticks = TickStats()
+    detection = DetectionStats()
+    for switch in switches:
+        traffic.add(switch.traffic)
+        ticks.add(switch.tick_stats)
+        detection.add(switch.detection)
+    stats = {"switches": len(switches), "traffic": traffic.stats(),
+             "timers": {**ticks.stats(), **detection.stats()}}
+    tables = [switch.dataplane for switch in switches if switch.dataplane is not None]
+    if tables:
+        stats["dataplane"] = combined_stats(tables)
+    netems = [switch.netem for switch in switches if switch.netem is not None]
+    if netems:
+        stats["netem"] = netem_stats(netems)
+    return stats
+
+
+async def serve(switches):
+    transports = await start_switches(switches)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+def main():
+    num_args = len(sys.argv)
+    if num_args < 4:
+        print ("Usage: python simulate.py <config file> <Controller hostname> <Controller Port> [-f <Switch ID> <Neighbor ID>]... [-x <Switch ID>]... [--binary] [--log sync|buffered] [--detect scan|deadline] [--heartbeat] [--stats <file>] [--shards <port>,<port>,...] [--dataplane] [--traffic <packets/s>] [--ecmp] [--netem <spec>] [--rtt]\n")
+        sys.exit(1)
+
+    config = sys.argv[1]
+    controller_addr = (sys.argv[2], int(sys.argv[3]))
+    failed = {}
+    excluded = set()
+    features = ["delta"]
+    detect = "scan"
+    stats = None
+    shards = None
+    dataplane = False
+    traffic = 0.0
+    netem = None
+    args = sys.argv[4:]
+    while args:
+        opt = args.pop(0)
+        if opt == '-f' and len(args) >= 2:
+            sid, nid = int(args.pop(0)), int(args.pop(0))
+            if sid in failed:
+                print(f"-f {sid} given twice: a switch takes one failed neighbor, as with switch.py -f")
+                sys.exit(1)
+            failed[sid] = nid
+        elif opt == '-x' and args:
+            excluded.add(int(args.pop(0)))
+        elif opt == '--binary':
+            features.append("binary")
+        elif opt == '--heartbeat':
+            features.append("heartbeat")
+        elif opt == '--log' and args:
+            use_log_writer(args.pop(0))
+        elif opt == '--detect' and args:
+            detect = args.pop(0)
+        elif opt == '--stats' and args:
+            stats = args.pop(0)
+        elif opt == '--shards' and args:
+            shards = parse_peers(args.pop(0), sys.argv[2])
+        elif opt == '--dataplane':
+            dataplane = True
+        elif opt == '--traffic' and args:
+            dataplane = True
+            traffic = float(args.pop(0))
+        elif opt == '--ecmp':
+            dataplane = True
+            features.append("ecmp")
+        elif opt == '--netem' and args:
+            netem = args.pop(0)
+        elif opt == '--rtt':
+            features.append("rtt")
+
+    try:
+        switch_cnt, _ = read_config(config)
+    except Exception as e:
+        print(f"Error read file: {e}")
+        sys.exit(1)
+
+    controller_addrs = [controller_addr] * switch_cnt
+    if shards is not None:
+        for index, addr in enumerate(shards):
+            for sid in partition(switch_cnt, len(shards), index):
+                controller_addrs[sid] = addr
+    switches = [Switch(sid, controller_addrs[sid], failed.get(sid), features, detect=detect,
+                       dataplane=ForwardingTable(sid, traffic) if dataplane else None)
+                for sid in range(switch_cnt) if sid not in excluded]
+    if netem is not None:
+        for switch in switches:
+            switch.netem = NetEm(parse_spec(netem), seed=switch.my_id)
+    if stats is not None:
+        install_stats_dump(stats, lambda: switches_stats(switches))
+    try:
+        asyncio.run(serve(switches))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
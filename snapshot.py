@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""Controller state snapshots for warm restarts.
+
+With --snapshot <file> the controller rewrites <file> on every K second
+tick where its routes or topology changed. A controller started with an
+existing snapshot of the same config skips the registration round. It
+takes the switches' addresses, features, liveness, neighbor reports, dead
+links, link costs changed at runtime and last routing tables from the
+snapshot and goes on from there.
+Anything that changed while it was down shows up in the TOPOLOGY_UPDATEs
+the switches keep sending, or as a switch timeout, and is handled like any
+other change.
+
+The file is written next to itself and renamed over, so a crash never
+leaves half a snapshot. Layout, big-endian:
+
+    header      magic, version, switch count, link count, dead link count, time
+    switches    per switch: flags, IPv4 address, port
+    reports     one bit per CSR slot of the graph (graph.targets order), set
+                if the switch reported that neighbor alive
+    dead links  (low, high) per dead link
+    tables      per switch with SW_TABLE: next hop, distance per destination
+    features    per switch: length-prefixed, space separated feature list
+    costs       count, then low, high, cost, pinned per link whose cost
+                changed since the config was read (see linkcost.py)
+
+Everything before the features is fixed-size, so a section can be found
+from the header alone.
+"""
+
+import os
+import socket
+import struct
+import time
+
+MAGIC = b"SDNS"
+VERSION = 2
+
+HEADER = struct.Struct("!4sHIIId")      # magic, version, switches, links, dead links, time
+SWITCH = struct.Struct("!B4sH")         # flags, IPv4 address, port
+LINK = struct.Struct("!II")             # low, high
+LENGTH = struct.Struct("!H")
+COUNT = struct.Struct("!I")
+COST = struct.Struct("!IIqB")           # low, high, cost, pinned
+
+SW_REGISTERED = 1       # Has an address
+SW_ALIVE = 2
+SW_REPORT = 4           # Has a neighbor report
+SW_TABLE = 8            # Has a routing table
+
+
+def write_snapshot(path, graph, addresses, features, alive, reports, dead_links, tables, costs=()):
+    """Write a snapshot of the controller state to path. Returns its size in bytes.
+
+    costs lists (low, high, cost, pinned) of the links whose cost changed.
+    """
+    n = graph.n
+    parts = [HEADER.pack(MAGIC, VERSION, n, graph.m, len(dead_links), time.time())]
+    for sid in range(n):
+        flags = 0
+        ip, port = b"\0\0\0\0", 0
+        if sid in addresses:
+            flags |= SW_REGISTERED
+            ip, port = socket.inet_aton(addresses[sid][0]), addresses[sid][1]
+        if sid in alive:
+            flags |= SW_ALIVE
+        if sid in reports:
+            flags |= SW_REPORT
+        if sid in tables:
+            flags |= SW_TABLE
+        parts.append(SWITCH.pack(flags, ip, port))
+
+    bits = bytearray((len(graph.targets) + 7) // 8)
+    for u, report in reports.items():
+        for i in range(graph.offsets[u], graph.offsets[u + 1]):
+            if report.get(graph.targets[i], True):
+                bits[i >> 3] |= 1 << (i & 7)
+    parts.append(bytes(bits))
+    parts.extend(LINK.pack(u, v) for u, v in sorted(dead_links))
+    for sid in sorted(tables):
+        flat = [x for _, nh, dist in tables[sid] for x in (nh, dist)]
+        parts.append(struct.pack(f"!{len(flat)}i", *flat))
+    for sid in range(n):
+        data = " ".join(sorted(features.get(sid, ()))).encode()
+        parts.append(LENGTH.pack(len(data)) + data)
+    costs = sorted(costs)
+    parts.append(COUNT.pack(len(costs)))
+    parts.extend(COST.pack(u, v, w, 1 if pinned else 0) for u, v, w, pinned in costs)
+
+    data = b"".join(parts)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+def read_snapshot(path, graph):
+    """Read a snapshot written by write_snapshot() for graph.
+
+    Returns a dict with the arguments write_snapshot() took, plus "time", or None if
+    there is no snapshot or it belongs to another topology.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, n, m, dead_cnt, saved = HEADER.unpack_from(data)
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION or n != graph.n or m != graph.m:
+        return None
+
+    pos = HEADER.size
+    addresses, alive, with_report, with_table = {}, set(), [], []
+    for sid, (flags, ip, port) in enumerate(SWITCH.iter_unpack(data[pos:pos + n * SWITCH.size])):
+        if flags & SW_REGISTERED:
+            addresses[sid] = (socket.inet_ntoa(ip), port)
+        if flags & SW_ALIVE:
+            alive.add(sid)
+        if flags & SW_REPORT:
+            with_report.append(sid)
+        if flags & SW_TABLE:
+            with_table.append(sid)
+    pos += n * SWITCH.size
+
+    bits = data[pos:pos + (len(graph.targets) + 7) // 8]
+    pos += len(bits)
+    reports = {}
+    for u in with_report:
+        reports[u] = {graph.targets[i]: bool(bits[i >> 3] >> (i & 7) & 1)
+                      for i in range(graph.offsets[u], graph.offsets[u + 1])}
+    dead_links = set(LINK.iter_unpack(data[pos:pos + dead_cnt * LINK.size]))
+    pos += dead_cnt * LINK.size
+
+    tables = {}
+    for sid in with_table:
+        flat = struct.unpack_from(f"!{2 * n}i", data, pos)
+        tables[sid] = list(zip(range(n), flat[0::2], flat[1::2]))
+        pos += 4 * 2 * n
+
+    features = {}
+    for sid in range(n):
+        (length,) = LENGTH.unpack_from(data, pos)
+        pos += LENGTH.size
+        if sid in addresses:
+            features[sid] = set(data[pos:pos + length].decode().split())
+        pos += length
+
+    (count,) = COUNT.unpack_from(data, pos)
+    pos += COUNT.size
+    costs = [(u, v, w, pinned == 1) for u, v, w, pinned in COST.iter_unpack(data[pos:pos + count * COST.size])]
+
+    return {
+        "addresses": addresses,
+        "features": features,
+        "alive": alive,
+        "reports": reports,
+        "dead_links": dead_links,
+        "tables": tables,
+        "costs": costs,
+        "time": saved,
+    }
@@ -8,14 +8,29 @@ Last Modified Date: December 9th, 2021
 
 import sys
 import socket
+import asyncio
 import threading
 import time
 from datetime import date, datetime
 
+from chunking import CHUNK_SIZE, MAGIC as CHUNK_MAGIC, Chunker, Reassembler
+from dataplane import MAGIC, PACKET, TRAFFIC_INTERVAL, ForwardingTable, is_packet
+from logwriter import LogWriter, install_exit_handler, install_stats_dump
+from netem import NetEm, parse_spec
+from protocol import (Message, decode, encode, REGISTER_REQUEST, REGISTER_RESPONSE,
+                      TOPOLOGY_UPDATE, ROUTE_UPDATE, ROUTE_DELTA, KEEP_ALIVE, ROUTE_RESYNC, HEARTBEAT, ROUTE_ECMP,
+                      PROBE, PROBE_REPLY, TrafficStats)
+from timers import DeadlineScheduler, DetectionStats, TickStats
+
 # Please do not modify the name of the log file, otherwise you will lose points because the grader won't be able to find your log file
 LOG_FILE = "switch#.log" # The log file for switches are switch#.log, where # is the id of that switch (i.e. switch0.log, switch1.log). The code for replacing # with a real number has been given to you in the main function.
 K = 2
 TIMEOUT = 3 * K
+TOPOLOGY_REFRESH = 10 * K  # With --heartbeat, longest time between two full TOPOLOGY_UPDATEs
+HEARTBEAT_INTERVAL = 5 * K  # With --heartbeat, longest silence towards the controller while the report is unchanged
+RECV_BUFFER = 1 << 20       # Socket receive buffer, room for the chunks of a large ROUTE_UPDATE
+RTT_ALPHA = 0.125           # With --rtt, weight of a new sample in the smoothed RTT, as in TCP
+LOG_WRITER = None   # Set to a logwriter.LogWriter by --log buffered
 
 # Those are logging functions to help you follow the correct logging standard
 
@@ -24,22 +39,22 @@ TIMEOUT = 3 * K
 # Timestamp
 # Register Request Sent
 
-def register_request_sent():
+def register_request_sent(log_file=None):
     log = []
     log.append(str(datetime.time(datetime.now())) + "\n")
     log.append(f"Register Request Sent\n")
-    write_to_log(log)
+    write_to_log(log, log_file)
 
 # "Register Response" Format is below:
 #
 # Timestamp
 # Register Response Received
 
-def register_response_received():
+def register_response_received(log_file=None):
     log = []
     log.append(str(datetime.time(datetime.now())) + "\n")
     log.append(f"Register Response received\n")
-    write_to_log(log) 
+    write_to_log(log, log_file) 
 
 # For the parameter "routing_table", it should be a list of lists in the form of [[...], [...], ...]. 
 # Within each list in the outermost list, the first element is <Switch ID>. The second is <Dest ID>, and the third is <Next Hop>.
@@ -55,94 +70,399 @@ def register_response_received():
 # You should also include all of the Self routes in your routing_table argument -- e.g.,  Switch (ID = 4) should include the following entry: 		
 # 4,4:4
 
-def routing_table_update(routing_table):
+def routing_table_update(routing_table, log_file=None):
     log = []
     log.append(str(datetime.time(datetime.now())) + "\n")
     log.append("Routing Update\n")
     for row in routing_table:
         log.append(f"{row[0]},{row[1]}:{row[2]}\n")
     log.append("Routing Complete\n")
-    write_to_log(log)
+    write_to_log(log, log_file)
 
 # "Unresponsive/Dead Neighbor Detected" Format is below:
 #
 # Timestamp
 # Neighbor Dead <Neighbor ID>
 
-def neighbor_dead(switch_id):
+def neighbor_dead(switch_id, log_file=None):
     log = []
     log.append(str(datetime.time(datetime.now())) + "\n")
     log.append(f"Neighbor Dead {switch_id}\n")
-    write_to_log(log) 
+    write_to_log(log, log_file) 
 
 # "Unresponsive/Dead Neighbor comes back online" Format is below:
 #
 # Timestamp
 # Neighbor Alive <Neighbor ID>
 
-def neighbor_alive(switch_id):
+def neighbor_alive(switch_id, log_file=None):
     log = []
     log.append(str(datetime.time(datetime.now())) + "\n")
     log.append(f"Neighbor Alive {switch_id}\n")
-    write_to_log(log) 
-
-def write_to_log(log):
-    with open(LOG_FILE, 'a+') as log_file:
+    write_to_log(log, log_file) 
+
+def write_to_log(log, log_file=None):
+    # log_file lets several switches share one process, each with its own switch#.log
+    if LOG_WRITER is not None:
+        LOG_WRITER.write(log_file or LOG_FILE, "\n\n" + "".join(log))
+        return
+    with open(log_file or LOG_FILE, 'a+') as log_file:
         log_file.write("\n\n")
         # Write to log
         log_file.writelines(log)
 
-def main():
-
-    global LOG_FILE
-
-    #Check for number of arguments and exit if host/port not provided
-    num_args = len(sys.argv)
-    if num_args < 4:
-        print ("switch.py <Id_self> <Controller hostname> <Controller Port>\n")
-        sys.exit(1)
+class Switch:
+    """Switch state and message handling, independent of how it is driven.
+
+    The runtime calls register() once, feeds every decoded datagram to
+    handle() and, once the switch is registered, calls wakeup() every K
+    seconds with tick set and in between whenever next_deadline() is due.
+    Outgoing datagrams go through sendto(data, addr), which is a socket's or
+    an asyncio transport's sendto.
+    """
+
+    def __init__(self, my_id, controller_addr, failed_neighbor=None, features=("delta",), sendto=None,
+                 detect="scan", dataplane=None):
+        self.my_id = my_id
+        self.log_file = 'switch' + str(my_id) + ".log"
+        self.controller_addr = controller_addr
+        self.failed_neighbor = failed_neighbor
+        self.features = list(features)
+        self.sendto = sendto
+        self.registered = False
+        self.nb_addrs = {}
+        self.nb_alive = {}
+        self.nb_last_ka = {}
+        self.routes = {}            # Local routing table: dest -> next hop
+        self.groups = {}            # With the "ecmp" feature: dest -> every equal-cost next hop
+        self.route_seq = None       # Sequence number of the last table or delta applied
+        self.binary = False         # Set once the controller answered in the binary format
+        # With detect="deadline" neighbor timeouts fire from a DeadlineScheduler instead of the K second scan
+        self.timers = DeadlineScheduler() if detect == "deadline" else None
+        self.tick_stats = TickStats()
+        self.detection = self.timers.detection if self.timers is not None else DetectionStats()
+        self.traffic = TrafficStats()
+        # With the "heartbeat" feature an unchanged neighbor report is replaced by a HEARTBEAT
+        self.heartbeat = "heartbeat" in self.features
+        self.reported = None        # Entries of the last TOPOLOGY_UPDATE sent
+        self.reported_at = 0.0
+        self.sent_at = 0.0          # Time of the last TOPOLOGY_UPDATE or HEARTBEAT sent
+        # With the "rtt" feature neighbors are probed and their smoothed RTT reported (see linkcost.py)
+        self.probing = "rtt" in self.features
+        self.rtt = {}               # Neighbor id -> smoothed RTT in seconds
+        self.probes_sent = 0
+        self.probe_replies = 0
+        # With --dataplane a ForwardingTable compiled from self.routes forwards data packets
+        self.dataplane = dataplane
+        # Messages larger than a datagram travel in chunks (see chunking.py)
+        self.chunker = Chunker()
+        self.reassembler = Reassembler()
+        # With --netem a NetEm impairs everything sent (see netem.py)
+        self.netem = None
+
+    # ========== Sending ==========
+
+    def send(self, msg, addr):
+        data = encode(msg, self.binary)
+        self.traffic.count_sent(msg.kind, len(data))
+        try:
+            for datagram in self.chunker.datagrams(data):
+                self.sendto(datagram, addr)
+        except (ConnectionResetError, OSError):
+            pass
 
-    my_id = int(sys.argv[1])
-    LOG_FILE = 'switch' + str(my_id) + ".log" 
+    def register(self):
+        """Send the Register Request to the controller."""
+        data = encode(Message(REGISTER_REQUEST, self.my_id, features=self.features))
+        self.traffic.count_sent(REGISTER_REQUEST, len(data))
+        self.sendto(data, self.controller_addr)
+        register_request_sent(self.log_file)
 
-    # Write your code below or elsewhere in this file
+    def topology_entries(self):
+        return [(nid, self.nb_alive[nid]) for nid in sorted(self.nb_alive.keys())]
 
-    # Parameters
-    ctrl_host = sys.argv[2]
-    ctrl_port = int(sys.argv[3])
-    failed_neighbor = None
-    if num_args >= 6 and sys.argv[4] == '-f':
-        failed_neighbor = int(sys.argv[5])
-
-    # Variables
-    controller_addr = (ctrl_host, ctrl_port)
+    def send_topo_update(self):
+        """Send topology update to controller"""
+        entries = self.topology_entries()
+        self.reported = entries
+        self.reported_at = self.sent_at = time.time()
+        if self.probing:
+            entries = [(nid, alive, round(self.rtt[nid] * 1e6) if alive and nid in self.rtt else None)
+                       for nid, alive in entries]
+        self.send(Message(TOPOLOGY_UPDATE, self.my_id, entries=entries), self.controller_addr)
+
+    def send_heartbeat_or_update(self, now):
+        """Send the full TOPOLOGY_UPDATE when the report changed, otherwise at most a HEARTBEAT.
+
+        While the report is unchanged the switch stays silent, apart from a
+        HEARTBEAT every HEARTBEAT_INTERVAL seconds that keeps it alive at the
+        controller, which gives such switches a longer timeout. The HEARTBEAT
+        lists the neighbors that are down, so it carries the whole report in
+        a few bytes. A full update still goes out every TOPOLOGY_REFRESH
+        seconds, and with it the RTTs of --rtt.
+        """
+        entries = self.topology_entries()
+        due = now + K / 2   # Ticks drift, so what falls due before the next tick goes out on this one
+        if entries != self.reported or due - self.reported_at >= TOPOLOGY_REFRESH:
+            self.send_topo_update()
+            return
+        if due - self.sent_at < HEARTBEAT_INTERVAL:
+            return
+        self.sent_at = now
+        down = [nid for nid, alive in entries if not alive]
+        self.send(Message(HEARTBEAT, self.my_id, entries=down), self.controller_addr)
+
+    def peer_of(self, addr):
+        """Name the peer at addr for --netem rules: "controller", a neighbor id or None."""
+        if addr == self.controller_addr:
+            return "controller"
+        for nid, nb_addr in self.nb_addrs.items():
+            if nb_addr == addr:
+                return nid
+        return None
+
+    def use_sendto(self, sendto, loop=None):
+        """Send through sendto, behind the NetEm if there is one. Returns what to send with."""
+        if self.netem is not None:
+            sendto = self.netem.wrap(sendto, self.peer_of)
+            if loop is not None:
+                self.netem.start_loop(loop)
+            else:
+                self.netem.start_thread()
+        self.sendto = sendto
+        return sendto
+
+    # ========== Receiving ==========
+
+    def handle(self, msg, addr, size=0):
+        """Handle one decoded message from the controller or a neighbor. size is the datagram length."""
+        self.traffic.count_received(msg, size)
+        if msg is None:
+            return
+        if not self.registered:
+            # Wait for Register Response
+            if msg.kind == REGISTER_RESPONSE:
+                self.apply_register_response(msg)
+                self.registered = True
+            return
+
+        if msg.kind == ROUTE_UPDATE:
+            self.apply_route_update(msg)
+
+        elif msg.kind == ROUTE_DELTA:
+            self.apply_route_delta(msg)
+
+        elif msg.kind == ROUTE_ECMP:
+            self.groups = dict(msg.entries)
+            self.compile_routes()
+
+        elif msg.kind == REGISTER_RESPONSE:
+            self.apply_register_response(msg)
+
+        elif msg.kind == KEEP_ALIVE:
+            sender_id = msg.sid
+            if self.failed_neighbor is not None and sender_id == self.failed_neighbor:
+                return
+            if sender_id in self.nb_alive:
+                revived = not self.nb_alive[sender_id]
+                self.nb_alive[sender_id] = True     # Before heard_from(), which only schedules alive neighbors
+                self.heard_from(sender_id, time.time())
+                moved = self.nb_addrs.get(sender_id) != addr
+                self.nb_addrs[sender_id] = addr  # update address
+                if moved:
+                    self.compile_routes()
+                if revived: # Neighbor came back alive
+                    neighbor_alive(sender_id, self.log_file)
+                    self.send_topo_update()
+
+        elif msg.kind == PROBE:
+            if msg.sid in self.nb_alive and msg.sid != self.failed_neighbor:
+                self.send(Message(PROBE_REPLY, self.my_id, entries=msg.entries), addr)
+
+        elif msg.kind == PROBE_REPLY:
+            if msg.sid in self.nb_alive and msg.entries:
+                self.probe_replies += 1
+                sample = time.monotonic() - msg.entries[0] / 1e6
+                srtt = self.rtt.get(msg.sid)
+                self.rtt[msg.sid] = sample if srtt is None else srtt + RTT_ALPHA * (sample - srtt)
+
+    def apply_register_response(self, msg):
+        """Reset neighbor state from a REGISTER_RESPONSE."""
+        register_response_received(self.log_file)
+        self.binary = msg.binary
+        self.nb_addrs.clear()
+        self.nb_alive.clear()
+        self.nb_last_ka.clear()
+        self.groups = {}
+        self.reported = None
+        self.rtt.clear()
+        if self.timers is not None:
+            self.timers = DeadlineScheduler()
+        now = time.time()
+        for nid, is_alive_flag, addr in msg.entries:
+            if is_alive_flag and addr is not None:
+                self.nb_addrs[nid] = addr
+                self.nb_alive[nid] = True
+            else:
+                self.nb_addrs[nid] = None
+                self.nb_alive[nid] = False
+            self.heard_from(nid, now)
+        self.compile_routes()
+
+    def log_routes(self):
+        """Log the locally held routing table."""
+        routing_table_update([[self.my_id, dest, self.routes[dest]] for dest in sorted(self.routes)], self.log_file)
+
+    def apply_route_update(self, msg):
+        """Replace the local table with a full ROUTE_UPDATE."""
+        self.routes.clear()
+        for dest, nh, _ in msg.entries:
+            self.routes[dest] = nh
+        self.route_seq = msg.seq
+        self.compile_routes()
+        self.log_routes()
+
+    def apply_route_delta(self, msg):
+        """Apply a ROUTE_DELTA, or ask for the full table if one was missed."""
+        if self.route_seq is not None and msg.seq <= self.route_seq:
+            return  # Duplicate or reordered delta already covered
+        if self.route_seq is None or msg.seq != self.route_seq + 1:
+            self.send(Message(ROUTE_RESYNC, self.my_id), self.controller_addr)
+            return
+        for dest, nh, _ in msg.entries:
+            self.routes[dest] = nh
+        self.route_seq = msg.seq
+        self.compile_routes()
+        self.log_routes()
+
+    def compile_routes(self):
+        """Rebuild the data plane's forwarding table from the routes and neighbor addresses."""
+        if self.dataplane is not None:
+            self.dataplane.compile(self.routes, self.nb_addrs, self.groups)
+
+    # ========== Periodic ==========
+
+    def heard_from(self, nid, now):
+        """Record a KEEP_ALIVE from a neighbor and push back its timeout."""
+        self.nb_last_ka[nid] = now
+        if self.timers is not None and self.nb_alive.get(nid):
+            self.timers.schedule(nid, now + TIMEOUT)
+
+    def next_deadline(self):
+        """Return when the next neighbor timeout expires, or None when scanning."""
+        if self.timers is None:
+            return None
+        return self.timers.next_deadline()
+
+    def expire_timers(self):
+        """Declare dead every neighbor whose timeout expired and report it right away."""
+        if self.timers is None:
+            return
+        changed = False
+        for nid in self.timers.pop_expired(time.time()):
+            if self.nb_alive.get(nid):
+                self.nb_alive[nid] = False
+                neighbor_dead(nid, self.log_file)
+                changed = True
+        if changed:
+            self.send_topo_update()
+
+    def wakeup(self, tick):
+        """Run one wakeup of the periodic loop: expired timeouts, then tick() if tick is set.
+
+        tick_stats counts the wakeup once, whichever of the two it ran.
+        """
+        with self.tick_stats:
+            self.expire_timers()
+            if tick:
+                self.tick()
+
+    def tick(self):
+        """Detect dead neighbors, send KEEP_ALIVEs and the topology update."""
+        now = time.time()
+
+        # Check for dead neighbors
+        if self.timers is None:
+            for nid in list(self.nb_alive.keys()):
+                if self.nb_alive[nid]:
+                    late = now - self.nb_last_ka.get(nid, 0) - TIMEOUT
+                    if late > 0:
+                        self.detection.record(late)
+                        self.nb_alive[nid] = False
+                        neighbor_dead(nid, self.log_file)
+
+        # Send KEEP_ALIVE, and with --rtt a PROBE
+        keep_alive = Message(KEEP_ALIVE, self.my_id)
+        probe = Message(PROBE, self.my_id, entries=[int(time.monotonic() * 1e6)]) if self.probing else None
+        for nid in self.nb_alive:
+            if self.nb_alive[nid]:
+                if self.failed_neighbor is not None and nid == self.failed_neighbor:
+                    continue
+                if self.nb_addrs.get(nid) is not None:
+                    self.send(keep_alive, self.nb_addrs[nid])
+                    if probe is not None:
+                        self.send(probe, self.nb_addrs[nid])
+                        self.probes_sent += 1
+        # Send Update
+        if self.heartbeat:
+            self.send_heartbeat_or_update(now)
+        else:
+            self.send_topo_update()
+
+    def timer_stats(self):
+        """Return failure detection and per-tick CPU metrics."""
+        stats = {**self.tick_stats.stats(), **self.detection.stats()}
+        if self.timers is not None:
+            stats["tracked"] = len(self.timers)
+        return stats
+
+    def stats(self):
+        """Return every counter the switch keeps, for --stats."""
+        stats = {"traffic": self.traffic.stats(), "timers": self.timer_stats()}
+        if self.dataplane is not None:
+            stats["dataplane"] = self.dataplane.stats()
+        if self.chunker.messages_split or self.reassembler.chunks_received:
+            stats["chunks"] = {**self.chunker.stats(), **self.reassembler.stats()}
+        if self.netem is not None:
+            stats["netem"] = self.netem.stats()
+        if self.probing:
+            stats["rtt"] = {
+                "probes_sent": self.probes_sent,
+                "replies": self.probe_replies,
+                "rtt_ms": {str(nid): rtt * 1000 for nid, rtt in sorted(self.rtt.items())},
+            }
+        return stats
+
+
+# ========== Runtimes ==========
+
+def run_threads(switch):
+    """Drive the switch with a blocking receiver thread and a periodic thread."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
     sock.bind(('', 0))
-    sock.sendto(f"{my_id} Register_Request".encode(), controller_addr)
-    register_request_sent()
-    nb_addrs = {} 
-    nb_alive = {}
-    nb_last_ka = {}  
+    sendto = switch.use_sendto(sock.sendto)
     lock = threading.Lock()
+    switch.register()
 
-    # ========== Functions ==========
-
-    def send_topo_update():
-        """Send topology update to controller"""
-        msg_lines = ["TOPOLOGY_UPDATE", str(my_id)]
-        for nid in sorted(nb_alive.keys()):
-            msg_lines.append(f"{nid} {nb_alive[nid]}")
+    # Wait for Register Response
+    while not switch.registered:
         try:
-            sock.sendto("\n".join(msg_lines).encode(), controller_addr)
-        except (ConnectionResetError, OSError):
-            pass
+            data, addr = sock.recvfrom(65535)
+        except ConnectionResetError:
+            continue
+        data = switch.reassembler.add(data, addr)
+        if data is not None:
+            switch.handle(decode(data), addr, len(data))
 
     def receiver():
         """Thread function to receive messages from controller and neighbors"""
         sock.settimeout(1.0)
+        buf = bytearray(65535)
+        packet = memoryview(buf)[:PACKET.size]
         while True:
             try:
-                data, addr = sock.recvfrom(4096)
+                nbytes, addr = sock.recvfrom_into(buf)
             except socket.timeout:
                 continue
             except ConnectionResetError:
@@ -150,109 +470,50 @@ def main():
             except OSError:
                 break
 
-            lines = data.decode().strip().split('\n')
-
+            if switch.dataplane is not None and nbytes == PACKET.size and buf[0] == MAGIC:
+                # Data packets are forwarded straight from buf, without decoding or the lock
+                switch.dataplane.forward(packet, sendto)
+                continue
+            data = buf[:nbytes]
+            if buf[0] == CHUNK_MAGIC:
+                data = switch.reassembler.add(bytes(data), addr)
+                if data is None:
+                    continue    # Chunk of a message still incomplete
+                nbytes = len(data)
+            msg = decode(data)
             with lock:
-                if lines[0] == "ROUTE_UPDATE":
-                    table = []
-                    for line in lines[2:]:
-                        parts = line.split()
-                        table.append([my_id, int(parts[0]), int(parts[1])])
-                    routing_table_update(table)
-
-                elif lines[0] == "REGISTER_RESPONSE":
-                    register_response_received()
-                    num_nb = int(lines[1])
-                    nb_addrs.clear()
-                    nb_alive.clear()
-                    nb_last_ka.clear()
-                    now = time.time()
-                    for i in range(num_nb):
-                        parts = lines[2 + i].split()
-                        nid = int(parts[0])
-                        is_alive_flag = parts[1] == "True"
-                        if is_alive_flag and len(parts) >= 4:
-                            nb_addrs[nid] = (parts[2], int(parts[3]))
-                            nb_alive[nid] = True
-                        else:
-                            nb_addrs[nid] = None
-                            nb_alive[nid] = False
-                        nb_last_ka[nid] = now
-
-                else:
-                    parts = lines[0].split()
-                    if len(parts) >= 2 and parts[1] == "KEEP_ALIVE":
-                        sender_id = int(parts[0])
-                        if failed_neighbor is not None and sender_id == failed_neighbor:
-                            continue
-                        if sender_id in nb_alive:
-                            nb_last_ka[sender_id] = time.time()
-                            nb_addrs[sender_id] = addr  # update address
-                            if not nb_alive[sender_id]: # Neighbor came back alive
-                                nb_alive[sender_id] = True
-                                neighbor_alive(sender_id)
-                                send_topo_update()
+                switch.handle(msg, addr, nbytes)
+
+    def traffic():
+        """Thread function to send the generated data packets of --traffic"""
+        last = time.time()
+        while True:
+            time.sleep(TRAFFIC_INTERVAL)
+            now = time.time()
+            switch.dataplane.generate(now - last, sendto)
+            last = now
 
     def periodic():
         """Thread function to perform periodic tasks such as sending keep-alives and topology updates"""
+        next_tick = time.time() + K
         while True:
-            time.sleep(K)
             with lock:
-                now = time.time()
-                topo_changed = False
-
-                # Check for dead neighbors
-                for nid in list(nb_alive.keys()):
-                    if nb_alive[nid]:
-                        if now - nb_last_ka.get(nid, 0) > TIMEOUT:
-                            nb_alive[nid] = False
-                            neighbor_dead(nid)
-                            topo_changed = True
-
-                # Send KEEP_ALIVE
-                for nid in nb_alive:
-                    if nb_alive[nid]:
-                        if failed_neighbor is not None and nid == failed_neighbor:
-                            continue
-                        if nb_addrs.get(nid) is not None:
-                            try:
-                                sock.sendto(f"{my_id} KEEP_ALIVE".encode(), nb_addrs[nid])
-                            except (ConnectionResetError, OSError):
-                                pass
-                # Send Update
-                send_topo_update()
-
-    # ============================================
+                deadline = switch.next_deadline()
+            wake = next_tick if deadline is None else min(next_tick, deadline)
+            time.sleep(max(0.0, wake - time.time()))
+            with lock:
+                tick = time.time() >= next_tick
+                switch.wakeup(tick)
+                if tick:
+                    next_tick += K
 
-    # Wait for Register Response
-    while True:
-        try:
-            data, addr = sock.recvfrom(4096)
-        except ConnectionResetError:
-            continue
-        lines = data.decode().strip().split('\n')
-        if lines[0] == "REGISTER_RESPONSE":
-            register_response_received()
-            num_nb = int(lines[1])
-            now = time.time()
-            for i in range(num_nb):
-                parts = lines[2 + i].split()
-                nid = int(parts[0])
-                is_alive_flag = parts[1] == "True"
-                if is_alive_flag and len(parts) >= 4:
-                    nb_addrs[nid] = (parts[2], int(parts[3]))
-                    nb_alive[nid] = True
-                else:
-                    nb_addrs[nid] = None
-                    nb_alive[nid] = False
-                nb_last_ka[nid] = now
-            break
-    
     # Start Threads
     recv_thread = threading.Thread(target=receiver, daemon=True)
     per_thread = threading.Thread(target=periodic, daemon=True)
     recv_thread.start()
     per_thread.start()
+    if switch.dataplane is not None and switch.dataplane.rate > 0:
+        threading.Thread(target=traffic, daemon=True).start()
 
     # Keep alive
     try:
@@ -261,5 +522,163 @@ def main():
     except KeyboardInterrupt:
         pass
 
+
+class SwitchProtocol(asyncio.DatagramProtocol):
+    """asyncio endpoint that feeds datagrams to a Switch.
+
+    Registration is sent as soon as the endpoint is up and tick() runs from
+    a loop timer every K seconds after the Register Response arrived.
+    """
+
+    def __init__(self, switch):
+        self.switch = switch
+        self.loop = None
+        self.ticking = False
+        self.next_tick = None
+        self.last_traffic = None
+
+    def connection_made(self, transport):
+        self.loop = asyncio.get_running_loop()
+        self.switch.use_sendto(transport.sendto, self.loop)
+        self.switch.register()
+
+    def datagram_received(self, data, addr):
+        dataplane = self.switch.dataplane
+        if dataplane is not None and is_packet(data):
+            dataplane.forward_bytes(data, self.switch.sendto)
+            return
+        data = self.switch.reassembler.add(data, addr)
+        if data is None:
+            return
+        self.switch.handle(decode(data), addr, len(data))
+        if self.switch.registered and not self.ticking:
+            self.ticking = True
+            self.next_tick = time.time() + K
+            self.schedule()
+            if dataplane is not None and dataplane.rate > 0:
+                self.last_traffic = time.time()
+                self.loop.call_later(TRAFFIC_INTERVAL, self.generate)
+
+    def error_received(self, exc):
+        pass    # ICMP errors for neighbors that went away
+
+    def generate(self):
+        now = time.time()
+        self.switch.dataplane.generate(now - self.last_traffic, self.switch.sendto)
+        self.last_traffic = now
+        self.loop.call_later(TRAFFIC_INTERVAL, self.generate)
+
+    def schedule(self):
+        """Wake up at the next K tick or neighbor timeout, whichever comes first."""
+        deadline = self.switch.next_deadline()
+        wake = self.next_tick if deadline is None else min(self.next_tick, deadline)
+        self.loop.call_later(max(0.0, wake - time.time()), self.tick)
+
+    def tick(self):
+        tick = time.time() >= self.next_tick
+        self.switch.wakeup(tick)
+        if tick:
+            self.next_tick += K
+        self.schedule()
+
+
+async def serve_asyncio(switch):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: SwitchProtocol(switch), local_addr=('0.0.0.0', 0))
+    transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+def run_asyncio(switch):
+    """Drive the switch from an asyncio event loop."""
+    try:
+        asyncio.run(serve_asyncio(switch))
+    except KeyboardInterrupt:
+        pass
+
+
+def use_log_writer(kind):
+    """Switch write_to_log() to the buffered backend for --log buffered."""
+    global LOG_WRITER
+    if kind == "buffered" and LOG_WRITER is None:
+        LOG_WRITER = LogWriter()
+        install_exit_handler()
+
+
+def main():
+
+    global LOG_FILE
+
+    #Check for number of arguments and exit if host/port not provided
+    num_args = len(sys.argv)
+    if num_args < 4:
+        print ("switch.py <Id_self> <Controller hostname> <Controller Port> [-f <Neighbor ID>] [--binary] [--mode threads|asyncio] [--log sync|buffered] [--detect scan|deadline] [--heartbeat] [--stats <file>] [--dataplane] [--traffic <packets/s>] [--ecmp] [--chunk-size <bytes>] [--netem <spec>] [--rtt]\n")
+        sys.exit(1)
+
+    my_id = int(sys.argv[1])
+    LOG_FILE = 'switch' + str(my_id) + ".log" 
+
+    # Write your code below or elsewhere in this file
+
+    # Parameters
+    ctrl_host = sys.argv[2]
+    ctrl_port = int(sys.argv[3])
+    failed_neighbor = None
+    features = ["delta"]
+    mode = "threads"
+    detect = "scan"
+    stats = None
+    dataplane = False
+    traffic = 0.0
+    chunk_size = CHUNK_SIZE
+    netem = None
+    args = sys.argv[4:]
+    while args:
+        opt = args.pop(0)
+        if opt == '-f' and args:
+            failed_neighbor = int(args.pop(0))
+        elif opt == '--binary':
+            features.append("binary")   # Ask the controller for the binary wire format
+        elif opt == '--heartbeat':
+            features.append("heartbeat")    # HEARTBEAT instead of unchanged TOPOLOGY_UPDATEs
+        elif opt == '--mode' and args:
+            mode = args.pop(0)
+        elif opt == '--log' and args:
+            use_log_writer(args.pop(0))
+        elif opt == '--detect' and args:
+            detect = args.pop(0)
+        elif opt == '--stats' and args:
+            stats = args.pop(0)
+        elif opt == '--dataplane':
+            dataplane = True
+        elif opt == '--traffic' and args:
+            dataplane = True
+            traffic = float(args.pop(0))
+        elif opt == '--ecmp':
+            dataplane = True
+            features.append("ecmp")     # Spread flows over every equal-cost next hop
+        elif opt == '--chunk-size' and args:
+            chunk_size = int(args.pop(0))
+        elif opt == '--netem' and args:
+            netem = parse_spec(args.pop(0))
+        elif opt == '--rtt':
+            features.append("rtt")      # Probe neighbors and report their RTT as a link metric
+
+    switch = Switch(my_id, (ctrl_host, ctrl_port), failed_neighbor, features, detect=detect,
+                    dataplane=ForwardingTable(my_id, traffic) if dataplane else None)
+    switch.chunker = Chunker(chunk_size)
+    if netem is not None:
+        switch.netem = NetEm(netem, seed=my_id)
+    if stats is not None:
+        install_stats_dump(stats, switch.stats)
+    if mode == "asyncio":
+        run_asyncio(switch)
+    else:
+        run_threads(switch)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,32 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to controller.py and switch.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_topology(seed, switches=(8, 30), costs=(1, 3), dead_switches=0.1, dead_links=0.1):
+    """Return (switch_cnt, links, alive, dead_links) of a random connected topology.
+
+    Small costs make equal-cost paths common, which is where tie-breaking
+    differences show up.
+    """
+    rng = random.Random(seed)
+    n = rng.randint(*switches)
+    links = {}
+    for v in range(1, n):
+        links[(rng.randrange(v), v)] = rng.randint(*costs)
+    for _ in range(rng.randint(0, 2 * n)):
+        u, v = rng.sample(range(n), 2)
+        links[(min(u, v), max(u, v))] = rng.randint(*costs)
+    alive = {sid for sid in range(n) if rng.random() >= dead_switches}
+    dead = {lk for lk in links if rng.random() < dead_links}
+    return n, [(u, v, w) for (u, v), w in sorted(links.items())], alive, dead
+
+
+@pytest.fixture
+def topology():
+    return make_topology
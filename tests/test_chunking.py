@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from chunking import HEADER, MAX_DATAGRAM, Chunker, Reassembler, is_chunk
+
+
+@pytest.mark.parametrize("size", [HEADER.size + 1, 100, 1472, MAX_DATAGRAM])
+@pytest.mark.parametrize("seed", range(10))
+def test_round_trip_in_any_order(seed, size):
+    rng = random.Random(seed)
+    chunker = Chunker(size)
+    reassembler = Reassembler()
+    data = rng.randbytes(rng.randint(0, 4 * size))
+    datagrams = chunker.datagrams(data)
+    assert all(len(datagram) <= size for datagram in datagrams)
+    if len(datagrams) == 1:
+        assert datagrams == [data]  # Anything that fits goes out as it is
+        assert reassembler.add(data, "a", 0.0) == data
+        return
+    rng.shuffle(datagrams)
+    results = [reassembler.add(datagram, "a", 0.0) for datagram in datagrams]
+    assert results[:-1] == [None] * (len(datagrams) - 1)
+    assert results[-1] == data
+    assert reassembler.stats()["partial"] == 0
+
+
+def test_interleaved_messages_and_senders_do_not_mix():
+    rng = random.Random(1)
+    chunker = Chunker(64)
+    reassembler = Reassembler()
+    messages = {(sender, i): rng.randbytes(rng.randint(200, 600)) for sender in ("a", "b") for i in range(3)}
+    tagged = [(key, datagram) for key, data in messages.items() for datagram in chunker.datagrams(data)]
+    rng.shuffle(tagged)
+    received = {}
+    for (sender, i), datagram in tagged:
+        data = reassembler.add(datagram, sender, 0.0)
+        if data is not None:
+            received[data] = sender
+    assert sorted(received) == sorted(messages.values())
+    assert all(received[data] == sender for (sender, _), data in messages.items())
+
+
+def test_duplicate_chunks_are_ignored():
+    chunker = Chunker(64)
+    reassembler = Reassembler()
+    data = bytes(range(256)) * 2
+    datagrams = chunker.datagrams(data)
+    assert reassembler.add(datagrams[0], "a", 0.0) is None
+    assert reassembler.add(datagrams[0], "a", 0.0) is None
+    results = [reassembler.add(datagram, "a", 0.0) for datagram in datagrams[1:]]
+    assert results[-1] == data
+    assert reassembler.stats()["duplicates"] == 1
+
+
+def test_lost_chunk_expires():
+    chunker = Chunker(64)
+    reassembler = Reassembler(timeout=2.0)
+    datagrams = chunker.datagrams(bytes(500))
+    for datagram in datagrams[1:]:
+        assert reassembler.add(datagram, "a", 0.0) is None
+    assert reassembler.stats()["partial"] == 1
+    reassembler.expire(2.5)
+    assert reassembler.stats()["partial"] == 0
+    assert reassembler.stats()["expired"] == 1
+    # The missing chunk arriving late no longer completes anything
+    assert reassembler.add(datagrams[0], "a", 2.5) is None
+
+
+def test_buffered_bytes_stay_bounded():
+    chunker = Chunker(64)
+    reassembler = Reassembler(max_bytes=1000, max_messages=4)
+    for i in range(20):
+        datagrams = chunker.datagrams(bytes([i]) * 400)
+        reassembler.add(datagrams[0], "a", 0.0)     # Never completed
+        assert reassembler.buffered <= 1000
+        assert reassembler.stats()["partial"] <= 4
+    assert reassembler.stats()["evicted"] > 0
+
+
+def test_non_chunks_pass_through():
+    reassembler = Reassembler()
+    for data in (b"1 KEEP_ALIVE", b"\xb5\x01\x05\x00\x00\x00\x01", b""):
+        assert not is_chunk(data)
+        assert reassembler.add(data, "a", 0.0) == data
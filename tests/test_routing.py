@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+import routing
+from graph import Graph
+from routing import RouteEngine, compute_routes, dijkstra, matrix_shortest_paths, source_pool, source_rows
+
+
+def baseline_routes(graph, alive, dead_links):
+    """Rows and tables of one plain dijkstra() per alive switch, what every backend must reproduce."""
+    graph.apply_state(alive, dead_links)
+    rows, tables = [], {}
+    for src in sorted(alive):
+        dists, _, first_hops = dijkstra(graph, src)
+        src_rows, table = source_rows(src, graph.n, alive, dists, first_hops)
+        rows.extend(src_rows)
+        tables[src] = table
+    return rows, tables
+
+
+def random_steps(rng, switch_cnt, links, alive, dead_links, count):
+    """Yield count random changes: a switch or link going down or up, or a link cost change (u, v, cost)."""
+    keys = [(u, v) for u, v, _ in links]
+    for _ in range(count):
+        op = rng.random()
+        if op < 0.2:
+            alive.discard(rng.randrange(switch_cnt))
+        elif op < 0.4:
+            alive.add(rng.randrange(switch_cnt))
+        elif op < 0.6:
+            dead_links.add(rng.choice(keys))
+        elif op < 0.75 and dead_links:
+            dead_links.discard(rng.choice(sorted(dead_links)))
+        else:
+            u, v = rng.choice(keys)
+            yield u, v, rng.randint(1, 4)
+            continue
+        yield None
+
+
+@pytest.mark.skipif(routing.np is None, reason="the matrix backend needs NumPy")
+@pytest.mark.parametrize("seed", range(50))
+def test_matrix_matches_dijkstra(topology, seed):
+    switch_cnt, links, alive, dead_links = topology(seed)
+    graph = Graph(switch_cnt, links)
+    graph.apply_state(alive, dead_links)
+    sources = sorted(alive)
+    assert matrix_shortest_paths(graph, sources) == {src: dijkstra(graph, src) for src in sources}
+
+
+@pytest.mark.parametrize("backend", ["heapq", pytest.param("matrix", marks=pytest.mark.skipif(
+    routing.np is None, reason="the matrix backend needs NumPy"))])
+@pytest.mark.parametrize("seed", range(50))
+def test_compute_routes_matches_dijkstra(topology, monkeypatch, seed, backend):
+    monkeypatch.setattr(routing, "BACKEND", backend)
+    switch_cnt, links, alive, dead_links = topology(seed)
+    assert compute_routes(Graph(switch_cnt, links), alive, dead_links) == \
+        baseline_routes(Graph(switch_cnt, links), alive, dead_links)
+
+
+@pytest.mark.parametrize("repair_min", [0, routing.REPAIR_MIN_SWITCHES])
+@pytest.mark.parametrize("cache_entries", [0, 5000])
+@pytest.mark.parametrize("seed", range(25))
+def test_route_engine_matches_dijkstra(topology, monkeypatch, seed, cache_entries, repair_min):
+    # repair_min 0 repairs the trees of even the smallest topologies instead of rerunning them
+    monkeypatch.setattr(routing, "REPAIR_MIN_SWITCHES", repair_min)
+    switch_cnt, links, alive, dead_links = topology(seed)
+    rng = random.Random(seed)
+    engine = RouteEngine(Graph(switch_cnt, links), cache_entries=cache_entries)
+    reference = Graph(switch_cnt, links)
+    for step in range(40):
+        for change in random_steps(rng, switch_cnt, links, alive, dead_links, rng.randint(1, 3)):
+            if change is not None:
+                engine.set_cost(*change)
+                reference.set_cost(*change)
+        assert engine.compute(alive, dead_links) == baseline_routes(reference, alive, dead_links), f"step {step}"
+
+
+def test_pool_matches_dijkstra(topology, monkeypatch):
+    monkeypatch.setattr(routing, "BACKEND", "heapq")
+    monkeypatch.setattr(routing, "POOL_MIN_SOURCES", 1)
+    switch_cnt, links, alive, dead_links = topology(1, switches=(40, 60))
+    graph = Graph(switch_cnt, links)
+    pool = source_pool(graph, 2)
+    if pool is None:
+        pytest.skip("a process pool needs the fork start method")
+    try:
+        rng = random.Random(1)
+        reference = Graph(switch_cnt, links)
+        for _ in range(5):
+            for change in random_steps(rng, switch_cnt, links, alive, dead_links, 3):
+                if change is not None:
+                    graph.set_cost(*change)
+                    reference.set_cost(*change)
+            expected = baseline_routes(reference, alive, dead_links)
+            assert compute_routes(graph, alive, dead_links, pool) == expected
+            sources = sorted(alive)
+            assert pool.run(sources) == {src: dijkstra(reference, src) for src in sources}
+    finally:
+        pool.close()
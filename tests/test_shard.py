@@ -0,0 +1,35 @@
+import pytest
+
+from graph import Graph
+from protocol import decode
+from routing import compute_routes
+from shard import Shard
+
+
+def shard_tables(switch_cnt, links, shards, alive, dead_links):
+    """Run every shard of a topology, exchange one round of summaries and return their merged tables."""
+    peers = [("127.0.0.1", 9000 + i) for i in range(shards)]
+    members = [Shard(Graph(switch_cnt, links), peers, i) for i in range(shards)]
+    states = []
+    for shard in members:
+        own = {sid for sid in alive if sid in shard.owned}
+        own_dead = {lk for lk in dead_links if shard.owner(lk[0]) == shard.index or shard.owner(lk[1]) == shard.index}
+        states.append((own, own_dead))
+    summaries = []
+    for shard, (own, own_dead) in zip(members, states):
+        addresses = {sid: ("127.0.0.1", 10000 + sid) for sid in own}
+        summaries.append(decode(shard.encode_summary(shard.summary(own, own_dead, addresses, True))))
+    tables = {}
+    for shard, (own, own_dead) in zip(members, states):
+        for msg in summaries:
+            shard.apply(msg, 0.0)
+        tables.update(shard.compute_routes(own, own_dead)[1])
+    return tables
+
+
+@pytest.mark.parametrize("shards", [2, 3])
+@pytest.mark.parametrize("seed", range(100))
+def test_shards_match_single_controller(topology, seed, shards):
+    switch_cnt, links, alive, dead_links = topology(seed)
+    _, expected = compute_routes(Graph(switch_cnt, links), alive, dead_links)
+    assert shard_tables(switch_cnt, links, shards, alive, dead_links) == expected
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""Deadline scheduler for failure detection.
+
+The periodic loops of the starter code scan every switch (controller) or
+every neighbor (switch) each K seconds and compare now - last_heard against
+TIMEOUT, so a failure is noticed up to K seconds late and every tick costs
+O(N). DeadlineScheduler keeps one expiry time per key in a min-heap instead:
+the runtime sleeps until next_deadline() and pop_expired() only touches the
+keys that actually expired.
+
+Refreshing a key to a later deadline (a KEEP_ALIVE or TOPOLOGY_UPDATE
+arrived) only updates a dict. The heap entry is left where it is; when it
+reaches the top and turns out to be older than the key's current deadline
+it is pushed back with the new one, so a refresh is O(1). An earlier
+deadline, or scheduling a key again after cancel(), pushes a second entry,
+and the old one is dropped when it surfaces. Once the heap holds more than
+twice as many entries as keys it is rebuilt from the dict, so it stays
+O(keys) however keys come and go.
+
+DetectionStats records how late each timeout was noticed, by the scheduler
+or by the K second scan, so both detectors report the same metrics.
+"""
+
+import heapq
+import time
+
+
+class DeadlineScheduler:
+    """Min-heap of per-key expiry times with O(1) refresh."""
+
+    def __init__(self):
+        self.deadlines = {}     # key -> current deadline
+        self.heap = []          # (deadline, key), stale entries included until they surface
+        self.detection = DetectionStats()
+
+    def schedule(self, key, deadline):
+        """Set the deadline of key, adding it if it is not tracked yet."""
+        current = self.deadlines.get(key)
+        self.deadlines[key] = deadline
+        if current is not None and deadline >= current:
+            return      # Deadlines normally only move later, the entry catches up when it surfaces
+        heapq.heappush(self.heap, (deadline, key))
+        if len(self.heap) > 2 * len(self.deadlines) + 16:
+            self.compact()
+
+    def compact(self):
+        """Rebuild the heap with one entry per tracked key."""
+        self.heap = [(deadline, key) for key, deadline in self.deadlines.items()]
+        heapq.heapify(self.heap)
+
+    def cancel(self, key):
+        """Stop tracking key. Its heap entry is dropped when it surfaces."""
+        self.deadlines.pop(key, None)
+
+    def next_deadline(self):
+        """Return the earliest pending deadline, or None."""
+        heap = self.heap
+        while heap:
+            deadline, key = heap[0]
+            current = self.deadlines.get(key)
+            if current is None or current < deadline:
+                heapq.heappop(heap)         # Cancelled, or a stale duplicate
+            elif current > deadline:
+                heapq.heapreplace(heap, (current, key))
+            else:
+                return deadline
+        return None
+
+    def pop_expired(self, now=None):
+        """Remove and return the keys whose deadline is at or before now."""
+        if now is None:
+            now = time.time()
+        expired = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                break
+            _, key = heapq.heappop(self.heap)
+            del self.deadlines[key]
+            expired.append(key)
+            self.detection.record(now - deadline)
+        return expired
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def stats(self):
+        """Return detection metrics: timeouts fired and how late they fired."""
+        return {"tracked": len(self.deadlines), **self.detection.stats()}
+
+
+class DetectionStats:
+    """How long after their timeout expired failures were detected."""
+
+    def __init__(self):
+        self.fired = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latency):
+        self.fired += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def add(self, other):
+        """Add the counts of another DetectionStats, e.g. of a switch hosted in the same process."""
+        self.fired += other.fired
+        self.latency_total += other.latency_total
+        self.latency_max = max(self.latency_max, other.latency_max)
+
+    def stats(self):
+        return {
+            "fired": self.fired,
+            "detection_latency_avg": self.latency_total / self.fired if self.fired else 0.0,
+            "detection_latency_max": self.latency_max,
+        }
+
+
+class TickStats:
+    """CPU time spent per wakeup of the periodic loop, K second tick or deadline."""
+
+    def __init__(self):
+        self.ticks = 0
+        self.cpu_total = 0.0
+        self.cpu_max = 0.0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        cpu = time.process_time() - self._start
+        self.ticks += 1
+        self.cpu_total += cpu
+        self.cpu_max = max(self.cpu_max, cpu)
+
+    def add(self, other):
+        """Add the counts of another TickStats, e.g. of a switch hosted in the same process."""
+        self.ticks += other.ticks
+        self.cpu_total += other.cpu_total
+        self.cpu_max = max(self.cpu_max, other.cpu_max)
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "cpu_per_tick_avg": self.cpu_total / self.ticks if self.ticks else 0.0,
+            "cpu_per_tick_max": self.cpu_max,
+        }